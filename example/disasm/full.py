@@ -50,6 +50,9 @@ parser.add_argument('-a', "--try-disasm-all", action="store_true",
                     help="Try to disassemble the whole binary")
 parser.add_argument('-i', "--image", action="store_true",
                     help="Display image representation of disasm")
+parser.add_argument('-p', "--processes", default=None, type=int,
+                    help="Disassemble functions in parallel, using this "
+                    "number of worker processes")
 
 args = parser.parse_args()
 
@@ -101,37 +104,58 @@ all_funcs_blocs = {}
 done_interval = interval()
 finish = False
 
+
+def dis_funcs(mdis, addrs):
+    """Disassemble functions starting at @addrs, sequentially or using worker
+    processes. Yield (address, asm_bloc list)"""
+    if args.processes is None:
+        for ad in addrs:
+            yield ad, mdis.dis_multibloc(ad)
+    else:
+        for ad, ab in mdis.dis_multibloc_many(addrs,
+                                              processes=args.processes):
+            yield ad, ab
+
+
 # Main disasm loop
 while not finish and todo:
     while not finish and todo:
-        mdis, caller, ad = todo.pop(0)
-        if ad in done:
-            continue
-        done.add(ad)
-        ab = mdis.dis_multibloc(ad)
-
-        log.info('func ok %.16x (%d)' % (ad, len(all_funcs)))
-
-        all_funcs.add(ad)
-        all_funcs_blocs[ad] = ab
-        for b in ab:
-            for l in b.lines:
-                done_interval += interval([(l.offset, l.offset + l.l)])
-
-        if args.funcswatchdog is not None:
-            args.funcswatchdog -= 1
-        if args.recurfunctions:
+        # In parallel mode, every pending function is disassembled at once
+        if args.processes is None:
+            batch, todo = todo[:1], todo[1:]
+        else:
+            batch, todo = todo, []
+        addrs = []
+        for mdis, caller, ad in batch:
+            if ad in done:
+                continue
+            done.add(ad)
+            addrs.append(ad)
+
+        for ad, ab in dis_funcs(mdis, addrs):
+            log.info('func ok %.16x (%d)' % (ad, len(all_funcs)))
+
+            all_funcs.add(ad)
+            all_funcs_blocs[ad] = ab
             for b in ab:
-                i = b.get_subcall_instr()
-                if not i:
-                    continue
-                for d in i.getdstflow(mdis.symbol_pool):
-                    if not (isinstance(d, ExprId) and isinstance(d.name, asm_label)):
+                for l in b.lines:
+                    done_interval.add(l.offset, l.offset + l.l)
+
+            if args.funcswatchdog is not None:
+                args.funcswatchdog -= 1
+            if args.recurfunctions:
+                for b in ab:
+                    i = b.get_subcall_instr()
+                    if not i:
                         continue
-                    todo.append((mdis, i, d.name.offset))
-
-        if args.funcswatchdog is not None and args.funcswatchdog <= 0:
-            finish = True
+                    for d in i.getdstflow(mdis.symbol_pool):
+                        if not (isinstance(d, ExprId) and isinstance(d.name, asm_label)):
+                            continue
+                        todo.append((mdis, i, d.name.offset))
+
+            if args.funcswatchdog is not None and args.funcswatchdog <= 0:
+                finish = True
+                break
 
     if args.try_disasm_all:
         for a, b in done_interval.intervals:
@@ -0,0 +1,32 @@
+"""Emulate many PE samples in warm worker processes, and write each sample
+result as a JSON line"""
+import json
+import sys
+
+from miasm2.analysis.batch import run_batch
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32
+
+# Insert here user defined methods
+
+# Parse arguments
+parser = Sandbox_Win_x86_32.parser(description=__doc__)
+parser.add_argument("filenames", nargs="+", help="PE Filenames")
+parser.add_argument("-w", "--workers", type=int, default=None,
+                    help="Number of worker processes (default: CPU count, "
+                    "0: emulate in this process)")
+parser.add_argument("-t", "--timeout", type=float, default=None,
+                    help="Maximum emulation duration per sample, in seconds")
+parser.add_argument("-i", "--max-instructions", type=int, default=None,
+                    help="Maximum instructions count per sample")
+parser.add_argument("-O", "--output", default=None,
+                    help="Output file (default: standard output)")
+options = parser.parse_args()
+
+output = open(options.output, "w") if options.output else sys.stdout
+for result in run_batch(options.filenames, options,
+                        workers=options.workers,
+                        timeout=options.timeout,
+                        max_instructions=options.max_instructions,
+                        custom_methods=globals()):
+    output.write(json.dumps(result) + "\n")
+    output.flush()
@@ -0,0 +1,269 @@
+"""Batch emulation of many PE samples
+
+Emulating a sample with Sandbox_Win_x86_32 costs a whole process: the base
+DLLs are loaded and parsed, the TEB/PEB is built from the DLLs on disk, and
+every block is jitted again. A BatchWorker keeps a warm environment instead:
+the jitter, the base DLLs loaded in memory with their parsed images, and the
+library code already jitted. The environment is snapshotted once; each sample
+is loaded on top of the snapshot, run under a time and an instructions budget,
+then the snapshot is restored.
+
+run_batch spreads the samples over worker processes and iterates on their
+results. A result is a JSON serializable dictionary:
+- sample: the sample file name
+- exit: why the emulation stopped (see EXIT_*)
+- error: the error message, for EXIT_ERROR
+- api_calls: the first API calls, as [name, return address, returned value]
+- stats: emulation duration (in seconds), executed blocks and instructions,
+  distinct blocks and number of API calls
+"""
+
+import copy
+import multiprocessing
+import signal
+import time
+import types
+
+from miasm2.analysis.machine import Machine
+from miasm2.analysis.sandbox import OS_Win, Sandbox_Win_x86_32
+from miasm2.jitter.csts import BUDGET_TIME
+from miasm2.jitter.jitload import ExceptionHandle
+from miasm2.jitter.loader.pe import vm_load_pe, vm_load_pe_libs, preload_pe, \
+    libimp_pe
+from miasm2.os_dep import win_api_x86_32, win_api_x86_32_seh
+
+# Exit reasons
+# The sample returned to its caller
+EXIT_RETURN = "return"
+# The emulation was stopped by the sample (ExitProcess, ...)
+EXIT_STOPPED = "stopped"
+# Budgets exhausted
+EXIT_TIMEOUT = "timeout"
+EXIT_INSTRUCTIONS = "instructions"
+# The emulation raised an error (unhandled exception, missing API, ...)
+EXIT_ERROR = "error"
+
+
+class BatchWorker(object):
+    """Emulate PE samples one after the other, in a warm environment
+
+    The environment follows the Sandbox_Win_x86_32 @options (see its parser):
+    jitter engine, base DLLs loading, SEH and segments support.
+    """
+
+    # Address the sample returns to
+    RET_ADDR = 0x1337beef
+    # Maximum number of logged API calls
+    MAX_API_CALLS = 0x1000
+
+    def __init__(self, options, custom_methods=None):
+        """
+        @options: namespace of Sandbox_Win_x86_32 options
+        @custom_methods: (optional) {str => func} for custom API
+        implementations
+        """
+        self.options = options
+        self.machine = Machine("x86_32")
+        self.jitter = jitter = self.machine.jitter(options.jitter)
+
+        if options.usesegm:
+            jitter.ir_arch.do_stk_segm = True
+            jitter.ir_arch.do_ds_segm = True
+            jitter.ir_arch.do_str_segm = True
+            jitter.ir_arch.do_all_segm = True
+        jitter.stack_size = Sandbox_Win_x86_32.STACK_SIZE
+        jitter.stack_base = Sandbox_Win_x86_32.STACK_BASE
+        jitter.init_stack()
+
+        # Base libraries
+        self.libs = libimp_pe()
+        self.modules = []
+        if options.loadbasedll:
+            all_pe = vm_load_pe_libs(jitter.vm, OS_Win.ALL_IMP_DLL, self.libs)
+            for pe in all_pe.values():
+                preload_pe(jitter.vm, pe, self.libs)
+            # Parsed images are given to the SEH helper, which would
+            # otherwise parse them again for each sample
+            self.modules = [(name, all_pe[name])
+                            for name in OS_Win.ALL_IMP_DLL]
+
+        # Library calls handlers, logging the calls
+        methods = dict(win_api_x86_32.__dict__)
+        if custom_methods:
+            methods.update(custom_methods)
+        for name, func in methods.items():
+            if isinstance(func, types.FunctionType):
+                methods[name] = self._log_call(name, func)
+        jitter.add_lib_handler(self.libs, methods)
+        jitter.add_breakpoint(self.RET_ADDR, self._on_return)
+
+        # Per sample state
+        self.exit = None
+        self.api_calls = []
+        self.api_calls_count = 0
+
+        # Reference state, restored after each sample
+        self.base_libs = copy.deepcopy(self.libs.__dict__)
+        self.base_breakpoints = set(jitter.breakpoints_handler.callbacks)
+        jitter.snapshot()
+
+    def _log_call(self, name, func):
+        "Wrap the API handler @func to log its calls"
+        def handler(jitter):
+            self.api_calls_count += 1
+            if len(self.api_calls) >= self.MAX_API_CALLS:
+                return func(jitter)
+            ret_addr = jitter.get_stack_arg(0)
+            func(jitter)
+            self.api_calls.append([name, ret_addr, jitter.cpu.EAX])
+        return handler
+
+    def _stop(self, reason):
+        "Stop the emulation for @reason"
+        self.exit = reason
+        self.jitter.run = False
+
+    def _on_return(self, jitter):
+        self._stop(EXIT_RETURN)
+        return False
+
+    def load(self, fname):
+        """Load the sample @fname in the environment and prepare its run, as
+        Sandbox_Win_x86_32 does
+        Return the entry point"""
+        jitter = self.jitter
+        with open(fname, "rb") as fstream:
+            pe = vm_load_pe(jitter.vm, fstream.read(), fstream=fstream)
+
+        # Fresh OS state
+        winobjs = win_api_x86_32.winobjs
+        winobjs.__init__()
+        winobjs.runtime_dll = self.libs
+        winobjs.current_pe = pe
+
+        # Fix imports, and handle the new library functions
+        preload_pe(jitter.vm, pe, self.libs)
+        for f_addr in self.libs.fad2cname:
+            if f_addr not in jitter.breakpoints_handler.callbacks:
+                jitter.handle_function(f_addr)
+
+        if self.options.use_seh:
+            win_api_x86_32_seh.main_pe_name = fname
+            win_api_x86_32_seh.main_pe = pe
+            win_api_x86_32_seh.loaded_modules = self.modules
+            win_api_x86_32_seh.init_seh(jitter)
+            win_api_x86_32_seh.set_win_fs_0(jitter)
+
+        jitter.push_uint32_t(2)
+        jitter.push_uint32_t(1)
+        jitter.push_uint32_t(0)
+        jitter.push_uint32_t(self.RET_ADDR)
+
+        if self.options.address is not None:
+            return int(self.options.address, 0)
+        return pe.rva2virt(pe.Opthdr.AddressOfEntryPoint)
+
+    def reset(self):
+        "Restore the environment as it was before the sample load"
+        jitter = self.jitter
+        for addr in (set(jitter.breakpoints_handler.callbacks) -
+                     self.base_breakpoints):
+            del jitter.breakpoints_handler.callbacks[addr]
+            jitter.lib_handlers.pop(addr, None)
+        # In place, as the jitter and the OS state refer to it
+        self.libs.__dict__ = copy.deepcopy(self.base_libs)
+        jitter.restore_snapshot()
+
+    def run_sample(self, fname, timeout=None, max_instructions=None):
+        """Emulate the sample @fname and return its result (see module
+        documentation)
+        @timeout: (optional) maximum emulation duration, in seconds
+        @max_instructions: (optional) maximum number of executed instructions.
+        Budgets are enforced by the jitted code (see jitter.set_budget); the
+        clock is checked periodically, so the timeout may be slightly exceeded
+        """
+        jitter = self.jitter
+        self.exit = None
+        self.api_calls = []
+        self.api_calls_count = 0
+        result = {"sample": fname,
+                  "exit": None,
+                  "error": None,
+                  "api_calls": self.api_calls,
+                  }
+
+        start = time.time()
+        try:
+            entry_point = self.load(fname)
+            jitter.coverage_start()
+            try:
+                jitter.init_run(entry_point, max_instructions=max_instructions,
+                                timeout=timeout)
+                ret = jitter.continue_run()
+            finally:
+                jitter.coverage_stop()
+            if ret == ExceptionHandle.budgetExhausted():
+                if jitter.get_budget_exhausted() & BUDGET_TIME:
+                    self.exit = EXIT_TIMEOUT
+                else:
+                    self.exit = EXIT_INSTRUCTIONS
+            result["exit"] = self.exit if self.exit else EXIT_STOPPED
+        except Exception as error:
+            result["exit"] = EXIT_ERROR
+            result["error"] = "%s: %s" % (error.__class__.__name__, error)
+
+        coverage = jitter.vm.get_coverage()
+        result["stats"] = {
+            "duration": time.time() - start,
+            "blocks": len(coverage),
+            "block_executions": sum(count for _, count, _, _ in coverage),
+            "instructions": sum(count * instrs
+                                for _, count, instrs, _ in coverage),
+            "api_calls": self.api_calls_count,
+        }
+        self.reset()
+        return result
+
+
+# Worker of the current process, for run_batch
+_worker = None
+
+
+def _init_worker(options, custom_methods):
+    global _worker
+    # Budgets are handled by the worker, stop on the parent's request only
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker = BatchWorker(options, custom_methods)
+
+
+def _run_sample(args):
+    return _worker.run_sample(*args)
+
+
+def run_batch(fnames, options, workers=None, timeout=None,
+              max_instructions=None, custom_methods=None):
+    """Emulate the samples @fnames and iterate on their results (see module
+    documentation), in completion order
+    @options: namespace of Sandbox_Win_x86_32 options
+    @workers: (optional) number of worker processes, defaults to the number
+    of CPUs. If 0, samples are emulated in the current process, in order
+    @timeout, @max_instructions: (optional) per sample budgets (see
+    BatchWorker.run_sample)
+    @custom_methods: (optional) {str => func} for custom API implementations
+    """
+    tasks = ((fname, timeout, max_instructions) for fname in fnames)
+    if workers == 0:
+        worker = BatchWorker(options, custom_methods)
+        for task in tasks:
+            yield worker.run_sample(*task)
+        return
+
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (options, custom_methods))
+    try:
+        for result in pool.imap_unordered(_run_sample, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -155,6 +155,10 @@ class Debugguer(object):
                 except_flag = self.myjit.vm.get_exception()
                 self.myjit.vm.set_exception(except_flag ^ res.except_flag)
 
+            elif res == ExceptionHandle.budgetExhausted():
+                # The execution budget set by the caller is reached; the flag
+                # is already removed
+                pass
             else:
                 raise NotImplementedError("Unknown Except")
         else:
@@ -170,10 +174,11 @@ class Debugguer(object):
         self.myjit.jit.addr_mod = interval([(self.myjit.pc, self.myjit.pc)])
         self.myjit.jit.updt_automod_code(self.myjit.vm)
 
-        res = self.myjit.continue_run(step=True)
-        self.handle_exception(res)
-
-        self.myjit.jit.set_options(jit_maxline=50)
+        try:
+            res = self.myjit.continue_run(step=True)
+            self.handle_exception(res)
+        finally:
+            self.myjit.jit.set_options(jit_maxline=50)
         self.on_step()
 
         return res
@@ -191,6 +196,21 @@ class Debugguer(object):
         "hexdump @addr, size"
         return self.myjit.vm.get_mem(addr, size)
 
+    def set_mem(self, addr, data):
+        """Write @data @addr. The jitted code it overwrites is dropped, so
+        patched instructions (such as breakpoints set by a client) are run"""
+        vm = self.myjit.vm
+        except_flag = vm.get_exception()
+        vm.set_mem(addr, data)
+        if data:
+            written = interval([(addr, addr + len(data) - 1)])
+            modified = written & self.myjit.jit.blocs_mem_interval
+            if not modified.empty:
+                self.myjit.jit.addr_mod += modified
+                self.myjit.jit.updt_automod_code(vm)
+        # Do not report the self modifying code
+        vm.set_exception(except_flag)
+
     def watch_mem(self, addr, size=0xF):
         self.mem_watched.append((addr, size))
 
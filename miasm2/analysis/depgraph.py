@@ -1,7 +1,11 @@
 """Provide dependency graph"""
 import itertools
+import multiprocessing
+import time
 from collections import deque
 from UserDict import IterableUserDict
+from cStringIO import StringIO
+import cPickle
 
 try:
     import z3
@@ -570,69 +574,182 @@ class DependencyResult(object):
                 for depnode in self.input}
 
 
-class DependencyResultImplicit(DependencyResult):
+class SolverSession(object):
 
-    """Stand for a result of a DependencyGraph with implicit option
+    """Z3 solving context shared by several DependencyResultImplicit
 
-    Provide path constraints using the z3 solver"""
-    __slots__ = ["_ira", "_depdict", "_input_depnodes", "_graph",
-                 "_has_loop", "_solver"]
+    Path constraints are added to a single z3.Solver, in one scope per
+    history step: solutions sharing a path prefix reuse its constraints and
+    its symbolic state, and only the diverging suffix is emulated and
+    translated. Translated Z3 terms are cached across solutions.
+    """
 
-    # Z3 Solver instance
-    _solver = None
+    def __init__(self, ira, cache_size=10000):
+        """Create a SolverSession linked to @ira
+        @ira: IRAnalysis instance
+        @cache_size: (optional) size of the Expr -> Z3 term cache
+        """
+        self._ira = ira
+        self._solver = z3.Solver()
+        self._translator = Translator.to_language("z3", cache_size=cache_size)
+        self._ctx_key = None
+        # One (step key, symbols after the step) per solver scope
+        self._scopes = []
+        # Statistics of each solved path
+        self._stats = []
 
-    def emul(self, ctx=None, step=False):
-        # Init
-        ctx_init = self._ira.arch.regs.regs_init
-        if ctx is not None:
-            ctx_init.update(ctx)
-        depnodes = self.relevant_nodes
-        solver = z3.Solver()
-        symb_exec = symbexec(self._ira, ctx_init)
-        temp_label = asm_label("Temp")
-        history = self.relevant_labels[::-1]
-        history_size = len(history)
+    @property
+    def solver(self):
+        "Shared z3.Solver instance"
+        return self._solver
 
+    @property
+    def stats(self):
+        """List of dictionnaries, one per solved path, in solving order:
+        - steps: number of history steps of the path
+        - reused: number of steps shared with the previous path
+        - emul_time, translate_time, check_time, total_time: timings in
+        seconds
+        """
+        return self._stats
+
+    def _pop_scopes(self, depth):
+        "Keep only the first @depth scopes"
+        while len(self._scopes) > depth:
+            self._scopes.pop()
+            self._solver.pop()
+
+    def _get_steps(self, result):
+        """Return the list of (label, affected lines, next label) describing
+        the path of @result, from the first to the last executed block"""
+        depnodes = result.relevant_nodes
+        history = result.relevant_labels[::-1]
+        steps = []
         for hist_nb, label in enumerate(history):
-            # Build block with relevant lines only
             affected_lines = set(depnode.line_nb for depnode in depnodes
                                  if depnode.label == label)
-            irs = self._ira.blocs[label].irs
-            affects = []
+            next_label = history[hist_nb + 1] \
+                if hist_nb + 1 < len(history) else None
+            steps.append((label, tuple(sorted(affected_lines)), next_label))
+        return steps
+
+    def solve(self, result, ctx_init, step=False):
+        """Emulate the path of @result from @ctx_init and check its
+        constraints in the shared solver
+        @result: DependencyResultImplicit instance
+        @ctx_init: initial context as dictionnary
+        @step: (optional) verbose execution
+        Return a tuple (input values, satisfiability, Z3 Model or None)
+        """
+        start = time.time()
+        emul_time = translate_time = 0
+
+        # A new initial context invalidates every scope
+        ctx_key = frozenset(ctx_init.iteritems())
+        if ctx_key != self._ctx_key:
+            self._pop_scopes(0)
+            self._ctx_key = ctx_key
+
+        # Keep the scopes of the shared path prefix
+        steps = self._get_steps(result)
+        reused = 0
+        for (key, _), cur_step in itertools.izip(self._scopes, steps):
+            if key != cur_step:
+                break
+            reused += 1
+        self._pop_scopes(reused)
 
-            for line_nb in sorted(affected_lines):
-                affects.append(irs[line_nb])
+        symb_exec = symbexec(self._ira, ctx_init)
+        if self._scopes:
+            symb_exec.symbols = self._scopes[-1][1].copy()
+        temp_label = asm_label("Temp")
+
+        for key in steps[reused:]:
+            label, affected_lines, next_label = key
+            # Build block with relevant lines only
+            irs = self._ira.blocs[label].irs
+            affects = [irs[line_nb] for line_nb in affected_lines]
 
             # Emul the block and get back destination
+            emul_start = time.time()
             dst = symb_exec.emulbloc(irbloc(temp_label, affects), step=step)
+            self._solver.push()
+            self._scopes.append((key, symb_exec.symbols.copy()))
 
             # Add constraint
-            if hist_nb + 1 < history_size:
-                next_label = history[hist_nb + 1]
+            if next_label is not None:
                 expected = symb_exec.eval_expr(m2_expr.ExprId(next_label, 32))
                 constraint = m2_expr.ExprAff(dst, expected)
-                solver.add(Translator.to_language("z3").from_expr(constraint))
-
-        # Save the solver
-        self._solver = solver
+                translate_start = time.time()
+                emul_time += translate_start - emul_start
+                self._solver.add(self._translator.from_expr(constraint))
+                translate_time += time.time() - translate_start
+            else:
+                emul_time += time.time() - emul_start
+
+        check_start = time.time()
+        is_sat = self._solver.check() == z3.sat
+        model = self._solver.model() if is_sat else None
+        check_time = time.time() - check_start
+
+        self._stats.append({"steps": len(steps),
+                            "reused": reused,
+                            "emul_time": emul_time,
+                            "translate_time": translate_time,
+                            "check_time": check_time,
+                            "total_time": time.time() - start})
 
         # Return only inputs values (others could be wrongs)
-        return {depnode.element: symb_exec.symbols[depnode.element]
-                for depnode in self.input}
+        values = {depnode.element: symb_exec.symbols[depnode.element]
+                  for depnode in result.input}
+        return values, is_sat, model
+
+
+class DependencyResultImplicit(DependencyResult):
+
+    """Stand for a result of a DependencyGraph with implicit option
+
+    Provide path constraints using the z3 solver"""
+    __slots__ = ["_ira", "_depdict", "_input_depnodes", "_graph",
+                 "_has_loop", "_is_sat", "_model"]
+
+    # Satisfiability and Z3 Model of the last emulation
+    _is_sat = None
+    _model = None
+
+    def emul(self, ctx=None, step=False, session=None):
+        """Symbolic execution of relevant nodes according to the history, and
+        computation of the path constraints
+        Return the values of input nodes' elements
+        @ctx: (optional) Initial context as dictionnary
+        @step: (optional) Verbose execution
+        @session: (optional) SolverSession shared between results, to reuse
+        work done on common path prefixes
+        """
+        # Init
+        ctx_init = self._ira.arch.regs.regs_init
+        if ctx is not None:
+            ctx_init.update(ctx)
+        if session is None:
+            session = SolverSession(self._ira)
+
+        values, self._is_sat, self._model = session.solve(self, ctx_init,
+                                                          step=step)
+        return values
 
     @property
     def is_satisfiable(self):
         """Return True iff the solution path admits at least one solution
         PRE: 'emul'
         """
-        return self._solver.check().r > 0
+        return self._is_sat
 
     @property
     def constraints(self):
         """If satisfiable, return a valid solution as a Z3 Model instance"""
         if not self.is_satisfiable:
             raise ValueError("Unsatisfiable")
-        return self._solver.model()
+        return self._model
 
 
 class FollowExpr(object):
@@ -673,6 +790,60 @@ class FollowExpr(object):
                    if not(only_follow) or follow_expr.follow)
 
 
+def _dumps(obj, labels_index):
+    """Serialize @obj, replacing known asm_label instances by their index
+    @labels_index: dictionnary id(asm_label) -> int
+    """
+    def persistent_id(element):
+        "Return the index of known labels, None for other objects"
+        if isinstance(element, asm_label):
+            return labels_index.get(id(element))
+        return None
+
+    output = StringIO()
+    pickler = cPickle.Pickler(output, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(obj)
+    return output.getvalue()
+
+
+def _loads(data, labels):
+    """Unserialize @data, restoring labels from their index
+    @labels: list of asm_label instances used by _dumps
+    """
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = lambda index: labels[index]
+    return unpickler.load()
+
+
+# DependencyGraph and labels shared by the 'get_many' worker processes
+_WORKER_CONTEXT = {}
+
+
+def _get_many_init(depgraph, labels):
+    """Initialize a 'get_many' worker process
+    As workers are forked, @depgraph and its IRA are not serialized"""
+    _WORKER_CONTEXT["depgraph"] = depgraph
+    _WORKER_CONTEXT["labels"] = labels
+    _WORKER_CONTEXT["labels_index"] = dict((id(label), index)
+                                           for index, label in
+                                           enumerate(labels))
+
+
+def _get_many_worker(job):
+    """Solve a 'get_many' query in a worker process
+    @job: (query number, serialized arguments of DependencyGraph.get)
+    Return the query number and the serialized list of (final DependencyDict,
+    input DependencyNodes)
+    """
+    query_nb, data = job
+    depgraph = _WORKER_CONTEXT["depgraph"]
+    label, elements, line_nb, heads = _loads(data, _WORKER_CONTEXT["labels"])
+    results = [(result._depdict, result.input)
+               for result in depgraph.get(label, elements, line_nb, heads)]
+    return query_nb, _dumps(results, _WORKER_CONTEXT["labels_index"])
+
+
 class DependencyGraph(object):
 
     """Implementation of a dependency graph
@@ -1026,3 +1197,48 @@ class DependencyGraph(object):
         @heads: set of asm_label instances
         """
         return self.get(label, elements, len(self._get_irs(label)), heads)
+
+    def get_many(self, queries, processes=None, ordered=False, chunksize=1):
+        """Compute independent dependency queries in parallel, over a pool of
+        worker processes sharing the current IRA.
+        @queries: iterable of (label, elements, line_nb, heads) tuples, the
+        arguments of the get() method
+        @processes: (optional) number of workers, default to the cpu count
+        @ordered: (optional) if set, yield results in the @queries order;
+        otherwise, yield them as soon as their query is solved
+        @chunksize: (optional) number of queries sent at once to a worker
+        Return an iterator on (query number, DependencyResult) tuples
+
+        Workers are forked: the IRA is shipped once per worker and must not
+        be modified during the computation. Labels are exchanged by reference,
+        so every label involved must be known by the IRA (blocs or
+        symbol_pool) or by the queries.
+        """
+        queries = list(queries)
+
+        # Labels shared between the caller and the workers
+        labels = []
+        labels_index = {}
+        for label in itertools.chain(self._ira.blocs,
+                                     self._ira.symbol_pool.items,
+                                     *([query[0]] + list(query[3])
+                                       for query in queries)):
+            if id(label) not in labels_index:
+                labels_index[id(label)] = len(labels)
+                labels.append(label)
+
+        jobs = [(query_nb, _dumps(query, labels_index))
+                for query_nb, query in enumerate(queries)]
+        cls_res = DependencyResultImplicit if self._implicit else \
+            DependencyResult
+
+        pool = multiprocessing.Pool(processes, _get_many_init, (self, labels))
+        try:
+            imap = pool.imap if ordered else pool.imap_unordered
+            for query_nb, data in imap(_get_many_worker, jobs, chunksize):
+                for final_depdict, input_depnodes in _loads(data, labels):
+                    yield query_nb, cls_res(self._ira, final_depdict,
+                                            input_depnodes)
+        finally:
+            pool.terminate()
+            pool.join()
@@ -1,14 +1,38 @@
 #!/usr/bin/env python
 #-*- coding:utf-8 -*-
 
+"""GDB remote serial protocol stub on top of a Debugguer
+
+The server is event driven: a single select loop serves the client socket,
+and while the target runs, the emulation is sliced with the jitter execution
+budget (see jitter.set_budget) to poll the client between two slices. The
+jitted code thus runs at full speed until a stop, and the client can
+interrupt it at any time.
+
+Supported: acknowledgment and no-ack (QStartNoAckMode) modes, vCont, binary
+memory writes (X), software breakpoints and watchpoints (Z/z).
+"""
+
+import errno
+import logging
+import re
+import select
 import socket
 import struct
-import time
-import logging
-from StringIO import StringIO
+
 import miasm2.analysis.debugging as debugging
+from miasm2.jitter.csts import EXCEPT_ACCESS_VIOL
 from miasm2.jitter.jitload import ExceptionHandle
 
+log = logging.getLogger("gdbserver")
+hnd = logging.StreamHandler()
+hnd.setFormatter(logging.Formatter("[%(levelname)s]: %(message)s"))
+log.addHandler(hnd)
+log.setLevel(logging.WARNING)
+
+# Escaped character, in binary packets
+ESCAPED_CHAR = re.compile(r"\}(.)", re.DOTALL)
+
 
 class GdbServer(object):
 
@@ -18,271 +42,404 @@ class GdbServer(object):
     general_registers_size = {}  # RegName : Size in octet
     status = "S05"
 
-    def __init__(self, dbg, port=4455):
+    # Maximum size of a packet, advertised to the client
+    PACKET_SIZE = 0x10000
+    # Emulation duration between two polls of the client, in seconds
+    RUN_SLICE = 0.05
+    # Interruption request, in the received messages
+    INTERRUPT = "\x03"
+
+    def __init__(self, dbg, port=4455, address="localhost"):
+        """
+        @dbg: Debugguer instance
+        @port: listening port; if 0, a free port is used (see self.port)
+        @address: (optional) listening address
+        """
         server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server.bind(('localhost', port))
+        server.bind((address, port))
         server.listen(1)
+        server.setblocking(0)
         self.server = server
+        self.port = server.getsockname()[1]
         self.dbg = dbg
 
+        # Client connection
+        self.sock = None
+        self.address = None
+        self.recv_buffer = ""
+        self.send_buffer = ""
+        self.recv_queue = []
+        self.ack_mode = True
+        self.last_packet = None
+        # Close the connection once the send buffer is flushed
+        self.closing = False
+        # Accept new clients
+        self.serving = True
+        # The target is running
+        self.running = False
+
     # Communication methods
 
     def compute_checksum(self, data):
-        return chr(sum(map(ord, data)) % 256).encode("hex")
-
-    def get_messages(self):
-        all_data = ""
-        data = self.sock.recv(4096)
-        all_data += data
-        while (len(data) == 4096 or data == ""):
-            if data == "":
-                # Avoid consuming CPU
-                time.sleep(0.001)
-                continue
-            data = self.sock.recv(4096)
-            all_data += data
-
-        logging.debug("<- %r", all_data)
-        self.recv_queue += self.parse_messages(all_data)
+        return "%02x" % (sum(bytearray(data)) & 0xFF)
 
     def parse_messages(self, data):
-        buf = StringIO(data)
-
+        """Parse the received @data, and return the complete messages. An
+        incomplete packet is kept for the next call"""
+        buf = self.recv_buffer + data
         msgs = []
 
-        while (buf.tell() < buf.len):
-            token = buf.read(1)
-            if token == "+":
-                continue
-            if token == "-":
-                raise NotImplementedError("Resend packet")
+        while buf:
+            token = buf[0]
             if token == "$":
-                packet_data = ""
-                c = buf.read(1)
-                while c != "#":
-                    packet_data += c
-                    c = buf.read(1)
-                checksum = buf.read(2)
-                if checksum != self.compute_checksum(packet_data):
-                    raise ValueError("Incorrect checksum")
+                end = buf.find("#")
+                if end == -1 or len(buf) < end + 3:
+                    # Incomplete packet
+                    break
+                packet_data, checksum = buf[1:end], buf[end + 1:end + 3]
+                buf = buf[end + 3:]
+                if self.ack_mode:
+                    if checksum != self.compute_checksum(packet_data):
+                        log.warning("Incorrect checksum: %r", packet_data)
+                        self.send_buffer += "-"
+                        continue
+                    self.send_buffer += "+"
+                msgs.append(ESCAPED_CHAR.sub(
+                    lambda match: chr(ord(match.group(1)) ^ 0x20),
+                    packet_data))
+                continue
 
-                msgs.append(packet_data)
+            buf = buf[1:]
+            if token == "-" and self.last_packet is not None:
+                # Resend packet
+                self.send_buffer += self.last_packet
+            elif token == self.INTERRUPT:
+                msgs.append(self.INTERRUPT)
+            # Ignore acks, and garbage between packets
 
+        self.recv_buffer = buf
         return msgs
 
+    def send_packet(self, msg):
+        "Queue the packet @msg"
+        data = "$%s#%s" % (msg, self.compute_checksum(msg))
+        log.debug("-> %r", data)
+        self.last_packet = data
+        self.send_buffer += data
+
     def send_string(self, s):
-        self.send_queue.append("O" + s.encode("hex"))
+        "Print @s on the client console"
+        self.send_packet("O" + s.encode("hex"))
+
+    def accept(self):
+        "Accept a new client"
+        self.sock, self.address = self.server.accept()
+        self.sock.setblocking(0)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.recv_buffer = self.send_buffer = ""
+        self.recv_queue = []
+        self.ack_mode = True
+        self.last_packet = None
+        self.closing = False
+
+    def disconnect(self):
+        "Close the client connection; the target is stopped"
+        self.sock.close()
+        self.sock = None
+        self.send_buffer = ""
+        if self.running:
+            self.stop()
+
+    def poll(self, timeout=None):
+        """Wait for events on the sockets during @timeout seconds (forever if
+        None), and handle them"""
+        if self.sock is None:
+            if not self.serving:
+                return
+            readable, _, _ = select.select([self.server], [], [], timeout)
+            if readable:
+                self.accept()
+            return
+
+        wlist = [self.sock] if self.send_buffer else []
+        readable, _, _ = select.select([self.sock], wlist, [], timeout)
+        if readable:
+            try:
+                data = self.sock.recv(self.PACKET_SIZE)
+            except socket.error as error:
+                log.warning("Connection error: %s", error)
+                data = ""
+            if not data:
+                self.disconnect()
+                return
+            log.debug("<- %r", data)
+            self.recv_queue += self.parse_messages(data)
+            self.process_messages()
+        self.send_messages()
+
+    def send_messages(self):
+        "Send the queued data, as much as the socket accepts"
+        if self.sock is None:
+            return
+        if self.send_buffer:
+            try:
+                sent = self.sock.send(self.send_buffer)
+            except socket.error as error:
+                if error.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    log.warning("Connection error: %s", error)
+                    self.disconnect()
+                    return
+                sent = 0
+            self.send_buffer = self.send_buffer[sent:]
+        if self.closing and not self.send_buffer:
+            self.disconnect()
+
+    def run(self):
+        """Serve the clients, one at a time, until one of them kills the
+        target"""
+        while self.serving or self.sock is not None:
+            # While the target runs, only check for pending events
+            self.poll(0 if self.running else None)
+            if self.running:
+                self.run_slice()
+        self.server.close()
+
+    # Execution control
+
+    def run_slice(self):
+        "Run the target for at most RUN_SLICE seconds"
+        self.dbg.myjit.set_budget(timeout=self.RUN_SLICE)
+        try:
+            ret = self.dbg.run()
+            if ret == ExceptionHandle.budgetExhausted():
+                return
+            status = self.stop_reply(ret)
+        except Exception as error:
+            status = self.fault_reply(error)
+        self.stop(status)
+
+    def stop(self, status="S05"):
+        "Stop the target and report it with @status"
+        self.running = False
+        self.dbg.myjit.set_budget()
+        self.status = status
+        if self.sock is not None:
+            self.send_packet(status)
+
+    def stop_reply(self, ret):
+        "Stop reply corresponding to the Debugguer.run result @ret"
+        if isinstance(ret, debugging.DebugBreakpointSoft):
+            return "S05"  # TRAP signal
+        elif isinstance(ret, ExceptionHandle):
+            if ret == ExceptionHandle.memoryBreakpoint():
+                return "S05"
+            raise NotImplementedError("Unknown Except")
+        elif isinstance(ret, debugging.DebugBreakpointTerminate):
+            # Connexion should close, but keep it running as a TRAP
+            # The connexion will be close on instance destruction
+            log.info("Execution terminated: %s", ret)
+            return "S05"
+        raise NotImplementedError()
+
+    def fault_reply(self, error):
+        """Stop reply for a target stopped by @error, raised by the emulation:
+        an unhandled guest exception or an unsupported event. The pending
+        exception is cleared and the run restarted at pc, so the client can
+        fix the target and resume it
+        """
+        jitter = self.dbg.myjit
+        except_flag = jitter.get_exception()
+        log.warning("Target stopped @0x%x (exception 0x%x): %r", jitter.pc,
+                    except_flag, error)
+        jitter.vm.set_exception(0)
+        jitter.cpu.set_exception(0)
+        self.dbg.init_run(jitter.pc)
+        if except_flag & EXCEPT_ACCESS_VIOL == EXCEPT_ACCESS_VIOL:
+            return "S0B"  # SEGV signal
+        return "S06"  # ABRT signal
+
+    def resume(self, action, addr=None):
+        """Resume the target
+        @action: "c" to continue, "s" to step
+        @addr: (optional) resume address"""
+        if addr is not None:
+            self.dbg.init_run(addr)
+        if action == "s":
+            try:
+                self.dbg.step()
+                # Exceptions without handler are left pending by the jitter
+                if self.dbg.myjit.get_exception():
+                    raise RuntimeError("Unhandled exception")
+                status = "S05"
+            except Exception as error:
+                status = self.fault_reply(error)
+            self.stop(status)
+        else:
+            self.running = True
 
     def process_messages(self):
 
         while self.recv_queue:
             msg = self.recv_queue.pop(0)
-            buf = StringIO(msg)
-            msg_type = buf.read(1)
-
-            self.send_queue.append("+")
-
-            if msg_type == "q":
-                if msg.startswith("qSupported"):
-                    self.send_queue.append("PacketSize=3fff")
-                elif msg.startswith("qC"):
-                    # Current thread
-                    self.send_queue.append("")
-                elif msg.startswith("qAttached"):
-                    # Not supported
-                    self.send_queue.append("")
-                elif msg.startswith("qTStatus"):
-                    # Not supported
-                    self.send_queue.append("")
-                elif msg.startswith("qfThreadInfo"):
-                    # Not supported
-                    self.send_queue.append("")
+            if msg == self.INTERRUPT:
+                if self.running:
+                    self.stop("S02")  # INT signal
+                continue
+            if self.running:
+                log.warning("Unexpected packet while running: %r", msg)
+                continue
+            try:
+                self.process_message(msg)
+            except Exception as error:
+                log.error("Error on packet %r: %r", msg[:0x40], error)
+                self.send_packet("E01")
+
+    def process_message(self, msg):
+        "Handle the packet @msg and queue the reply"
+        msg_type, args = msg[:1], msg[1:]
+
+        if msg_type == "q":
+            if msg.startswith("qSupported"):
+                self.send_packet("PacketSize=%x;QStartNoAckMode+" %
+                                 self.PACKET_SIZE)
+            elif msg.startswith("qfThreadInfo"):
+                self.send_packet("m1")
+            elif msg.startswith("qsThreadInfo"):
+                self.send_packet("l")
+            else:
+                # qC, qAttached, qTStatus, ...: not supported
+                self.send_packet("")
+
+        elif msg_type == "Q":
+            if msg == "QStartNoAckMode":
+                # The reply is still acknowledged
+                self.send_packet("OK")
+                self.ack_mode = False
+            else:
+                self.send_packet("")
+
+        elif msg_type == "H":
+            # Set current thread
+            self.send_packet("OK")
+
+        elif msg_type == "?":
+            # Report why the target halted
+            self.send_packet(self.status)
+
+        elif msg_type == "g":
+            # Report all general register values
+            self.send_packet(self.report_general_register_values())
+
+        elif msg_type == "G":
+            # Set all general register values
+            self.set_general_register_values(args)
+            self.send_packet("OK")
+
+        elif msg_type == "p":
+            # Read a specific register
+            reg_num = int(args, 16)
+            if reg_num >= len(self.general_registers_order):
+                self.send_packet("E00")
+            else:
+                self.send_packet(self.read_register(reg_num))
+
+        elif msg_type == "P":
+            # Set a specific register
+            reg_num, value = args.split("=")
+            reg_num = int(reg_num, 16)
+            value = int(value.decode("hex")[::-1].encode("hex"), 16)
+            self.set_register(reg_num, value)
+            self.send_packet("OK")
+
+        elif msg_type == "m":
+            # Read memory
+            addr, size = (int(x, 16) for x in args.split(","))
+            size = min(size, (self.PACKET_SIZE - 4) / 2)
+            data = self.read_memory(addr, size)
+            self.send_packet(data if data else "E14")
+
+        elif msg_type in ["M", "X"]:
+            # Write memory, hex encoded or binary
+            location, data = args.split(":", 1)
+            addr, size = (int(x, 16) for x in location.split(","))
+            if msg_type == "M":
+                data = data.decode("hex")
+            if len(data) != size:
+                self.send_packet("E01")
+            elif self.write_memory(addr, data):
+                self.send_packet("OK")
+            else:
+                self.send_packet("E14")
+
+        elif msg_type == "k":
+            # Kill
+            self.serving = False
+            self.closing = True
+
+        elif msg_type == "D":
+            # Detach: the target is kept stopped for a new client
+            self.send_packet("OK")
+            self.closing = True
+
+        elif msg_type == "!":
+            # Extending debugging will be used
+            self.send_packet("OK")
+
+        elif msg_type == "v":
+            if msg == "vCont?":
+                self.send_packet("vCont;c;C;s;S")
+            elif msg.startswith("vCont;"):
+                # Single thread: the first action applies
+                action = args[5:].split(";")[0].split(":")[0]
+                if action[:1] in ["c", "C", "s", "S"]:
+                    self.resume(action[:1].lower())
                 else:
-                    raise NotImplementedError()
-
-            elif msg_type == "H":
-                # Set current thread
-                self.send_queue.append("OK")
-
-            elif msg_type == "?":
-                # Report why the target halted
-                self.send_queue.append(self.status)  # TRAP signal
-
-            elif msg_type == "g":
-                # Report all general register values
-                self.send_queue.append(self.report_general_register_values())
-
-            elif msg_type == "p":
-                # Read a specific register
-                reg_num = int(buf.read(), 16)
-                self.send_queue.append(self.read_register(reg_num))
-
-            elif msg_type == "P":
-                # Set a specific register
-                reg_num, value = buf.read().split("=")
-                reg_num = int(reg_num, 16)
-                value = int(value.decode("hex")[::-1].encode("hex"), 16)
-                self.set_register(reg_num, value)
-                self.send_queue.append("OK")
-
-            elif msg_type == "m":
-                # Read memory
-                addr, size = map(lambda x: int(x, 16), buf.read().split(","))
-                self.send_queue.append(self.read_memory(addr, size))
-
-            elif msg_type == "k":
-                # Kill
-                self.sock.close()
-                self.send_queue = []
-                self.sock = None
-
-            elif msg_type == "!":
-                # Extending debugging will be used
-                self.send_queue.append("OK")
-
-            elif msg_type == "v":
-                if msg == "vCont?":
-                    # Is vCont supported ?
-                    self.send_queue.append("")
-
-            elif msg_type == "s":
-                # Step
-                self.dbg.step()
-                self.send_queue.append("S05")  # TRAP signal
-
-            elif msg_type == "Z":
-                # Add breakpoint or watchpoint
-                bp_type = buf.read(1)
-                if bp_type == "0":
-                    # Exec breakpoint
-                    assert(buf.read(1) == ",")
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-
-                    if size != 1:
-                        raise NotImplementedError("Bigger size")
-                    self.dbg.add_breakpoint(addr)
-                    self.send_queue.append("OK")
-
-                elif bp_type == "1":
-                    # Hardware BP
-                    assert(buf.read(1) == ",")
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-
-                    self.dbg.add_memory_breakpoint(addr, size,
-                                                   read=True,
-                                                   write=True)
-                    self.send_queue.append("OK")
-
-                elif bp_type in ["2", "3", "4"]:
-                    # Memory breakpoint
-                    assert(buf.read(1) == ",")
-                    read = bp_type in ["3", "4"]
-                    write = bp_type in ["2", "4"]
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-
-                    self.dbg.add_memory_breakpoint(addr, size,
-                                                   read=read,
-                                                   write=write)
-                    self.send_queue.append("OK")
+                    self.send_packet("E01")
+            elif msg.startswith("vKill"):
+                self.send_packet("OK")
+                self.serving = False
+                self.closing = True
+            else:
+                self.send_packet("")
 
-                else:
-                    raise ValueError("Impossible value")
-
-            elif msg_type == "z":
-                # Remove breakpoint or watchpoint
-                bp_type = buf.read(1)
-                if bp_type == "0":
-                    # Exec breakpoint
-                    assert(buf.read(1) == ",")
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-
-                    if size != 1:
-                        raise NotImplementedError("Bigger size")
-                    dbgsoft = self.dbg.get_breakpoint_by_addr(addr)
-                    assert(len(dbgsoft) == 1)
-                    self.dbg.remove_breakpoint(dbgsoft[0])
-                    self.send_queue.append("OK")
-
-                elif bp_type == "1":
-                    # Hardware BP
-                    assert(buf.read(1) == ",")
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-                    self.dbg.remove_memory_breakpoint_by_addr_access(
-                        addr, read=True, write=True)
-                    self.send_queue.append("OK")
-
-                elif bp_type in ["2", "3", "4"]:
-                    # Memory breakpoint
-                    assert(buf.read(1) == ",")
-                    read = bp_type in ["3", "4"]
-                    write = bp_type in ["2", "4"]
-                    addr, size = map(
-                        lambda x: int(x, 16), buf.read().split(","))
-
-                    self.dbg.remove_memory_breakpoint_by_addr_access(
-                        addr, read=read, write=write)
-                    self.send_queue.append("OK")
+        elif msg_type in ["c", "s"]:
+            # Continue or step, at an optional address
+            self.resume(msg_type, int(args, 16) if args else None)
 
-                else:
-                    raise ValueError("Impossible value")
-
-            elif msg_type == "c":
-                # Continue
-                self.status = ""
-                self.send_messages()
-                ret = self.dbg.run()
-                if isinstance(ret, debugging.DebugBreakpointSoft):
-                    self.status = "S05"
-                    self.send_queue.append("S05")  # TRAP signal
-                elif isinstance(ret, ExceptionHandle):
-                    if ret == ExceptionHandle.memoryBreakpoint():
-                        self.status = "S05"
-                        self.send_queue.append("S05")
-                    else:
-                        raise NotImplementedError("Unknown Except")
-                elif isinstance(ret, debugging.DebugBreakpointTerminate):
-                    # Connexion should close, but keep it running as a TRAP
-                    # The connexion will be close on instance destruction
-                    print ret
-                    self.status = "S05"
-                    self.send_queue.append("S05")
-                else:
-                    raise NotImplementedError()
+        elif msg_type in ["Z", "z"]:
+            self.set_breakpoint(msg_type == "Z", args)
 
+        else:
+            log.warning("Not implemented: message type '%s'", msg_type)
+            self.send_packet("")
+
+    def set_breakpoint(self, add, args):
+        """Add (if @add) or remove a breakpoint or watchpoint
+        @args: "type,addr,kind" """
+        bp_type, addr, size = args.split(",")[:3]
+        addr, size = int(addr, 16), int(size, 16)
+
+        if bp_type == "0":
+            # Exec breakpoint
+            if add:
+                self.dbg.add_breakpoint(addr)
             else:
-                raise NotImplementedError(
-                    "Not implemented: message type '%s'" % msg_type)
-
-    def send_messages(self):
-        for msg in self.send_queue:
-            if msg == "+":
-                data = "+"
+                self.dbg.remove_breakpoint_by_addr(addr)
+        elif bp_type in ["1", "2", "3", "4"]:
+            # Hardware BP (1), or memory breakpoint
+            read = bp_type in ["1", "3", "4"]
+            write = bp_type in ["1", "2", "4"]
+            if add:
+                self.dbg.add_memory_breakpoint(addr, size, read=read,
+                                               write=write)
             else:
-                data = "$%s#%s" % (msg, self.compute_checksum(msg))
-            logging.debug("-> %r", data)
-            self.sock.send(data)
-        self.send_queue = []
-
-    def main_loop(self):
-        self.recv_queue = []
-        self.send_queue = []
-
-        self.send_string("Test\n")
-
-        while (self.sock):
-            self.get_messages()
-            self.process_messages()
-            self.send_messages()
-
-    def run(self):
-        self.sock, self.address = self.server.accept()
-        self.main_loop()
+                self.dbg.remove_memory_breakpoint_by_addr_access(
+                    addr, read=read, write=write)
+        else:
+            self.send_packet("")
+            return
+        self.send_packet("OK")
 
     # Debugguer processing methods
     def report_general_register_values(self):
@@ -291,6 +448,15 @@ class GdbServer(object):
             s += self.read_register(i)
         return s
 
+    def set_general_register_values(self, data):
+        data = data.decode("hex")
+        for i, reg_name in enumerate(self.general_registers_order):
+            size = self.general_registers_size[reg_name]
+            if len(data) < size:
+                break
+            value, data = data[:size], data[size:]
+            self.set_register(i, int(value[::-1].encode("hex"), 16))
+
     def read_register(self, reg_num):
         reg_name = self.general_registers_order[reg_num]
         reg_value = self.read_register_by_name(reg_name)
@@ -318,12 +484,33 @@ class GdbServer(object):
         return self.dbg.get_reg_value(reg_name)
 
     def read_memory(self, addr, size):
-        except_flag_vm = self.dbg.myjit.vm.get_exception()
+        """Return the memory @addr, hex encoded. If the memory is partially
+        mapped, return its readable start, which may be empty"""
+        vm = self.dbg.myjit.vm
+        except_flag_vm = vm.get_exception()
         try:
             return self.dbg.get_mem_raw(addr, size).encode("hex")
         except RuntimeError:
-            self.dbg.myjit.vm.set_exception(except_flag_vm)
-            return "00" * size
+            vm.set_exception(except_flag_vm)
+
+        # Find the readable start, page per page
+        readable = 0
+        while readable < size:
+            chunk = min(size - readable, 0x1000 - ((addr + readable) & 0xFFF))
+            if not vm.is_mapped(addr + readable, chunk):
+                break
+            readable += chunk
+        if not readable:
+            return ""
+        return self.dbg.get_mem_raw(addr, readable).encode("hex")
+
+    def write_memory(self, addr, data):
+        "Write @data @addr; return True on success"
+        vm = self.dbg.myjit.vm
+        if not vm.is_mapped(addr, len(data)):
+            return False
+        self.dbg.set_mem(addr, data)
+        return True
 
 
 class GdbServer_x86_32(GdbServer):
@@ -182,7 +182,8 @@ class OS_Win(OS):
 
         # Load main pe
         with open(self.fname) as fstream:
-            self.pe = vm_load_pe(self.jitter.vm, fstream.read())
+            self.pe = vm_load_pe(self.jitter.vm, fstream.read(),
+                                 fstream=fstream)
 
         win_api_x86_32.winobjs.current_pe = self.pe
 
@@ -230,7 +231,8 @@ class OS_Linux(OS):
         self.libs = libimp_elf()
 
         with open(self.fname) as fstream:
-            self.elf = vm_load_elf(self.jitter.vm, fstream.read())
+            self.elf = vm_load_elf(self.jitter.vm, fstream.read(),
+                                   fstream=fstream)
         preload_elf(self.jitter.vm, self.elf, self.libs)
 
         self.entry_point = self.elf.Ehdr.entry
@@ -460,25 +460,14 @@ class mn_aarch64(cls_mn):
     def getbits(cls, bs, attrib, start, n):
         if not n:
             return 0
-        o = 0
         if n > bs.getlen() * 8:
             raise ValueError('not enought bits %r %r' % (n, len(bs.bin) * 8))
-        while n:
-            offset = start / 8
-            n_offset = cls.endian_offset(attrib, offset)
-            c = cls.getbytes(bs, n_offset, 1)
-            if not c:
-                raise IOError
-            c = ord(c)
-            r = 8 - start % 8
-            c &= (1 << r) - 1
-            l = min(r, n)
-            c >>= (r - l)
-            o <<= l
-            o |= c
-            n -= l
-            start += l
-        return o
+        if attrib == "l":
+            return bs.getbits(start, n, 4)
+        elif attrib == "b":
+            return bs.getbits(start, n)
+        else:
+            raise NotImplementedError('bad attrib')
 
     @classmethod
     def endian_offset(cls, attrib, offset):
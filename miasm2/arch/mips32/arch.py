@@ -216,26 +216,15 @@ class mn_mips32(cpu.cls_mn):
         return info
 
     @classmethod
-    def getbits(cls, bitstream, attrib, start, n):
+    def getbits(cls, bs, attrib, start, n):
         if not n:
             return 0
-        o = 0
-        while n:
-            offset = start / 8
-            n_offset = cls.endian_offset(attrib, offset)
-            c = cls.getbytes(bitstream, n_offset, 1)
-            if not c:
-                raise IOError
-            c = ord(c)
-            r = 8 - start % 8
-            c &= (1 << r) - 1
-            l = min(r, n)
-            c >>= (r - l)
-            o <<= l
-            o |= c
-            n -= l
-            start += l
-        return o
+        if attrib == "l":
+            return bs.getbits(start, n, 4)
+        elif attrib == "b":
+            return bs.getbits(start, n)
+        else:
+            raise NotImplementedError('bad attrib')
 
     @classmethod
     def endian_offset(cls, attrib, offset):
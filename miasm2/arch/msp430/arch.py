@@ -243,24 +243,10 @@ class mn_msp430(cls_mn):
     def getbits(cls, bs, attrib, start, n):
         if not n:
             return 0
-        o = 0
         if n > bs.getlen() * 8:
             raise ValueError('not enought bits %r %r' % (n, len(bs.bin) * 8))
-        while n:
-            i = start / 8
-            c = cls.getbytes(bs, i)
-            if not c:
-                raise IOError
-            c = ord(c)
-            r = 8 - start % 8
-            c &= (1 << r) - 1
-            l = min(r, n)
-            c >>= (r - l)
-            o <<= l
-            o |= c
-            n -= l
-            start += l
-        return o
+        # Stream of little endian 16 bits words
+        return bs.getbits(start, n, 2)
 
     @classmethod
     def getbytes(cls, bs, offset, l=1):
@@ -693,6 +693,13 @@ class mn_x86(cls_mn):
         c.additional_info.g1.value = pref
         return c
 
+    @classmethod
+    def split_args(cls, args_str):
+        # x86 operands do not contain commas
+        if not args_str:
+            return []
+        return args_str.split(',')
+
     @classmethod
     def pre_dis(cls, v, mode, offset):
         offset_o = offset
@@ -786,6 +793,12 @@ class mn_x86(cls_mn):
             self.g1.value = infos.g1.value
             self.g2.value = infos.g2.value
 
+    @classmethod
+    def asm_infos_key(cls, infos):
+        if infos is None:
+            return None
+        return infos.g1.value, infos.g2.value
+
     def reset_class(self):
         super(mn_x86, self).reset_class()
         if hasattr(self, "opmode"):
@@ -135,9 +135,7 @@ class jitter_x86_64(jitter):
     def func_args_stdcall(self, n_args):
         args_regs = ['RCX', 'RDX', 'R8', 'R9']
         ret_ad = self.pop_uint64_t()
-        args = []
-        for i in xrange(min(n_args, 4)):
-            args.append(self.cpu.get_gpreg()[args_regs[i]])
+        args = list(self.cpu.get_regs(args_regs[:n_args]))
         for i in xrange(max(0, n_args - 4)):
             args.append(self.get_stack_arg(i))
         return ret_ad, args
@@ -152,9 +150,7 @@ class jitter_x86_64(jitter):
     def func_args_cdecl(self, n_args):
         args_regs = ['RCX', 'RDX', 'R8', 'R9']
         ret_ad = self.pop_uint64_t()
-        args = []
-        for i in xrange(min(n_args, 4)):
-            args.append(self.cpu.get_gpreg()[args_regs[i]])
+        args = list(self.cpu.get_regs(args_regs[:n_args]))
         for i in xrange(max(0, n_args - 4)):
             args.append(self.get_stack_arg(i))
         return ret_ad, args
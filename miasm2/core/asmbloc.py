@@ -4,6 +4,9 @@
 import logging
 import inspect
 import re
+import multiprocessing
+import cPickle
+from cStringIO import StringIO
 
 
 import miasm2.expression.expression as m2_expr
@@ -137,18 +140,23 @@ class asm_bloc(object):
         assert type(self.bto) is set
         self.bto.add(c)
 
-    def split(self, offset, l):
+    def split(self, offset, l, line_index=None):
+        """Split the bloc at @offset: the new bloc, labelled @l, starts with
+        the line at @offset. Return the new bloc, or None if no line starts
+        at @offset
+        @line_index: (optional) index of the line at @offset in self.lines
+        """
         log_asmbloc.debug('split at %x', offset)
-        i = -1
-        offsets = [x.offset for x in self.lines]
-        if not l.offset in offsets:
-            log_asmbloc.warning(
-                'cannot split bloc at %X ' % offset +
-                'middle instruction? default middle')
-            offsets.sort()
-            return None
+        if line_index is None:
+            offsets = [x.offset for x in self.lines]
+            if not l.offset in offsets:
+                log_asmbloc.warning(
+                    'cannot split bloc at %X ' % offset +
+                    'middle instruction? default middle')
+                return None
+            line_index = offsets.index(offset)
         new_bloc = asm_bloc(l)
-        i = offsets.index(offset)
+        i = line_index
 
         self.lines, new_bloc.lines = self.lines[:i], self.lines[i:]
         flow_mod_instr = self.get_flow_instr()
@@ -446,10 +454,31 @@ def dis_bloc(mnemo, pool_bin, cur_bloc, offset, job_done, symbol_pool,
     return offsets_to_dis
 
 
+def index_bloc_lines(blocs, lines_index=None):
+    """Index lines of @blocs by offset
+    Return a dictionnary offset -> (bloc, line index in bloc.lines)
+    @lines_index: (optional) dictionnary to update
+    """
+    if lines_index is None:
+        lines_index = {}
+    for bloc in blocs:
+        for i, line in enumerate(bloc.lines):
+            lines_index[line.offset] = (bloc, i)
+    return lines_index
+
+
 def split_bloc(mnemo, attrib, pool_bin, blocs,
-               symbol_pool, more_ref=None, dis_bloc_callback=None):
+               symbol_pool, more_ref=None, dis_bloc_callback=None,
+               lines_index=None):
+    """Split @blocs at each destination which is not a bloc start
+    @more_ref: (optional) additional destinations offsets
+    @lines_index: (optional) lines index of @blocs, as returned by
+    index_bloc_lines
+    """
     if not more_ref:
         more_ref = []
+    if lines_index is None:
+        lines_index = index_bloc_lines(blocs)
 
     # get all possible dst
     bloc_dst = [symbol_pool._offset2label[x] for x in more_ref]
@@ -461,23 +490,39 @@ def split_bloc(mnemo, attrib, pool_bin, blocs,
                 continue
             bloc_dst.append(c.label)
 
-    bloc_dst = [x.offset for x in bloc_dst if x.offset is not None]
-
-    j = -1
-    while j < len(blocs) - 1:
-        j += 1
-        cb = blocs[j]
-        a, b = cb.get_range()
+    bloc_dst = set(x.offset for x in bloc_dst if x.offset is not None)
 
-        for off in bloc_dst:
-            if not (off > a and off <= b):
+    # Group split points by bloc
+    bloc_splits = {}
+    for off in bloc_dst:
+        # Detect destinations in the middle of an instruction
+        for delta in xrange(1, mnemo.max_instruction_len):
+            prev = off - delta
+            if not prev in lines_index:
                 continue
+            cb, i = lines_index[prev]
+            if off < prev + cb.lines[i].l:
+                log_asmbloc.error("cannot split %x!!", off)
+                break
+        if not off in lines_index:
+            continue
+        cb, i = lines_index[off]
+        if i == 0:
+            continue
+        bloc_splits.setdefault(cb, []).append(i)
+
+    for cb in list(blocs):
+        if not cb in bloc_splits:
+            continue
+        # Split from the last line, so that remaining indexes stay valid
+        new_blocs = []
+        for i in sorted(bloc_splits[cb], reverse=True):
+            off = cb.lines[i].offset
             l = symbol_pool.getby_offset_create(off)
-            new_b = cb.split(off, l)
             log_asmbloc.debug("split bloc %x", off)
-            if new_b is None:
-                log_asmbloc.error("cannot split %x!!", off)
-                continue
+            new_blocs.append(cb.split(off, l, i))
+        new_blocs.reverse()
+        for new_b in new_blocs:
             if dis_bloc_callback:
                 offsets_to_dis = set(
                     [x.label.offset for x in new_b.bto
@@ -486,7 +531,6 @@ def split_bloc(mnemo, attrib, pool_bin, blocs,
                     mnemo, attrib, pool_bin, new_b, offsets_to_dis,
                     symbol_pool)
             blocs.append(new_b)
-            a, b = cb.get_range()
 
     return blocs
 
@@ -499,6 +543,7 @@ def dis_bloc_all(mnemo, pool_bin, offset, job_done, symbol_pool, dont_dis=[],
     log_asmbloc.info("dis bloc all")
     if blocs is None:
         blocs = []
+    lines_index = index_bloc_lines(blocs)
     todo = [offset]
 
     bloc_cpt = 0
@@ -535,9 +580,11 @@ def dis_bloc_all(mnemo, pool_bin, offset, job_done, symbol_pool, dont_dis=[],
                          dont_dis_nulstart_bloc=dont_dis_nulstart_bloc,
                          attrib=attrib)
         blocs.append(cur_bloc)
+        index_bloc_lines([cur_bloc], lines_index)
 
     return split_bloc(mnemo, attrib, pool_bin, blocs,
-                      symbol_pool, dis_bloc_callback=dis_bloc_callback)
+                      symbol_pool, dis_bloc_callback=dis_bloc_callback,
+                      lines_index=lines_index)
 
 
 def bloc2graph(blocks, label=False, lines=True):
@@ -670,6 +717,8 @@ def guess_blocks_size(mnemo, blocks):
                 except:
                     l = mnemo.max_instruction_len
                 data = None
+                # Force the encoding in assemble_block
+                instr.resolved_args = None
             instr.data = data
             instr.l = l
             size += l
@@ -927,11 +976,17 @@ def get_block_labels(block):
     return labels
 
 
-def assemble_block(mnemo, block, symbol_pool, conservative=False):
+def assemble_block(mnemo, block, symbol_pool, conservative=False,
+                   stats=None):
     """Assemble a @block using @symbol_pool
+    Instructions whose resolved arguments did not change since their last
+    assembly are not encoded again
     @conservative: (optional) use original bytes when possible
+    @stats: (optional) dictionnary whose 'instructions' and 'encoded' counters
+    are updated
     """
     offset_i = 0
+    encoded = 0
 
     for instr in block.lines:
         if isinstance(instr, asm_raw):
@@ -957,12 +1012,22 @@ def assemble_block(mnemo, block, symbol_pool, conservative=False):
         if instr.dstflow():
             instr.fixDstOffset()
 
+        resolved_args = instr.args
+        if (instr.data is not None and
+                getattr(instr, "resolved_args", None) == resolved_args):
+            # Encoding is still valid
+            instr.args = saved_args
+            offset_i += instr.l
+            continue
+
         old_l = instr.l
         cached_candidate, candidates = conservative_asm(
             mnemo, instr, symbol_pool, conservative)
+        encoded += 1
 
         # Restore original arguments
         instr.args = saved_args
+        instr.resolved_args = resolved_args
 
         # We need to update the block size
         block.size = block.size - old_l + len(cached_candidate)
@@ -971,10 +1036,26 @@ def assemble_block(mnemo, block, symbol_pool, conservative=False):
 
         offset_i += instr.l
 
+    if stats is not None:
+        stats["instructions"] = stats.get("instructions", 0) + \
+            len(block.lines)
+        stats["encoded"] = stats.get("encoded", 0) + encoded
 
-def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False):
+
+def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False,
+                  stats=None):
     """Resolve and assemble @blockChains using @symbol_pool until fixed point is
-    reached"""
+    reached
+    @stats: (optional) dictionnary filled with profiling counters:
+    - iterations: number of fixed point iterations
+    - blocks: number of assembled blocks
+    - instructions: number of assembled instructions
+    - encoded: number of instructions actually encoded
+    """
+    if stats is None:
+        stats = {}
+    for counter in ["iterations", "blocks", "instructions", "encoded"]:
+        stats.setdefault(counter, 0)
 
     log_asmbloc.debug("asmbloc_final")
 
@@ -1017,9 +1098,13 @@ def asmbloc_final(mnemo, blocks, blockChains, symbol_pool, conservative=False):
         if not blocks_to_rework:
             break
 
+        stats["iterations"] += 1
+        stats["blocks"] += len(blocks_to_rework)
+        log_asmbloc.info("asmbloc_final iteration %d: %d blocks to assemble",
+                         stats["iterations"], len(blocks_to_rework))
         while blocks_to_rework:
             block = blocks_to_rework.pop()
-            assemble_block(mnemo, block, symbol_pool, conservative)
+            assemble_block(mnemo, block, symbol_pool, conservative, stats)
 
 
 def sanity_check_blocks(blocks):
@@ -1042,9 +1127,12 @@ def sanity_check_blocks(blocks):
             raise RuntimeError("Too many next constraints for bloc %r" % label)
 
 
-def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None):
+def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None,
+                      stats=None):
     """Resolve and assemble @blocks using @symbol_pool into interval
-    @dst_interval"""
+    @dst_interval
+    @stats: (optional) dictionnary filled with profiling counters (see
+    asmbloc_final)"""
 
     sanity_check_blocks(blocks)
 
@@ -1053,7 +1141,8 @@ def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None):
     resolved_blockChains = resolve_symbol(
         blockChains, symbol_pool, dst_interval)
 
-    asmbloc_final(mnemo, blocks, resolved_blockChains, symbol_pool)
+    asmbloc_final(mnemo, blocks, resolved_blockChains, symbol_pool,
+                  stats=stats)
     patches = {}
     output_interval = interval()
 
@@ -1068,6 +1157,7 @@ def asm_resolve_final(mnemo, blocks, symbol_pool, dst_interval=None):
             instruction_interval = interval([(offset, offset + instr.l - 1)])
             if not (instruction_interval & output_interval).empty:
                 raise RuntimeError("overlapping bytes %X" % int(offset))
+            output_interval.add(offset, offset + instr.l - 1)
             instr.offset = offset
             offset += instr.l
     return patches
@@ -1285,6 +1375,72 @@ def bloc_merge(blocs, dont_merge=[]):
         i = -1
 
 
+def _dumps_blocs(blocs):
+    """Serialize @blocs, replacing asm_label instances by their offset (or
+    their name for unpinned labels)
+    Return the sorted list of labels keys and the serialized data"""
+    keys = set()
+
+    def persistent_id(element):
+        "Return the key of labels, None for other objects"
+        if not isinstance(element, asm_label):
+            return None
+        if element.offset is None:
+            key = ("name", element.name)
+        else:
+            key = ("offset", element.offset)
+        keys.add(key)
+        return key
+
+    output = StringIO()
+    pickler = cPickle.Pickler(output, cPickle.HIGHEST_PROTOCOL)
+    pickler.persistent_id = persistent_id
+    pickler.dump(blocs)
+    return sorted(keys), output.getvalue()
+
+
+def _label_from_key(symbol_pool, key):
+    """Return the label of @symbol_pool associated to @key (created if
+    needed)"""
+    kind, value = key
+    if kind == "offset":
+        return symbol_pool.getby_offset_create(value)
+    return symbol_pool.getby_name_create(value)
+
+
+def _loads_blocs(keys, data, symbol_pool):
+    """Unserialize @data, retrieving labels from @symbol_pool
+    Missing labels are created following @keys order, which does not depend
+    on the serialization order"""
+    for key in keys:
+        _label_from_key(symbol_pool, key)
+    unpickler = cPickle.Unpickler(StringIO(data))
+    unpickler.persistent_load = lambda key: _label_from_key(symbol_pool, key)
+    return unpickler.load()
+
+
+# Disassembly engine shared by the 'dis_multibloc_many' worker processes
+_WORKER_CONTEXT = {}
+
+
+def _dis_many_init(engine):
+    """Initialize a 'dis_multibloc_many' worker process
+    As workers are forked, @engine and its bin_stream are not serialized"""
+    _WORKER_CONTEXT["engine"] = engine
+    _WORKER_CONTEXT["job_done"] = set(engine.job_done)
+
+
+def _dis_many_worker(offset):
+    """Disassemble the function at @offset in a worker process
+    Return @offset, the labels keys and the serialized list of asm_bloc"""
+    engine = _WORKER_CONTEXT["engine"]
+    # Each function is disassembled from the same initial state, so that the
+    # result does not depend on the jobs previously handled by this worker
+    engine.job_done = set(_WORKER_CONTEXT["job_done"])
+    keys, data = _dumps_blocs(engine.dis_multibloc(offset))
+    return offset, keys, data
+
+
 class disasmEngine(object):
 
     def __init__(self, arch, attrib, bs=None, **kwargs):
@@ -1330,3 +1486,43 @@ class disasmEngine(object):
                              dont_dis_nulstart_bloc=self.dont_dis_nulstart_bloc,
                              attrib=self.attrib)
         return blocs
+
+    def dis_multibloc_many(self, offsets, processes=None, chunksize=1):
+        """Disassemble the functions starting at @offsets using a pool of
+        worker processes, and yield (offset, asm_bloc list) in @offsets order
+
+        Workers are forked from the current process: they share the engine
+        configuration and its bin_stream, which is only read. Each function is
+        disassembled from the current 'job_done' state, independently of the
+        other ones; its offsets are then marked as done.
+        Labels are merged into the engine's symbol_pool in @offsets order, so
+        the result does not depend on the workers scheduling.
+
+        @offsets: iterable of function entry points
+        @processes: (optional) number of worker processes (default: number of
+        CPUs)
+        @chunksize: (optional) number of functions sent to a worker at once
+        """
+        # Remove duplicates, keeping order
+        todo = []
+        known = set()
+        for offset in offsets:
+            offset = int(offset)
+            if offset in known:
+                continue
+            known.add(offset)
+            todo.append(offset)
+        if not todo:
+            return
+
+        pool = multiprocessing.Pool(processes, _dis_many_init, (self,))
+        try:
+            for offset, keys, data in pool.imap(_dis_many_worker, todo,
+                                                chunksize):
+                blocs = _loads_blocs(keys, data, self.symbol_pool)
+                for bloc in blocs:
+                    self.job_done.update(line.offset for line in bloc.lines)
+                yield offset, blocs
+        finally:
+            pool.terminate()
+            pool.join()
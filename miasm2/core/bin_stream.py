@@ -17,6 +17,16 @@
 #
 
 
+import mmap
+from binascii import hexlify
+from struct import Struct
+
+# Big endian 64 bits word
+_WORD_BIG = Struct(">Q")
+# Little endian words, by size in bytes
+_WORDS_LITTLE = {2: Struct("<H"), 4: Struct("<I"), 8: Struct("<Q")}
+
+
 class bin_stream(object):
 
     def __init__(self, *args, **kargs):
@@ -31,39 +41,41 @@ class bin_stream(object):
     def getbytes(self, start, l=1):
         return self.bin[start:start + l]
 
-    def getbits(self, start, n):
+    def getbits(self, start, n, word_size=None):
         """Return the bits from the bit stream
         @start: the offset in bits
         @n: number of bits to read
+        @word_size: (optional) if set, the stream is made of little endian
+        words of @word_size bytes, whose bits are read from the most
+        significant one
         """
         if not n:
             return 0
-        o = 0
         if n > self.getlen() * 8:
             raise IOError('not enough bits %r %r' % (n, len(self.bin) * 8))
-        while n:
-            # print 'xxx', n, start
-            i = start / 8
-            c = self.getbytes(i)
-            if not c:
-                raise IOError('cannot get bytes')
-            c = ord(c)
-            # print 'o', hex(c)
-            r = 8 - start % 8
-            c &= (1 << r) - 1
-            # print 'm', hex(c)
-            l = min(r, n)
-            # print 'd', r-l
-            c >>= (r - l)
-            o <<= l
-            o |= c
-            n -= l
-            start += l
-        return o
+        offset = start / 8
+        if word_size is None:
+            data = self.getbytes(offset, (start % 8 + n + 7) / 8)
+        else:
+            # Read whole words, and put their bytes in reading order
+            offset -= offset % word_size
+            size = (start - offset * 8 + n + 7) / 8
+            size += -size % word_size
+            data = self.getbytes(offset, size)
+            data = "".join(data[i:i + word_size][::-1]
+                           for i in xrange(0, len(data), word_size))
+        start -= offset * 8
+        if len(data) * 8 < start + n:
+            raise IOError('cannot get bytes')
+        return ((int(hexlify(data), 16) >> (len(data) * 8 - start - n)) &
+                ((1 << n) - 1))
 
 
 class bin_stream_str(bin_stream):
 
+    """bin_stream on a buffer: a string, or any object supporting slicing and
+    the buffer interface, such as a mmap"""
+
     def __init__(self, input_str="", offset=0L, shift=0):
         bin_stream.__init__(self)
         self.bin = input_str
@@ -77,6 +89,26 @@ class bin_stream_str(bin_stream):
 
         return super(bin_stream_str, self).getbytes(start + self.shift, l)
 
+    def getbits(self, start, n, word_size=None):
+        # Fast path: extract bits from a single word, read in place
+        offset = start / 8
+        if word_size is None:
+            if start % 8 + n <= 64:
+                offset += self.shift
+                if 0 <= offset <= self.l - 8:
+                    word = _WORD_BIG.unpack_from(self.bin, offset)[0]
+                    return (word >> (64 - start % 8 - n)) & ((1 << n) - 1)
+        elif word_size in _WORDS_LITTLE:
+            word_bits = word_size * 8
+            if start % word_bits + n <= word_bits:
+                offset += self.shift - offset % word_size
+                if 0 <= offset <= self.l - word_size:
+                    word = _WORDS_LITTLE[word_size].unpack_from(self.bin,
+                                                                offset)[0]
+                    return ((word >> (word_bits - start % word_bits - n)) &
+                            ((1 << n) - 1))
+        return super(bin_stream_str, self).getbits(start, n, word_size)
+
     def readbs(self, l=1):
         if self.offset + l + self.shift > self.l:
             raise IOError("not enough bytes in str")
@@ -94,34 +126,19 @@ class bin_stream_str(bin_stream):
         return self.l - (self.offset + self.shift)
 
 
-class bin_stream_file(bin_stream):
-
-    def __init__(self, binary, offset=0L, shift=0):
-        bin_stream.__init__(self)
-        self.bin = binary
-        self.bin.seek(0, 2)
-        self.shift = shift
-        self.l = self.bin.tell()
-        self.offset = offset
-
-    def getoffset(self):
-        return self.bin.tell() - self.shift
-
-    def setoffset(self, val):
-        self.bin.seek(val +  self.shift)
-    offset = property(getoffset, setoffset)
-
-    def readbs(self, l=1):
-        if self.offset + l + self.shift > self.l:
-            raise IOError("not enough bytes in file")
-        return self.bin.read(l)
+class bin_stream_file(bin_stream_str):
 
-    def __str__(self):
-        return str(self.bin)
-
-    def getlen(self):
-        return self.l - (self.offset + self.shift)
+    """bin_stream on a file, mapped read only in memory
+    The mapping can be shared with forked processes"""
 
+    def __init__(self, binary, offset=0L, shift=0):
+        try:
+            data = mmap.mmap(binary.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, ValueError, EnvironmentError):
+            # Not a real file, or an empty one (which cannot be mapped)
+            binary.seek(0)
+            data = binary.read()
+        super(bin_stream_file, self).__init__(data, offset, shift)
 
 
 class bin_stream_container(bin_stream):
@@ -2,6 +2,7 @@
 #-*- coding:utf-8 -*-
 
 import re
+import copy
 import struct
 import logging
 from collections import defaultdict
@@ -23,47 +24,44 @@ log.setLevel(logging.WARN)
 
 class bitobj:
 
+    """Bit stream, stored as an arbitrary precision integer and its length in
+    bits. Bits are written and read most significant first"""
+
     def __init__(self, s=""):
-        if not s:
-            bits = []
-        else:
-            bits = list(bin(int(str(s).encode('hex'), 16))[2:])
-            bits = [int(x) for x in bits]
-            if len(bits) % 8:
-                bits = [0 for x in xrange(8 - (len(bits) % 8))] + bits
-            bits = ['0' for x in xrange(len(s) * 8 - len(bits))] + bits
-        self.bits = bits
+        s = str(s)
+        self.value = int(s.encode('hex'), 16) if s else 0
+        self.bitlen = len(s) * 8
         self.offset = 0
 
     def __len__(self):
-        return len(self.bits) - self.offset
+        return self.bitlen - self.offset
 
     def getbits(self, n):
         if not n:
             return 0
-        o = 0
-        if n > len(self.bits) - self.offset:
-            raise ValueError('not enought bits %r %r' % (n, len(self.bits)))
-        b = self.bits[self.offset:self.offset + n]
-        b = int("".join([str(x) for x in b]), 2)
+        if n > self.bitlen - self.offset:
+            raise ValueError('not enought bits %r %r' % (n, self.bitlen))
         self.offset += n
-        return b
+        return (self.value >> (self.bitlen - self.offset)) & ((1 << n) - 1)
 
     def putbits(self, b, n):
         if not n:
             return
-        bits = list(bin(b)[2:])
-        bits = [int(x) for x in bits]
-        bits = [0 for x in xrange(n - len(bits))] + bits
-        self.bits += bits
+        if b < 0:
+            raise ValueError('cannot put negative value %r' % b)
+        # Values larger than @n bits are kept whole
+        n = max(n, b.bit_length())
+        self.value = (self.value << n) | b
+        self.bitlen += n
 
     def tostring(self):
-        if len(self.bits) % 8:
+        if self.bitlen % 8:
             raise ValueError(
-                'num bits must be 8 bit aligned: %d' % len(self.bits))
-        b = int("".join([str(x) for x in self.bits]), 2)
-        b = "%X" % b
-        b = '0' * (len(self.bits) / 4 - len(b)) + b
+                'num bits must be 8 bit aligned: %d' % self.bitlen)
+        if not self.bitlen:
+            return ""
+        b = "%X" % self.value
+        b = '0' * (self.bitlen / 4 - len(b)) + b
         b = b.decode('hex')
         return b
 
@@ -72,7 +70,8 @@ class bitobj:
 
     def copy_state(self):
         b = self.__class__()
-        b.bits = self.bits
+        b.value = self.value
+        b.bitlen = self.bitlen
         b.offset = self.offset
         return b
 
@@ -976,6 +975,26 @@ class instruction(object):
         return
 
 
+# Assembled instructions cache: (mnemonic class, name, mode, arguments,
+# resolved arguments, additional info key) -> encodings
+ASM_CACHE_SIZE = 100000
+_asm_cache = {}
+# Mnemonic classes with a given name and number of arguments:
+# (mnemonic class, name, number of arguments) -> classes
+_asm_variants = {}
+# Parsed lines cache: (mnemonic class, line, mode) -> (name, arguments,
+# additional info)
+FROMSTRING_CACHE_SIZE = 100000
+_fromstring_cache = {}
+# Operand parsers results: (parser, operand string) -> (expression, start,
+# stop)
+_scan_cache = {}
+# Integer literals of operands; operands differing only by those literals are
+# parsed once, using markers in place of the literals
+INT_LITERAL_RE = re.compile(r'(?<![\w$.(])(0x[0-9a-fA-F]+|[0-9]+)(?![\w$.)])')
+INT_MARKER = 0x1234
+
+
 class cls_mn(object):
     __metaclass__ = metamn
     args_symb = []
@@ -1194,8 +1213,101 @@ class cls_mn(object):
         return out[0]
 
     @classmethod
-    def fromstring(cls, s, mode = None):
+    def split_args(cls, args_str):
+        """Return the list of the operands strings of @args_str, or None if
+        operands of the architecture cannot be split without parsing them.
+        Split operands are parsed independently, and their integer literals
+        (outside of parenthesis) must not change the way they are parsed
+        @args_str: arguments part of an assembly line"""
+        return None
+
+    @classmethod
+    def scan_arg(cls, parser, args_str):
+        """Return (expression, start, stop) matched by @parser at the
+        beginning of @args_str, or (None, None, None). Results are cached
+        @parser: pyparsing parser of an argument
+        @args_str: string to parse"""
         global total_scans
+        key = (parser, args_str)
+        result = _scan_cache.get(key)
+        if result is None:
+            try:
+                total_scans += 1
+                v, start, stop = parser.scanString(args_str).next()
+            except StopIteration:
+                v, start, stop = [None], None, None
+            if start != 0:
+                v, start, stop = [None], None, None
+            result = v[0], start, stop
+            if len(_scan_cache) >= FROMSTRING_CACHE_SIZE:
+                _scan_cache.clear()
+            _scan_cache[key] = result
+        return result
+
+    @classmethod
+    def scan_operand(cls, parser, operand):
+        """Return (expression, start, stop) matched by @parser on the operand
+        @operand. Integer literals are replaced by markers before parsing, so
+        that operands differing only by their constants are parsed once
+        @parser: pyparsing parser of an argument
+        @operand: operand string"""
+        values = []
+
+        def to_marker(match):
+            literal = match.group(1)
+            if literal.startswith('0x'):
+                values.append(int(literal, 16))
+            else:
+                values.append(int(literal))
+            return hex(INT_MARKER + len(values) - 1)
+
+        template = INT_LITERAL_RE.sub(to_marker, operand)
+        if not values:
+            return cls.scan_arg(parser, operand)
+        expr, start, stop = cls.scan_arg(parser, template)
+        if start is None:
+            return expr, start, stop
+        if not isinstance(expr, m2_expr.Expr) or stop != len(template):
+            return cls.scan_arg(parser, operand)
+        found = []
+
+        def from_marker(expr):
+            if not isinstance(expr, m2_expr.ExprInt):
+                return expr
+            index = int(expr.arg) - INT_MARKER
+            if not 0 <= index < len(values):
+                return expr
+            found.append(index)
+            return m2_expr.ExprInt(values[index], expr.size)
+
+        expr = expr.visit(from_marker)
+        if sorted(found) != range(len(values)):
+            return cls.scan_arg(parser, operand)
+        return expr, 0, len(operand)
+
+    @classmethod
+    def fromstring(cls, s, mode = None):
+        """Return the instruction described by the assembly line @s
+        Parsed lines are cached: listings often repeat the same instructions
+        @s: assembly line
+        @mode: architecture mode"""
+        key = (cls, s, mode)
+        parsed = _fromstring_cache.get(key)
+        if parsed is None:
+            parsed = cls.fromstring_parse(s, mode)
+            if len(_fromstring_cache) >= FROMSTRING_CACHE_SIZE:
+                _fromstring_cache.clear()
+            _fromstring_cache[key] = parsed
+        name, args, infos = parsed
+        return cls.instruction(name, mode, list(args),
+                               additional_info=copy.deepcopy(infos))
+
+    @classmethod
+    def fromstring_parse(cls, s, mode = None):
+        """Parse the assembly line @s; return (name, arguments, additional
+        info)
+        @s: assembly line
+        @mode: architecture mode"""
         name = re.search('(\S+)', s).groups()
         if not name:
             raise ValueError('cannot find name', s)
@@ -1203,7 +1315,14 @@ class cls_mn(object):
 
         if not name in cls.all_mn_name:
             raise ValueError('unknown name', name)
-        clist = [x for x in cls.all_mn_name[name]]
+        args_full = s[len(name):].strip(' ')
+        tokens = cls.split_args(args_full)
+        if tokens is None:
+            clist = cls.all_mn_name[name]
+        else:
+            # Each argument is parsed from its own operand
+            tokens = [token.strip(' ') for token in tokens]
+            clist = cls.get_asm_variants(name, len(tokens))
         out = []
         out_args = []
         parsers = defaultdict(dict)
@@ -1211,7 +1330,7 @@ class cls_mn(object):
         for cc in clist:
             for c in cls.get_cls_instance(cc, mode):
                 args_expr = []
-                args_str = s[len(name):].strip(' ')
+                args_str = args_full
 
                 start = 0
                 cannot_parse = False
@@ -1226,20 +1345,21 @@ class cls_mn(object):
                     for p in parser:
                         if p in parsers[(i, start_i)]:
                             continue
-                        try:
-                            total_scans += 1
-                            v, start, stop = p.scanString(args_str).next()
-                        except StopIteration:
-                            v, start, stop = [None], None, None
-                        if start != 0:
-                            v, start, stop = [None], None, None
-                        parsers[(i, start_i)][p] = v[0], start, stop
+                        if tokens is None:
+                            result = cls.scan_arg(p, args_str)
+                        else:
+                            result = cls.scan_operand(p, tokens[i])
+                        parsers[(i, start_i)][p] = result
 
                     start, stop = f.fromstring(args_str, parsers[(i, start_i)])
                     if start != 0:
                         log.debug("cannot fromstring %r", args_str)
                         cannot_parse = True
                         break
+                    if tokens is not None and stop != len(tokens[i]):
+                        log.debug("cannot fromstring %r", args_str)
+                        cannot_parse = True
+                        break
                     if f.expr is None:
                         raise NotImplementedError('not fully functional')
                     f.expr = expr_simp(f.expr)
@@ -1265,9 +1385,7 @@ class cls_mn(object):
         c = out[0]
         c_args = out_args[0]
 
-        instr = cls.instruction(c.name, mode, c_args,
-                                additional_info=c.additional_info())
-        return instr
+        return c.name, tuple(c_args), c.additional_info()
 
     def dup_info(self, infos):
         return
@@ -1283,17 +1401,48 @@ class cls_mn(object):
         c.mode = mode
         yield c
 
+    @classmethod
+    def asm_infos_key(cls, infos):
+        """Return a hashable key standing for the parts of the additional
+        info @infos used by the encoder (see dup_info)"""
+        return None
+
+    @classmethod
+    def get_asm_variants(cls, name, nb_args):
+        """Return mnemonic classes named @name, taking @nb_args arguments"""
+        key = (cls, name, nb_args)
+        variants = _asm_variants.get(key)
+        if variants is None:
+            variants = [cc for cc in cls.all_mn_name[name]
+                        if len(cls.all_mn_inst[cc][0].args) == nb_args]
+            _asm_variants[key] = variants
+        return variants
+
     @classmethod
     def asm(cls, instr, symbols=None):
         """
         Re asm instruction by searching mnemo using name and args. We then
         can modify args and get the hex of a modified instruction
+        Encodings are cached: during the assembly fixpoint, instructions are
+        assembled again whenever a label moves
         """
-        clist = cls.all_mn_name[instr.name]
-        clist = [x for x in clist]
+        args = instr.resolve_args_with_symbols(symbols)
+        key = (cls, instr.name, instr.mode, tuple(instr.args), tuple(args),
+               cls.asm_infos_key(instr.additional_info))
+        vals = _asm_cache.get(key)
+        if vals is None:
+            vals = cls.asm_args(instr, args)
+            if len(_asm_cache) >= ASM_CACHE_SIZE:
+                _asm_cache.clear()
+            _asm_cache[key] = vals
+        return list(vals)
+
+    @classmethod
+    def asm_args(cls, instr, args):
+        """Return encodings of @instr, using the resolved arguments @args"""
+        clist = cls.get_asm_variants(instr.name, len(instr.args))
         vals = []
         candidates = []
-        args = instr.resolve_args_with_symbols(symbols)
 
         for cc in clist:
 
@@ -1337,7 +1486,7 @@ class cls_mn(object):
         todo = [(0, 0, [(x, self.fields_order[x]) for x in self.to_decode[::-1]])]
 
         result = []
-        done = []
+        done = set()
         cpt = 0
 
         while todo:
@@ -1345,9 +1494,10 @@ class cls_mn(object):
             # TEST XXX
             for i, f in to_decode:
                 setattr(self, f.fname, f)
-            if (index, [x[1].value for x in to_decode]) in done:
+            state = (index, tuple(x[1].value for x in to_decode))
+            if state in done:
                 continue
-            done.append((index, [x[1].value for x in to_decode]))
+            done.add(state)
 
             cpt += 1
             can_encode = True
@@ -1368,8 +1518,9 @@ class cls_mn(object):
                 for i in ret:
                     gcpt += 1
                     o = []
-                    if ((index, cur_len, [xx[1].value for xx in to_decode]) in todo or
-                        (index, cur_len, [xx[1].value for xx in to_decode]) in done):
+                    values = [xx[1].value for xx in to_decode]
+                    if ((index, cur_len, values) in todo or
+                        (index, cur_len, tuple(values)) in done):
                         raise NotImplementedError('not fully functional')
 
                     for p, f in to_decode:
@@ -1394,7 +1545,6 @@ class cls_mn(object):
                 continue
             bits.putbits(f.value, f.l)
 
-        xx = bits.tostring()
         return bits.tostring()
 
     def decoded2bytes(self, result):
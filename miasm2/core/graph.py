@@ -1,4 +1,5 @@
-from collections import defaultdict, namedtuple
+from array import array
+from collections import defaultdict, namedtuple, Mapping
 
 class DiGraph(object):
     """Implementation of directed graph"""
@@ -174,49 +175,14 @@ shape = "box"
         """Generic algorithm to compute either the dominators or postdominators
         of the graph.
         @head: the head/leaf of the graph
-        @reachable_cb: sons/parents of the head/leaf
+        @reachable_cb: sons/parents of the head/leaf (unused, kept for
+        compatibility)
         @prev_cb: return predecessors/succesors of a node
         @next_cb: return succesors/predecessors of a node
+        Return a DominatorTree, which can be used as a read-only dictionnary
+        node -> set of its dominators
         """
-
-        nodes = set(reachable_cb(head))
-        dominators = {}
-        for node in nodes:
-            dominators[node] = set(nodes)
-
-        dominators[head] = set([head])
-        modified = True
-        todo = set(nodes)
-
-        while todo:
-            node = todo.pop()
-
-            # Heads state must not be changed
-            if node == head:
-                continue
-
-            # Compute intersection of all predecessors'dominators
-            new_dom = None
-            for pred in prev_cb(node):
-                if not pred in nodes:
-                    continue
-                if new_dom is None:
-                    new_dom = set(dominators[pred])
-                new_dom.intersection_update(dominators[pred])
-
-            # We are not a head to we have at least one dominator
-            assert(new_dom is not None)
-
-            new_dom.update(set([node]))
-
-            # If intersection has changed, add sons to the todo list
-            if new_dom == dominators[node]:
-                continue
-
-            dominators[node] = new_dom
-            for succ in next_cb(node):
-                todo.add(succ)
-        return dominators
+        return DominatorTree(head, prev_cb, next_cb)
 
     def compute_dominators(self, head):
         """Compute the dominators of the graph"""
@@ -244,6 +210,14 @@ shape = "box"
         @succ_cb: return predecessors/succesors of a node
 
         """
+        if isinstance(gen_dominators, DominatorTree):
+            # Walk the tree directly
+            if node not in gen_dominators:
+                return
+            for dominator in gen_dominators.walk(node):
+                yield dominator
+            return
+
         # Init
         done = set()
         if node not in gen_dominators:
@@ -305,15 +279,7 @@ shape = "box"
 
     def compute_immediate_dominators(self, head):
         """Compute the immediate dominators of the graph"""
-        dominators = self.compute_dominators(head)
-        idoms = {}
-
-        for node in dominators:
-            for predecessor in self.walk_dominators(node, dominators):
-                if predecessor in dominators[node] and node != predecessor:
-                    idoms[node] = predecessor
-                    break
-        return idoms
+        return self.compute_dominators(head).immediate_dominators()
 
     def compute_dominance_frontier(self, head):
         """
@@ -327,7 +293,7 @@ shape = "box"
         frontier = {}
 
         for node in idoms:
-            if self._nodes_pred[node] >= 2:
+            if len(self.predecessors(node)) >= 2:
                 for predecessor in self.predecessors_iter(node):
                     runner = predecessor
                     if runner not in idoms:
@@ -406,7 +372,7 @@ shape = "box"
         for node in self.walk_depth_first_forward(head):
             for successor in self.successors_iter(node):
                 # check for a back edge to a dominator
-                if successor in dominators[node]:
+                if dominators.dominates(successor, node):
                     edge = (node, successor)
                     yield edge
 
@@ -507,3 +473,311 @@ shape = "box"
                             done.add(current.node)
 
                         yield scc
+
+
+class CompactDiGraph(DiGraph):
+
+    """Directed graph with the DiGraph API and a compact storage
+
+    Each node is mapped once to a dense integer id; adjacency is stored as
+    arrays of ids, so neighbors are walked without hashing node objects and
+    edges do not cost a tuple each. Ids of deleted nodes are reused.
+    """
+
+    def __init__(self):
+        # Node -> id
+        self._node2id = {}
+        # Id -> node (None for a free id)
+        self._id2node = []
+        self._free_ids = []
+        # Id -> array of successors/predecessors ids
+        self._succs = []
+        self._preds = []
+        self._edges_count = 0
+
+    def __repr__(self):
+        out = []
+        for node in self.nodes():
+            out.append(str(node))
+        for src, dst in self.edges_iter():
+            out.append("%s -> %s" % (src, dst))
+        return '\n'.join(out)
+
+    def nodes(self):
+        return self._node2id.viewkeys()
+
+    def edges_iter(self):
+        """Iterate on edges, as (src, dst) tuples"""
+        id2node = self._id2node
+        for src_id, succs in enumerate(self._succs):
+            if succs is None:
+                continue
+            src = id2node[src_id]
+            for dst_id in succs:
+                yield src, id2node[dst_id]
+
+    def edges(self):
+        return list(self.edges_iter())
+
+    def edges_count(self):
+        """Number of edges of the graph"""
+        return self._edges_count
+
+    def node_id(self, node):
+        """Return the integer id of @node"""
+        return self._node2id[node]
+
+    def id_node(self, node_id):
+        """Return the node of id @node_id"""
+        return self._id2node[node_id]
+
+    def add_node(self, node):
+        if node in self._node2id:
+            return
+        if self._free_ids:
+            node_id = self._free_ids.pop()
+            self._id2node[node_id] = node
+            self._succs[node_id] = array('l')
+            self._preds[node_id] = array('l')
+        else:
+            node_id = len(self._id2node)
+            self._id2node.append(node)
+            self._succs.append(array('l'))
+            self._preds.append(array('l'))
+        self._node2id[node] = node_id
+
+    def del_node(self, node):
+        """Delete the @node of the graph; Also delete every edge to/from this
+        @node"""
+        node_id = self._node2id.pop(node, None)
+        if node_id is None:
+            return
+        for pred_id in self._preds[node_id]:
+            if pred_id != node_id:
+                self._remove_all(self._succs[pred_id], node_id)
+        for succ_id in self._succs[node_id]:
+            if succ_id != node_id:
+                self._remove_all(self._preds[succ_id], node_id)
+        self._edges_count -= len(self._succs[node_id])
+        self._edges_count -= len([pred_id for pred_id in self._preds[node_id]
+                                  if pred_id != node_id])
+        self._id2node[node_id] = None
+        self._succs[node_id] = None
+        self._preds[node_id] = None
+        self._free_ids.append(node_id)
+
+    @staticmethod
+    def _remove_all(ids, node_id):
+        "Remove every occurrence of @node_id in the array @ids"
+        while node_id in ids:
+            ids.remove(node_id)
+
+    def add_edge(self, src, dst):
+        if not src in self._node2id:
+            self.add_node(src)
+        if not dst in self._node2id:
+            self.add_node(dst)
+        src_id, dst_id = self._node2id[src], self._node2id[dst]
+        self._succs[src_id].append(dst_id)
+        self._preds[dst_id].append(src_id)
+        self._edges_count += 1
+
+    def add_uniq_edge(self, src, dst):
+        """Add an edge from @src to @dst if it doesn't already exist"""
+        if (src not in self._node2id or dst not in self._node2id or
+            self._node2id[dst] not in self._succs[self._node2id[src]]):
+            self.add_edge(src, dst)
+
+    def del_edge(self, src, dst):
+        src_id, dst_id = self._node2id[src], self._node2id[dst]
+        self._succs[src_id].remove(dst_id)
+        self._preds[dst_id].remove(src_id)
+        self._edges_count -= 1
+
+    def predecessors_iter(self, node):
+        node_id = self._node2id.get(node)
+        if node_id is None:
+            return
+        id2node = self._id2node
+        for pred_id in self._preds[node_id]:
+            yield id2node[pred_id]
+
+    def successors_iter(self, node):
+        node_id = self._node2id.get(node)
+        if node_id is None:
+            return
+        id2node = self._id2node
+        for succ_id in self._succs[node_id]:
+            yield id2node[succ_id]
+
+    def leaves_iter(self):
+        for node, node_id in self._node2id.iteritems():
+            if not self._succs[node_id]:
+                yield node
+
+    def heads_iter(self):
+        for node, node_id in self._node2id.iteritems():
+            if not self._preds[node_id]:
+                yield node
+
+
+class DominatorTree(Mapping):
+
+    """Dominator tree of a graph, from a given head.
+
+    Immediate dominators are computed with the iterative algorithm of Cooper,
+    Harvey and Kennedy, over a reverse postorder numbering of the nodes
+    reachable from the head. They are stored in an array of node numbers;
+    dominator sets are only built on demand, so the tree can be used as a
+    read-only dictionnary node -> set of its dominators.
+
+    Source: Cooper, Keith D., Timothy J. Harvey, and Ken Kennedy.
+    "A simple, fast dominance algorithm."
+    Software Practice & Experience 4 (2001)
+    """
+
+    def __init__(self, head, prev_cb, next_cb):
+        """Compute the dominator tree of the graph
+        @head: the head/leaf of the graph
+        @prev_cb: return predecessors/succesors of a node
+        @next_cb: return succesors/predecessors of a node
+        """
+        self._head = head
+        # Node number -> node, in reverse postorder
+        self._order = self._reverse_postorder(head, next_cb)
+        # Node -> node number
+        self._index = {node: index for index, node in enumerate(self._order)}
+        # Node number -> immediate dominator number
+        self._idoms = self._compute_idoms(prev_cb)
+        # Dominator tree preorder/postorder numbers, computed on demand
+        self._tree_pre = None
+        self._tree_post = None
+
+    @staticmethod
+    def _reverse_postorder(head, next_cb):
+        """Return the list of nodes reachable from @head, in reverse
+        postorder"""
+        postorder = []
+        done = set([head])
+        todo = [(head, iter(next_cb(head)))]
+        while todo:
+            node, sons = todo[-1]
+            for son in sons:
+                if son not in done:
+                    done.add(son)
+                    todo.append((son, iter(next_cb(son))))
+                    break
+            else:
+                todo.pop()
+                postorder.append(node)
+        postorder.reverse()
+        return postorder
+
+    def _compute_idoms(self, prev_cb):
+        """Return the immediate dominator number of each node number. The
+        head is its own immediate dominator"""
+        index = self._index
+        preds = [[index[pred] for pred in prev_cb(node) if pred in index]
+                 for node in self._order]
+        idoms = [None] * len(self._order)
+        idoms[0] = 0
+
+        changed = True
+        while changed:
+            changed = False
+            for node in xrange(1, len(idoms)):
+                new_idom = None
+                for pred in preds[node]:
+                    if idoms[pred] is None:
+                        # Not yet processed
+                        continue
+                    if new_idom is None:
+                        new_idom = pred
+                        continue
+                    # Intersect the two dominator paths
+                    finger = pred
+                    while finger != new_idom:
+                        while finger > new_idom:
+                            finger = idoms[finger]
+                        while new_idom > finger:
+                            new_idom = idoms[new_idom]
+                if idoms[node] != new_idom:
+                    idoms[node] = new_idom
+                    changed = True
+        return idoms
+
+    def _number_tree(self):
+        """Number the dominator tree nodes in preorder and postorder, to
+        answer dominance queries in constant time"""
+        sons = [[] for _ in self._order]
+        for node in xrange(1, len(self._order)):
+            sons[self._idoms[node]].append(node)
+
+        pre = [0] * len(self._order)
+        post = [0] * len(self._order)
+        counter = 0
+        todo = [(0, False)]
+        while todo:
+            node, is_done = todo.pop()
+            counter += 1
+            if is_done:
+                post[node] = counter
+                continue
+            pre[node] = counter
+            todo.append((node, True))
+            for son in sons[node]:
+                todo.append((son, False))
+        self._tree_pre, self._tree_post = pre, post
+
+    @property
+    def head(self):
+        "Head/leaf of the tree"
+        return self._head
+
+    def idom(self, node):
+        """Return the immediate dominator of @node, or None for the head"""
+        index = self._index[node]
+        if index == 0:
+            return None
+        return self._order[self._idoms[index]]
+
+    def walk(self, node):
+        """Return an iterator on @node's dominators, from the nearest to the
+        head. @node itself is not returned"""
+        index = self._index[node]
+        while index != 0:
+            index = self._idoms[index]
+            yield self._order[index]
+
+    def dominates(self, dominator, node):
+        """Return True iff @dominator dominates @node (a node dominates
+        itself)"""
+        if dominator not in self._index or node not in self._index:
+            return False
+        if self._tree_pre is None:
+            self._number_tree()
+        dom_index = self._index[dominator]
+        index = self._index[node]
+        return (self._tree_pre[dom_index] <= self._tree_pre[index] and
+                self._tree_post[index] <= self._tree_post[dom_index])
+
+    def immediate_dominators(self):
+        """Return a dictionnary node -> immediate dominator. The head is not
+        a key"""
+        order = self._order
+        return {order[index]: order[idom]
+                for index, idom in enumerate(self._idoms) if index != 0}
+
+    def __getitem__(self, node):
+        dominators = set(self.walk(node))
+        dominators.add(node)
+        return dominators
+
+    def __contains__(self, node):
+        return node in self._index
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __len__(self):
+        return len(self._order)
@@ -1,3 +1,5 @@
+from bisect import bisect_left, bisect_right
+
 INT_EQ = 0      # Equivalent
 INT_B_IN_A = 1  # B in A
 INT_A_IN_B = -1 # A in B
@@ -6,6 +8,9 @@ INT_JOIN = 3    # Overlap
 INT_JOIN_AB = 4 # B starts at the end of A
 INT_JOIN_BA = 5 # A starts at the end of B
 
+# Greater than any bound, used for bisection
+_INF = float("inf")
+
 
 def cmp_interval(inter1, inter2):
     """Compare @inter1 and @inter2 and returns the associated INT_* case
@@ -33,7 +38,16 @@ def cmp_interval(inter1, inter2):
 class interval(object):
     """Stands for intervals with integer bounds
 
-    Offers common methods to work with interval"""
+    Offers common methods to work with interval
+
+    Bounds are kept canonical (sorted, disjoint and not contiguous) in a
+    list of chunks, each chunk being a sorted list of at most 2 * _LOAD
+    (start, stop) tuples. Lookups are done by bisection, and in-place updates
+    only touch the chunks involved, so they cost O(log n) plus the chunk
+    size"""
+
+    # Chunk target size
+    _LOAD = 256
 
     def __init__(self, bounds=None):
         """Instance an interval object
@@ -43,14 +57,36 @@ class interval(object):
             bounds = []
         elif isinstance(bounds, interval):
             bounds = bounds.intervals
-        self.is_cannon = False
-        self.intervals = bounds
-        self.cannon()
+        self.is_cannon = True
+        self._set_intervals(interval.cannon_list(bounds))
+
+    def _set_intervals(self, intervals):
+        """Load the canonical list of (int, int) @intervals"""
+        load = self._LOAD
+        self._chunks = [intervals[index:index + load]
+                        for index in xrange(0, len(intervals), load)]
+        self._maxes = [chunk[-1][1] for chunk in self._chunks]
+
+    @property
+    def intervals(self):
+        """Sorted list of disjoint (start, stop) bounds"""
+        if len(self._chunks) == 1:
+            return list(self._chunks[0])
+        return [inter for chunk in self._chunks for inter in chunk]
+
+    @intervals.setter
+    def intervals(self, bounds):
+        self._set_intervals(interval.cannon_list(bounds))
 
     def __iter__(self):
         """Iterate on intervals"""
-        for inter in self.intervals:
-            yield inter
+        for chunk in self._chunks:
+            for inter in chunk:
+                yield inter
+
+    def __len__(self):
+        """Number of disjoint intervals"""
+        return sum(len(chunk) for chunk in self._chunks)
 
     @staticmethod
     def cannon_list(tmp):
@@ -86,140 +122,199 @@ class interval(object):
         return out[::-1]
 
     def cannon(self):
-        "Apply .cannon_list() on self contained intervals"
-        if self.is_cannon is True:
+        "Intervals are always kept cannonized"
+        return
+
+    def copy(self):
+        "Return a copy of self"
+        new = interval()
+        new._chunks = [list(chunk) for chunk in self._chunks]
+        new._maxes = list(self._maxes)
+        return new
+
+    def _find(self, value):
+        """Return the position (chunk index, index in chunk) of the first
+        interval whose stop is greater or equal to @value, or
+        (len(chunks), 0) if there is none"""
+        chunk_nb = bisect_left(self._maxes, value)
+        if chunk_nb == len(self._chunks):
+            return chunk_nb, 0
+        chunk = self._chunks[chunk_nb]
+        index = bisect_right(chunk, (value, _INF)) - 1
+        if index < 0 or chunk[index][1] < value:
+            index += 1
+        return chunk_nb, index
+
+    def _next(self, chunk_nb, index):
+        """Return the position following (@chunk_nb, @index)"""
+        index += 1
+        if index == len(self._chunks[chunk_nb]):
+            return chunk_nb + 1, 0
+        return chunk_nb, index
+
+    def _replace(self, start_pos, stop_pos, items):
+        """Replace intervals from position @start_pos (included) to
+        @stop_pos (excluded) by the sorted list @items"""
+        chunks, maxes = self._chunks, self._maxes
+        chunk_nb, index = start_pos
+        stop_chunk_nb, stop_index = stop_pos
+
+        if chunk_nb == len(chunks):
+            # Append at the end
+            if not items:
+                return
+            if not chunks:
+                chunks.append([])
+                maxes.append(None)
+            chunk_nb = len(chunks) - 1
+            chunks[chunk_nb].extend(items)
+        elif chunk_nb == stop_chunk_nb:
+            chunks[chunk_nb][index:stop_index] = items
+        else:
+            # Merge the chunks involved
+            new_chunk = chunks[chunk_nb][:index] + items
+            if stop_chunk_nb < len(chunks):
+                new_chunk += chunks[stop_chunk_nb][stop_index:]
+                stop_chunk_nb += 1
+            chunks[chunk_nb:stop_chunk_nb] = [new_chunk]
+            maxes[chunk_nb:stop_chunk_nb] = [None]
+
+        # Update the modified chunk
+        chunk = chunks[chunk_nb]
+        if not chunk:
+            del chunks[chunk_nb]
+            del maxes[chunk_nb]
             return
-        self.intervals = interval.cannon_list(self.intervals)
-        self.is_cannon = True
+        maxes[chunk_nb] = chunk[-1][1]
+        load = self._LOAD
+        if len(chunk) > 2 * load:
+            new_chunks = [chunk[index:index + load]
+                          for index in xrange(0, len(chunk), load)]
+            chunks[chunk_nb:chunk_nb + 1] = new_chunks
+            maxes[chunk_nb:chunk_nb + 1] = [new_chunk[-1][1]
+                                            for new_chunk in new_chunks]
+
+    def add(self, start, stop):
+        """In-place union with [@start, @stop]"""
+        if start > stop:
+            return
+        first_pos = pos = self._find(start - 1)
+        chunks = self._chunks
+        while pos[0] < len(chunks):
+            cur_start, cur_stop = chunks[pos[0]][pos[1]]
+            if cur_start > stop + 1:
+                break
+            start = min(start, cur_start)
+            stop = max(stop, cur_stop)
+            pos = self._next(*pos)
+        self._replace(first_pos, pos, [(start, stop)])
+
+    def remove(self, start, stop):
+        """In-place removal of [@start, @stop]"""
+        if start > stop:
+            return
+        first_pos = pos = self._find(start)
+        chunks = self._chunks
+        items = []
+        while pos[0] < len(chunks):
+            cur_start, cur_stop = chunks[pos[0]][pos[1]]
+            if cur_start > stop:
+                break
+            if cur_start < start:
+                items.append((cur_start, start - 1))
+            if cur_stop > stop:
+                items.append((stop + 1, cur_stop))
+            pos = self._next(*pos)
+        if pos == first_pos:
+            return
+        self._replace(first_pos, pos, items)
+
+    def _overlapping(self, start, stop):
+        """Iterate on intervals overlapping [@start, @stop]"""
+        pos = self._find(start)
+        chunks = self._chunks
+        while pos[0] < len(chunks):
+            inter = chunks[pos[0]][pos[1]]
+            if inter[0] > stop:
+                break
+            yield inter
+            pos = self._next(*pos)
 
     def __repr__(self):
-        if self.intervals:
+        if self._chunks:
             o = " U ".join(["[0x%X 0x%X]" % (x[0], x[1])
-                           for x in self.intervals])
+                           for x in self])
         else:
             o = "[]"
         return o
 
     def __contains__(self, other):
         if isinstance(other, interval):
-            for intervalB in other.intervals:
-                is_in = False
-                for intervalA in self.intervals:
-                    if cmp_interval(intervalA, intervalB) in [INT_EQ, INT_B_IN_A]:
-                        is_in = True
-                        break
-                if not is_in:
+            for start, stop in other:
+                chunk_nb, index = self._find(start)
+                if chunk_nb == len(self._chunks):
+                    return False
+                cur_start, cur_stop = self._chunks[chunk_nb][index]
+                if not cur_start <= start <= stop <= cur_stop:
                     return False
             return True
         else:
-            for intervalA in self.intervals:
-                if intervalA[0] <= other <= intervalA[1]:
-                    return True
-            return False
+            chunk_nb, index = self._find(other)
+            if chunk_nb == len(self._chunks):
+                return False
+            return self._chunks[chunk_nb][index][0] <= other
 
     def __eq__(self, i):
         return self.intervals == i.intervals
 
+    def __ne__(self, i):
+        return not self.__eq__(i)
+
     def __add__(self, i):
+        out = self.copy()
+        out += i
+        return out
+
+    def __iadd__(self, i):
         if isinstance(i, interval):
             i = i.intervals
-        i = interval(self.intervals + i)
-        return i
+        for start, stop in i:
+            self.add(start, stop)
+        return self
 
     def __sub__(self, v):
-        to_test = self.intervals[:]
-        i = -1
-        to_del = v.intervals[:]
-        while i < len(to_test) - 1:
-            i += 1
-            x = to_test[i]
-            if x[0] > x[1]:
-                del to_test[i]
-                i -= 1
-                continue
+        out = self.copy()
+        out -= v
+        return out
 
-            while to_del and to_del[0][1] < x[0]:
-                del to_del[0]
-
-            for y in to_del:
-                if y[0] > x[1]:
-                    break
-                rez = cmp_interval(x, y)
-                if rez == INT_DISJOIN:
-                    continue
-                elif rez == INT_EQ:
-                    del to_test[i]
-                    i -= 1
-                    break
-                elif rez == INT_A_IN_B:
-                    del to_test[i]
-                    i -= 1
-                    break
-                elif rez == INT_B_IN_A:
-                    del to_test[i]
-                    i1 = (x[0], y[0] - 1)
-                    i2 = (y[1] + 1, x[1])
-                    to_test[i:i] = [i1, i2]
-                    i -= 1
-                    break
-                elif rez in [INT_JOIN_AB, INT_JOIN_BA]:
-                    continue
-                elif rez == INT_JOIN:
-                    del to_test[i]
-                    if x[0] < y[0]:
-                        to_test[i:i] = [(x[0], y[0] - 1)]
-                    else:
-                        to_test[i:i] = [(y[1] + 1, x[1])]
-                    i -= 1
-                    break
-                else:
-                    raise ValueError('unknown state', rez)
-        return interval(to_test)
+    def __isub__(self, v):
+        for start, stop in v.intervals:
+            self.remove(start, stop)
+        return self
 
     def __and__(self, v):
+        # Look for the intervals of the bigger one overlapping the smaller one
+        small, big = (self, v) if len(self._chunks) <= len(v._chunks) \
+            else (v, self)
         out = []
-        for x in self.intervals:
-            if x[0] > x[1]:
-                continue
-            for y in v.intervals:
-                rez = cmp_interval(x, y)
-
-                if rez == INT_DISJOIN:
-                    continue
-                elif rez == INT_EQ:
-                    out.append(x)
-                    continue
-                elif rez == INT_A_IN_B:
-                    out.append(x)
-                    continue
-                elif rez == INT_B_IN_A:
-                    out.append(y)
-                    continue
-                elif rez == INT_JOIN_AB:
-                    continue
-                elif rez == INT_JOIN_BA:
-                    continue
-                elif rez == INT_JOIN:
-                    if x[0] < y[0]:
-                        out.append((y[0], x[1]))
-                    else:
-                        out.append((x[0], y[1]))
-                    continue
-                else:
-                    raise ValueError('unknown state', rez)
-        return interval(out)
+        for start, stop in small:
+            for cur_start, cur_stop in big._overlapping(start, stop):
+                out.append((max(start, cur_start), min(stop, cur_stop)))
+        new = interval()
+        new._set_intervals(out)
+        return new
 
     def hull(self):
         "Return the first and the last bounds of intervals"
-        if not self.intervals:
+        if not self._chunks:
             return None, None
-        return self.intervals[0][0], self.intervals[-1][1]
+        return self._chunks[0][0][0], self._chunks[-1][-1][1]
 
 
     @property
     def empty(self):
         """Return True iff the interval is empty"""
-        return not self.intervals
+        return not self._chunks
 
     def show(self, img_x=1350, img_y=20, dry_run=False):
         """
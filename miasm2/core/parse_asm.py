@@ -102,27 +102,20 @@ STATE_NO_BLOC = 0
 STATE_IN_BLOC = 1
 
 
-def parse_txt(mnemo, attrib, txt, symbol_pool=None):
-    """Parse an assembly listing. Returns a couple (blocks, symbol_pool), where
-    blocks is a list of asm_bloc and symbol_pool the associated asm_symbol_pool
+def parse_lines(mnemo, attrib, lines, symbol_pool):
+    """Parse the lines of an assembly listing, one at a time. Yields labels,
+    asm_raw, directives and instructions
 
     @mnemo: architecture used
     @attrib: architecture attribute
-    @txt: assembly listing
-    @symbol_pool: (optional) the asm_symbol_pool instance used to handle labels
-    of the listing
+    @lines: iterable of assembly lines (list, file object, ...)
+    @symbol_pool: the asm_symbol_pool instance used to handle labels of the
+    listing
 
     """
 
-    if symbol_pool is None:
-        symbol_pool = asmbloc.asm_symbol_pool()
-
-    C_NEXT = asmbloc.asm_constraint.c_next
-    C_TO = asmbloc.asm_constraint.c_to
-
-    lines = []
-    # parse each line
-    for line in txt.split('\n'):
+    for line in lines:
+        line = line.rstrip('\r\n')
         # empty
         if EMPTY_RE.match(line):
             continue
@@ -137,7 +130,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
         if match_re:
             label_name = match_re.group(1)
             label = symbol_pool.getby_name_create(label_name)
-            lines.append(label)
+            yield label
             continue
         # directive
         if DIRECTIVE_START_RE.match(line):
@@ -152,7 +145,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 raw = raw.decode('string_escape')
                 if directive == 'string':
                     raw += "\x00"
-                lines.append(asmbloc.asm_raw(raw))
+                yield asmbloc.asm_raw(raw)
                 continue
             if directive == 'ustring':
                 # XXX HACK
@@ -160,7 +153,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 raw = line[line.find(r'"') + 1:line.rfind(r'"')] + "\x00"
                 raw = raw.decode('string_escape')
                 raw = "".join([string + '\x00' for string in raw])
-                lines.append(asmbloc.asm_raw(raw))
+                yield asmbloc.asm_raw(raw)
                 continue
             if directive in declarator:
                 data_raw = line[match_re.end():].split(' ', 1)[1]
@@ -182,20 +175,20 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
 
                 raw_data = asmbloc.asm_raw(expr_list)
                 raw_data.element_size = size
-                lines.append(raw_data)
+                yield raw_data
                 continue
             if directive == 'comm':
                 # TODO
                 continue
             if directive == 'split':  # custom command
-                lines.append(DirectiveSplit())
+                yield DirectiveSplit()
                 continue
             if directive == 'dontsplit':  # custom command
-                lines.append(DirectiveDontSplit())
+                yield DirectiveDontSplit()
                 continue
             if directive == "align":
                 align_value = int(line[match_re.end():], 0)
-                lines.append(DirectiveAlign(align_value))
+                yield DirectiveAlign(align_value)
                 continue
             if directive in ['file', 'intel_syntax', 'globl', 'local',
                              'type', 'size', 'align', 'ident', 'section']:
@@ -210,7 +203,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
         if match_re:
             label_name = match_re.group(1)
             label = symbol_pool.getby_name_create(label_name)
-            lines.append(label)
+            yield label
             continue
 
         # code
@@ -224,55 +217,75 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
 
         if instr.dstflow():
             instr.dstflow2label(symbol_pool)
-        lines.append(instr)
+        yield instr
+
 
-    asmbloc.log_asmbloc.info("___pre asm oki___")
-    # make blocks
+def parse_txt_stream(mnemo, attrib, lines, symbol_pool):
+    """Parse an assembly listing given as an iterable of lines (list, file
+    object, ...) and yield its asm_bloc as soon as they are complete.
+    Directives (.align, .split, .dontsplit) are handled on the fly: only the
+    current block is kept in memory
+
+    @mnemo: architecture used
+    @attrib: architecture attribute
+    @lines: iterable of assembly lines
+    @symbol_pool: the asm_symbol_pool instance used to handle labels of the
+    listing
+
+    """
+
+    C_NEXT = asmbloc.asm_constraint.c_next
+    C_TO = asmbloc.asm_constraint.c_to
 
     cur_block = None
     state = STATE_NO_BLOC
-    i = 0
-    blocks = []
     block_to_nlink = None
-    block_may_link = False
     delayslot = 0
-    while i < len(lines):
-        if delayslot:
-            if delayslot == 0:
-                state = STATE_NO_BLOC
-            else:
-                delayslot -= 1
-        line = lines[i]
-        # no current block
-        if state == STATE_NO_BLOC:
-            if isinstance(line, DirectiveDontSplit):
-                block_to_nlink = cur_block
-                i += 1
-                continue
-            elif isinstance(line, DirectiveSplit):
+    for line in parse_lines(mnemo, attrib, lines, symbol_pool):
+        # A line ending a block is processed again as the beginning of the
+        # next one
+        while True:
+            if delayslot:
+                if delayslot == 0:
+                    state = STATE_NO_BLOC
+                else:
+                    delayslot -= 1
+            # no current block
+            if state == STATE_NO_BLOC:
+                if isinstance(line, DirectiveDontSplit):
+                    block_to_nlink = cur_block
+                    break
+                elif isinstance(line, DirectiveSplit):
+                    block_to_nlink = None
+                    break
+                if not isinstance(line, asmbloc.asm_label):
+                    # First line must be a label. If it's not the case,
+                    # generate it.
+                    label = guess_next_new_label(symbol_pool)
+                    new_block = asmbloc.asm_bloc(label,
+                                                 alignment=mnemo.alignment)
+                    again = True
+                else:
+                    new_block = asmbloc.asm_bloc(line,
+                                                 alignment=mnemo.alignment)
+                    again = False
+                # Generate the current bloc
+                state = STATE_IN_BLOC
+                if block_to_nlink:
+                    block_to_nlink.addto(
+                        asmbloc.asm_constraint(new_block.label,
+                                               C_NEXT))
                 block_to_nlink = None
-                i += 1
-                continue
-            elif not isinstance(line, asmbloc.asm_label):
-                # First line must be a label. If it's not the case, generate
-                # it.
-                label = guess_next_new_label(symbol_pool)
-                cur_block = asmbloc.asm_bloc(label, alignment=mnemo.alignment)
-            else:
-                cur_block = asmbloc.asm_bloc(line, alignment=mnemo.alignment)
-                i += 1
-            # Generate the current bloc
-            blocks.append(cur_block)
-            state = STATE_IN_BLOC
-            if block_to_nlink:
-                block_to_nlink.addto(
-                    asmbloc.asm_constraint(cur_block.label,
-                                           C_NEXT))
-            block_to_nlink = None
-            continue
+                # Blocks are complete once the next one is linked to them
+                if cur_block is not None:
+                    asmbloc.log_asmbloc.info(cur_block)
+                    yield cur_block
+                cur_block = new_block
+                if again:
+                    continue
+                break
 
-        # in block
-        elif state == STATE_IN_BLOC:
+            # in block
             if isinstance(line, DirectiveSplit):
                 state = STATE_NO_BLOC
                 block_to_nlink = None
@@ -296,8 +309,7 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                 cur_block.addline(line)
                 block_to_nlink = cur_block
                 if not line.breakflow():
-                    i += 1
-                    continue
+                    break
                 if delayslot:
                     raise RuntimeError("Cannot have breakflow in delayslot")
                 if line.dstflow():
@@ -316,8 +328,28 @@ def parse_txt(mnemo, attrib, txt, symbol_pool=None):
                     state = STATE_NO_BLOC
             else:
                 raise RuntimeError("unknown class %s" % line.__class__)
-        i += 1
+            break
+
+    if cur_block is not None:
+        asmbloc.log_asmbloc.info(cur_block)
+        yield cur_block
+
+
+def parse_txt(mnemo, attrib, txt, symbol_pool=None):
+    """Parse an assembly listing. Returns a couple (blocks, symbol_pool), where
+    blocks is a list of asm_bloc and symbol_pool the associated asm_symbol_pool
+
+    @mnemo: architecture used
+    @attrib: architecture attribute
+    @txt: assembly listing
+    @symbol_pool: (optional) the asm_symbol_pool instance used to handle labels
+    of the listing
+
+    """
+
+    if symbol_pool is None:
+        symbol_pool = asmbloc.asm_symbol_pool()
 
-    for block in blocks:
-        asmbloc.log_asmbloc.info(block)
+    blocks = list(parse_txt_stream(mnemo, attrib, txt.split('\n'),
+                                   symbol_pool))
     return blocks, symbol_pool
@@ -1,5 +1,5 @@
 import struct
-import inspect
+import sys
 import UserDict
 from operator import itemgetter
 
@@ -49,7 +49,7 @@ class keydefaultdict(collections.defaultdict):
         return value
 
 def whoami():
-    return inspect.stack()[2][3]
+    return sys._getframe(2).f_code.co_name
 
 
 class BoundedDict(UserDict.DictMixin):
@@ -143,3 +143,62 @@ class BoundedDict(UserDict.DictMixin):
         if self._delete_cb:
             for key in self._data:
                 self._delete_cb(key)
+
+
+def assemble_at(machine, asm, addrs):
+    """Assemble the @asm source and return (code, labels)
+
+    @machine: Machine instance of the targeted architecture
+    @asm: assembly source, with its labels
+    @addrs: dictionnary label name -> address, used to place the snippets
+    @code: assembled bytes, starting at the lowest address of @addrs
+    @labels: dictionnary label name -> address of every resolved label
+    """
+    # Imported here, as asmbloc depends on this module
+    from miasm2.core import parse_asm, asmbloc
+
+    attrib = machine.ir().attrib
+    blocks, symbol_pool = parse_asm.parse_txt(machine.mn, attrib, asm)
+    for name, addr in addrs.iteritems():
+        symbol_pool.set_offset(symbol_pool.getby_name(name), addr)
+    patches = asmbloc.asm_resolve_final(machine.mn, blocks, symbol_pool)
+
+    base = min(addrs.itervalues())
+    code = []
+    for offset, data in sorted(patches.iteritems()):
+        start = offset - base
+        if start > len(code):
+            code += ["\x00"] * (start - len(code))
+        code[start:start + len(data)] = data
+    labels = dict((label.name, label.offset) for label in symbol_pool.items
+                  if label.offset is not None)
+    return "".join(code), labels
+
+
+def jitter_at(machine, jit_type, code, code_addr, ret_addr=None):
+    """Return a new jitter running @code
+
+    @machine: Machine instance of the targeted architecture
+    @jit_type: jitter engine (tcc, llvm, python)
+    @code: bytes mapped at @code_addr, along with a stack
+    @ret_addr: (optional) address stopping the execution once reached
+    """
+    from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+    jitter = machine.jitter(jit_type)
+    jitter.vm.add_memory_page(code_addr, PAGE_READ | PAGE_WRITE, code)
+    jitter.init_stack()
+    if ret_addr is not None:
+        jitter.add_breakpoint(ret_addr, lambda _: False)
+    return jitter
+
+
+def call_at(jitter, addr, ret_addr, **budget):
+    """Run a 32 bits @jitter from @addr, as a call returning on @ret_addr,
+    and return the continue_run result
+
+    @budget: (optional) execution budget, as in init_run
+    """
+    jitter.push_uint32_t(ret_addr)
+    jitter.init_run(addr, **budget)
+    return jitter.continue_run()
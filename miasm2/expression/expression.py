@@ -167,6 +167,14 @@ class Expr(object):
             self._hash = self._exprhash()
         return self._hash
 
+    def __getstate__(self):
+        # Cached hash and representation may depend on sub-objects identity
+        # (asm_label), which is not preserved through serialization
+        state = self.__dict__.copy()
+        state.pop("_hash", None)
+        state.pop("_repr", None)
+        return state
+
     def pre_eq(self, other):
         """Return True if ids are equal;
         False if instances are obviously not equal
@@ -308,11 +308,13 @@ def Expr2C(ir_arch, l, exprs, gen_exception_code=False):
             e = set_pc(ir_arch, l.offset & mask_int)
             s1 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
             s1 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%(l.offset & mask_int)
+            s1 += ';\n    BUDGET_JIT_REFUND()'
             out.append(code_exception_fetch_mem_at_instr_noautomod % s1)
         if set_exception_flags:
             e = set_pc(ir_arch, l.offset & mask_int)
             s1 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
             s1 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%(l.offset & mask_int)
+            s1 += ';\n    BUDGET_JIT_REFUND()'
             out.append(code_exception_at_instr_noautomod % s1)
 
     for i in id_to_update:
@@ -332,6 +334,7 @@ def Expr2C(ir_arch, l, exprs, gen_exception_code=False):
                 e = set_pc(ir_arch, l.offset & mask_int)
                 s1 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
                 s1 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%(l.offset & mask_int)
+                s1 += ';\n    BUDGET_JIT_REFUND()'
                 e = set_pc(ir_arch, (l.offset + l.l) & mask_int)
                 s2 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
                 s2 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%((l.offset + l.l) & mask_int)
@@ -347,6 +350,9 @@ def Expr2C(ir_arch, l, exprs, gen_exception_code=False):
             e = set_pc(ir_arch, offset & mask_int)
             s1 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
             s1 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%(offset & mask_int)
+            if offset == l.offset:
+                # The instruction will be executed again
+                s1 += ';\n    BUDGET_JIT_REFUND()'
             post_instr.append(
                 code_exception_fetch_mem_post_instr_noautomod % (s1))
 
@@ -387,7 +393,9 @@ def ir2C(ir_arch, irbloc, lbl_done,
             e = set_pc(ir_arch, l.offset & mask_int)
             s1 = "%s" % translator.from_expr(patch_c_id(ir_arch.arch, e))
             s1 += ';\n    Resolve_dst(BlockDst, 0x%X, 0)'%(l.offset & mask_int)
+            out.append(['BUDGET_JIT_INSTR();'])
             out.append([pre_instr_test_exception % (s1)])
+            out.append(['TRACE_JIT_INSTR(0x%X);' % (l.offset & mask_int)])
             lbl_done.add(l.offset)
 
             if log_regs:
@@ -426,6 +434,17 @@ def irblocs2C(ir_arch, resolvers, label, irblocs,
 
     out.append("void* local_labels[] = {%s};"%(', '.join(["&&%s"%l.name for l in lbls_local])))
 
+    # Trace and count the block execution: address, instructions count and
+    # size. Then check the time budget
+    lines = dict((line.offset, line) for irbloc in irblocs
+                 for line in irbloc.lines)
+    size = max(line.offset + line.l
+               for line in lines.itervalues()) - label.offset
+    out.append("TRACE_JIT_BLOCK(0x%X, %d);" % (label.offset & mask_int,
+                                               len(lines)))
+    out.append("COVERAGE_JIT_BLOCK(0x%X, %d, %d);" % (label.offset & mask_int,
+                                                      len(lines), size))
+    out.append("BUDGET_JIT_BLOCK();")
     out.append("goto %s;" % label.name)
     bloc_labels = [x.label for x in irblocs]
     assert label in bloc_labels
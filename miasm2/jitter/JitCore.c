@@ -55,6 +55,92 @@ PyObject * JitCpu_set_jitter(JitCpu *self, PyObject *value, void *closure)
 }
 
 
+/* Return the tuple of the values of the registers named in the sequence
+   @args[0] */
+PyObject* JitCpu_get_regs(JitCpu* self, PyObject* args)
+{
+	PyObject *names;
+	PyObject *seq;
+	PyObject *values;
+	PyObject *value;
+	Py_ssize_t i, count;
+
+	if (!PyArg_ParseTuple(args, "O", &names))
+		return NULL;
+	seq = PySequence_Fast(names, "names must be a sequence");
+	if (!seq)
+		return NULL;
+
+	count = PySequence_Fast_GET_SIZE(seq);
+	values = PyTuple_New(count);
+	if (!values)
+		goto out;
+	for (i = 0; i < count; i++){
+		value = PyObject_GetAttr((PyObject*)self,
+					 PySequence_Fast_GET_ITEM(seq, i));
+		if (!value){
+			Py_CLEAR(values);
+			goto out;
+		}
+		PyTuple_SET_ITEM(values, i, value);
+	}
+out:
+	Py_DECREF(seq);
+	return values;
+}
+
+/* Set the registers from the mapping name -> value @args[0] */
+PyObject* JitCpu_set_regs(JitCpu* self, PyObject* args)
+{
+	PyObject *mapping;
+	PyObject *d_key, *d_value;
+	Py_ssize_t pos = 0;
+
+	if (!PyArg_ParseTuple(args, "O!", &PyDict_Type, &mapping))
+		return NULL;
+	while (PyDict_Next(mapping, &pos, &d_key, &d_value)){
+		if (PyObject_SetAttr((PyObject*)self, d_key, d_value) < 0)
+			return NULL;
+	}
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+/* Return a copy of the @size bytes of the raw cpu state */
+PyObject* JitCpu_get_state(JitCpu* self, size_t size)
+{
+	return PyString_FromStringAndSize((char*)self->cpu, (Py_ssize_t)size);
+}
+
+/* Restore the @size bytes of the raw cpu state from the string in @args */
+PyObject* JitCpu_set_state(JitCpu* self, PyObject* args, size_t size)
+{
+	char* state;
+	int length;
+
+	if (!PyArg_ParseTuple(args, "s#", &state, &length))
+		return NULL;
+	if ((size_t)length != size)
+		RAISE(PyExc_ValueError, "bad cpu state size");
+
+	memcpy(self->cpu, state, size);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+/* Return a writable memoryview on the @size bytes of the raw cpu state. The
+   state lives as long as the JitCpu */
+PyObject* JitCpu_get_regs_view(JitCpu* self, size_t size)
+{
+	Py_buffer buffer;
+
+	if (PyBuffer_FillInfo(&buffer, NULL, self->cpu, (Py_ssize_t)size, 0,
+			      PyBUF_FULL) < 0)
+		return NULL;
+	return PyMemoryView_FromBuffer(&buffer);
+}
+
+
 void Resolve_dst(block_id* b, uint64_t addr, uint64_t is_local)
 {
 	b->address = addr;
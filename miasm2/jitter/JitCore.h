@@ -111,6 +111,11 @@ PyObject * JitCpu_get_vmmngr(JitCpu *self, void *closure);
 PyObject * JitCpu_set_vmmngr(JitCpu *self, PyObject *value, void *closure);
 PyObject * JitCpu_get_jitter(JitCpu *self, void *closure);
 PyObject * JitCpu_set_jitter(JitCpu *self, PyObject *value, void *closure);
+PyObject* JitCpu_get_regs(JitCpu* self, PyObject* args);
+PyObject* JitCpu_set_regs(JitCpu* self, PyObject* args);
+PyObject* JitCpu_get_state(JitCpu* self, size_t size);
+PyObject* JitCpu_set_state(JitCpu* self, PyObject* args, size_t size);
+PyObject* JitCpu_get_regs_view(JitCpu* self, size_t size);
 void Resolve_dst(block_id* BlockDst, uint64_t addr, uint64_t is_local);
 
 
@@ -129,6 +134,46 @@ PyObject* vm_get_mem(JitCpu *self, PyObject* args);
 
 
 #define VM_exception_flag (((VmMngr*)jitcpu->pyvm)->vm_mngr.exception_flags)
+#define VM_trace_flags (((VmMngr*)jitcpu->pyvm)->vm_mngr.trace.flags)
+
+/* Trace events emitted by the jitted code */
+#define TRACE_JIT_BLOCK(addr, count) do {				\
+		if (VM_trace_flags & TRACE_BLOCK)			\
+			trace_block(&((VmMngr*)jitcpu->pyvm)->vm_mngr,	\
+				    (addr), (count));			\
+	} while (0)
+
+#define TRACE_JIT_INSTR(addr) do {					\
+		if (VM_trace_flags & TRACE_INSTR)			\
+			trace_instr(&((VmMngr*)jitcpu->pyvm)->vm_mngr, (addr)); \
+	} while (0)
+
+/* Blocks executions counters */
+#define COVERAGE_JIT_BLOCK(addr, instrs, size) do {			\
+		if (((VmMngr*)jitcpu->pyvm)->vm_mngr.coverage.enabled)	\
+			coverage_block(&((VmMngr*)jitcpu->pyvm)->vm_mngr, \
+				       (addr), (instrs), (size));	\
+	} while (0)
+
+/* Execution budgets: the clock is checked on block entries, instructions
+   are counted before their execution */
+#define VM_budget_enabled (((VmMngr*)jitcpu->pyvm)->vm_mngr.budget.enabled)
+
+#define BUDGET_JIT_BLOCK() do {						\
+		if (VM_budget_enabled)					\
+			budget_block(&((VmMngr*)jitcpu->pyvm)->vm_mngr); \
+	} while (0)
+
+#define BUDGET_JIT_INSTR() do {						\
+		if (VM_budget_enabled)					\
+			budget_instr(&((VmMngr*)jitcpu->pyvm)->vm_mngr); \
+	} while (0)
+
+#define BUDGET_JIT_REFUND() do {					\
+		if (VM_budget_enabled)					\
+			budget_refund(&((VmMngr*)jitcpu->pyvm)->vm_mngr); \
+	} while (0)
+
 #define CPU_exception_flag (((vm_cpu_t*)jitcpu->cpu)->exception_flags)
 
 #define JIT_RET_EXCEPTION 1
@@ -161,6 +161,22 @@ PyObject* cpu_get_exception(JitCpu* self, PyObject* args)
 	return PyLong_FromUnsignedLongLong((uint64_t)(((vm_cpu_t*)self->cpu)->exception_flags));
 }
 
+PyObject* cpu_get_state(JitCpu* self, PyObject* args)
+{
+	return JitCpu_get_state(self, sizeof(vm_cpu_t));
+}
+
+PyObject* cpu_set_state(JitCpu* self, PyObject* args)
+{
+	return JitCpu_set_state(self, args, sizeof(vm_cpu_t));
+}
+
+PyObject* cpu_get_regs_view(JitCpu* self, PyObject* args)
+{
+	return JitCpu_get_regs_view(self, sizeof(vm_cpu_t));
+}
+
+
 
 
 
@@ -251,6 +267,17 @@ static PyMethodDef JitCpu_methods[] = {
 	 "X"},
 	{"get_exception", (PyCFunction)cpu_get_exception, METH_VARARGS,
 	 "X"},
+	{"get_state", (PyCFunction)cpu_get_state, METH_VARARGS,
+	 "X"},
+	{"set_state", (PyCFunction)cpu_set_state, METH_VARARGS,
+	 "X"},
+	{"get_regs", (PyCFunction)JitCpu_get_regs, METH_VARARGS,
+	 "get_regs(names): tuple of the values of the registers names"},
+	{"set_regs", (PyCFunction)JitCpu_set_regs, METH_VARARGS,
+	 "set_regs(dict): set the registers from a name -> value dict"},
+	{"get_regs_view", (PyCFunction)cpu_get_regs_view, METH_VARARGS,
+	 "Writable memoryview on the raw cpu state; register offsets are "
+	 "given by get_gpreg_offset_all"},
 	{"set_exception", (PyCFunction)cpu_set_exception, METH_VARARGS,
 	 "X"},
 	{"set_mem", (PyCFunction)vm_set_mem, METH_VARARGS,
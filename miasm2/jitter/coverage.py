@@ -0,0 +1,41 @@
+"""Blocks coverage export
+
+Coverage is exported in the drcov format (version 2) of DynamoRIO, as read by
+coverage visualisation tools (Lighthouse, ...):
+- a text header with the modules table (id, base, end, entry, checksum,
+  timestamp, path)
+- a binary table of the executed basic blocks: offset from the module base
+  (32 bits), size (16 bits), module id (16 bits)
+"""
+
+import struct
+
+BB_ENTRY = struct.Struct("<IHH")
+
+
+def write_drcov(fdesc, blocks, modules):
+    """Write the coverage of @blocks in the drcov format
+    @fdesc: output file object, opened in binary mode
+    @blocks: iterable of executed blocks (address, size)
+    @modules: list of (path, base, end) of the modules of interest; blocks
+    outside the modules are ignored
+    Return the number of blocks written"""
+
+    entries = []
+    for addr, size in blocks:
+        for mod_id, (_, base, end) in enumerate(modules):
+            if base <= addr < end:
+                entries.append(BB_ENTRY.pack(addr - base, min(size, 0xFFFF),
+                                             mod_id))
+                break
+
+    fdesc.write("DRCOV VERSION: 2\n")
+    fdesc.write("DRCOV FLAVOR: miasm\n")
+    fdesc.write("Module Table: version 2, count %d\n" % len(modules))
+    fdesc.write("Columns: id, base, end, entry, checksum, timestamp, path\n")
+    for mod_id, (path, base, end) in enumerate(modules):
+        fdesc.write("%3d, 0x%016x, 0x%016x, 0x%016x, 0x%08x, 0x%08x, %s\n" % (
+            mod_id, base, end, 0, 0, 0, path))
+    fdesc.write("BB Table: %d bbs\n" % len(entries))
+    fdesc.write("".join(entries))
+    return len(entries)
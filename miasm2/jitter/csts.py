@@ -11,6 +11,7 @@ EXCEPT_INT_XX = (1 << 2)
 EXCEPT_BREAKPOINT_INTERN = (1 << 10)
 
 EXCEPT_ACCESS_VIOL = ((1 << 14) | EXCEPT_DO_NOT_UPDATE_PC)
+EXCEPT_BUDGET = (1 << 20)
 # VM Mngr constants
 
 PAGE_READ = 1
@@ -20,3 +21,16 @@ PAGE_EXEC = 4
 BREAKPOINT_READ = 1
 BREAKPOINT_WRITE = 2
 
+
+# Execution trace events
+TRACE_BLOCK = 1
+TRACE_INSTR = 2
+TRACE_MEM_READ = 4
+TRACE_MEM_WRITE = 8
+TRACE_REGS = 16
+TRACE_MEM = TRACE_MEM_READ | TRACE_MEM_WRITE
+
+
+# Execution budgets
+BUDGET_INSTRUCTIONS = 1
+BUDGET_TIME = 2
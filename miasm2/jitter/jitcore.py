@@ -85,7 +85,7 @@ class JitCore(object):
     def add_bloc_to_mem_interval(self, vm, bloc):
         "Update vm to include bloc addresses in its memory range"
 
-        self.blocs_mem_interval += interval([(bloc.ad_min, bloc.ad_max - 1)])
+        self.blocs_mem_interval.add(bloc.ad_min, bloc.ad_max - 1)
 
         vm.reset_code_bloc_pool()
         for a, b in self.blocs_mem_interval:
@@ -188,7 +188,7 @@ class JitCore(object):
         mem_range = interval()
 
         for b in blocs:
-            mem_range += interval([(b.ad_min, b.ad_max - 1)])
+            mem_range.add(b.ad_min, b.ad_max - 1)
 
         return mem_range
 
@@ -258,5 +258,5 @@ class JitCore(object):
         self.addr_mod = interval()
 
     def automod_cb(self, addr=0, size=0):
-        self.addr_mod += interval([(addr, addr + size / 8 - 1)])
+        self.addr_mod.add(addr, addr + size / 8 - 1)
         return None
@@ -9,36 +9,53 @@ from miasm2.ir.symbexec import symbexec
 #                      Util methods for Python jitter                          #
 ################################################################################
 
-def update_cpu_from_engine(cpu, exec_engine):
-    """Updates @cpu instance according to new CPU values
+def get_cpu_symbols(cpu, exec_engine):
+    """Return the register symbols of @exec_engine which are fields of @cpu,
+    and the list of their names
     @cpu: JitCpu instance
     @exec_engine: symbexec instance"""
 
+    symbols = []
     for symbol in exec_engine.symbols:
         if isinstance(symbol, m2_expr.ExprId):
             if hasattr(cpu, symbol.name):
-                value = exec_engine.symbols.symbols_id[symbol]
-                if not isinstance(value, m2_expr.ExprInt):
-                    raise ValueError("A simplification is missing: %s" % value)
-
-                setattr(cpu, symbol.name, value.arg.arg)
+                symbols.append(symbol)
         else:
             raise NotImplementedError("Type not handled: %s" % symbol)
+    return symbols, [symbol.name for symbol in symbols]
 
 
-def update_engine_from_cpu(cpu, exec_engine):
+def update_cpu_from_engine(cpu, exec_engine, cpu_symbols=None):
+    """Updates @cpu instance according to new CPU values
+    @cpu: JitCpu instance
+    @exec_engine: symbexec instance
+    @cpu_symbols: (optional) result of get_cpu_symbols(@cpu, @exec_engine)"""
+
+    if cpu_symbols is None:
+        cpu_symbols = get_cpu_symbols(cpu, exec_engine)
+    symbols, names = cpu_symbols
+    symbols_id = exec_engine.symbols.symbols_id
+    values = {}
+    for symbol, name in zip(symbols, names):
+        value = symbols_id[symbol]
+        if not isinstance(value, m2_expr.ExprInt):
+            raise ValueError("A simplification is missing: %s" % value)
+        values[name] = value.arg.arg
+    cpu.set_regs(values)
+
+
+def update_engine_from_cpu(cpu, exec_engine, cpu_symbols=None):
     """Updates CPU values according to @cpu instance
     @cpu: JitCpu instance
-    @exec_engine: symbexec instance"""
+    @exec_engine: symbexec instance
+    @cpu_symbols: (optional) result of get_cpu_symbols(@cpu, @exec_engine)"""
 
-    for symbol in exec_engine.symbols:
-        if isinstance(symbol, m2_expr.ExprId):
-            if hasattr(cpu, symbol.name):
-                value = m2_expr.ExprInt(getattr(cpu, symbol.name),
-                                        symbol.size)
-                exec_engine.symbols.symbols_id[symbol] = value
-        else:
-            raise NotImplementedError("Type not handled: %s" % symbol)
+    if cpu_symbols is None:
+        cpu_symbols = get_cpu_symbols(cpu, exec_engine)
+    symbols, names = cpu_symbols
+    symbols_id = exec_engine.symbols.symbols_id
+    for symbol, value in zip(symbols, cpu.get_regs(names)):
+        symbols_id[symbol] = m2_expr.ExprInt(value, symbol.size)
 
 
 ################################################################################
@@ -53,6 +70,13 @@ class JitCore_Python(jitcore.JitCore):
         super(JitCore_Python, self).__init__(ir_arch, bs)
         self.symbexec = None
         self.ir_arch = ir_arch
+        # Register symbols of the symbexec mapped in the JitCpu
+        self.cpu_symbols = None
+        # Trace events to record, updated on each block
+        self.trace_flags = 0
+        # Memory reads already traced for the current IR instruction, as the
+        # symbexec evaluates the same ExprMem once per use
+        self.traced_reads = set()
 
     def load(self):
         "Preload symbols according to current architecture"
@@ -64,6 +88,7 @@ class JitCore_Python(jitcore.JitCore):
         self.symbexec = symbexec(self.ir_arch, symbols_init,
                                  func_read = self.func_read,
                                  func_write = self.func_write)
+        self.cpu_symbols = None
 
     def func_read(self, expr_mem):
         """Memory read wrapper for symbolic execution
@@ -72,9 +97,15 @@ class JitCore_Python(jitcore.JitCore):
         addr = expr_mem.arg.arg.arg
         size = expr_mem.size / 8
         value = self.cpu.get_mem(addr, size)
+        value = int(value[::-1].encode("hex"), 16)
+
+        if (self.trace_flags & csts.TRACE_MEM_READ and
+            (addr, size) not in self.traced_reads):
+            self.traced_reads.add((addr, size))
+            self.cpu.vmmngr.trace_mem(csts.TRACE_MEM_READ, addr, size,
+                                      value & 0xFFFFFFFFFFFFFFFF)
 
-        return m2_expr.ExprInt(int(value[::-1].encode("hex"), 16),
-                               expr_mem.size)
+        return m2_expr.ExprInt(value, expr_mem.size)
 
     def func_write(self, symb_exec, dest, data, mem_cache):
         """Memory read wrapper for symbolic execution
@@ -99,12 +130,22 @@ class JitCore_Python(jitcore.JitCore):
         # Write in VmMngr context
         self.cpu.set_mem(addr, content)
 
+        if self.trace_flags & csts.TRACE_MEM_WRITE:
+            self.cpu.vmmngr.trace_mem(csts.TRACE_MEM_WRITE, addr, size,
+                                      to_write & 0xFFFFFFFFFFFFFFFF)
+
     def jitirblocs(self, label, irblocs):
         """Create a python function corresponding to an irblocs' group.
         @label: the label of the irblocs
         @irblocs: a gorup of irblocs
         """
 
+        lines = dict((line.offset, line) for irb in irblocs
+                     for line in irb.lines)
+        instrs_count = len(lines)
+        bloc_size = max(line.offset + line.l
+                        for line in lines.itervalues()) - label.offset
+
         def myfunc(cpu, vmmngr):
             """Execute the function according to cpu and vmmngr states
             @cpu: JitCpu instance
@@ -120,6 +161,17 @@ class JitCore_Python(jitcore.JitCore):
 
             # Get exec engine
             exec_engine = self.symbexec
+            cpu_symbols = self.cpu_symbols
+
+            # Trace and count the block execution
+            trace_flags = self.trace_flags = vmmngr.get_trace_flags()
+            if trace_flags & csts.TRACE_BLOCK:
+                vmmngr.trace_block(label.offset, instrs_count)
+            vmmngr.coverage_block(label.offset, instrs_count, bloc_size)
+
+            # Check the time budget; instructions are counted if any budget
+            # is enabled
+            budget = vmmngr.budget_block()
 
             # For each irbloc inside irblocs
             while loop is True:
@@ -135,7 +187,7 @@ class JitCore_Python(jitcore.JitCore):
                 assert(loop is not False)
 
                 # Refresh CPU values according to @cpu instance
-                update_engine_from_cpu(cpu, exec_engine)
+                update_engine_from_cpu(cpu, exec_engine, cpu_symbols)
 
                 # Execute current ir bloc
                 for ir, line in zip(irb.irs, irb.lines):
@@ -146,31 +198,47 @@ class JitCore_Python(jitcore.JitCore):
 
                         # Log registers values
                         if self.log_regs:
-                            update_cpu_from_engine(cpu, exec_engine)
+                            update_cpu_from_engine(cpu, exec_engine, cpu_symbols)
                             cpu.dump_gpregs()
 
                         # Log instruction
                         if self.log_mn:
                             print "%08x %s" % (line.offset, line)
 
+                        # Trace instruction
+                        if trace_flags & csts.TRACE_INSTR:
+                            if trace_flags & csts.TRACE_REGS:
+                                update_cpu_from_engine(cpu, exec_engine,
+                                                       cpu_symbols)
+                            vmmngr.trace_instr(line.offset)
+
+                        # Count the instruction, or raise EXCEPT_BUDGET
+                        if budget:
+                            vmmngr.budget_instr()
+
                         # Check for memory exception
                         if (vmmngr.get_exception() != 0):
-                            update_cpu_from_engine(cpu, exec_engine)
+                            update_cpu_from_engine(cpu, exec_engine, cpu_symbols)
                             return line.offset
 
                     # Eval current instruction (in IR)
+                    if trace_flags & csts.TRACE_MEM_READ:
+                        self.traced_reads.clear()
                     exec_engine.eval_ir(ir)
 
                     # Check for memory exception which do not update PC
                     if (vmmngr.get_exception() & csts.EXCEPT_DO_NOT_UPDATE_PC != 0):
-                        update_cpu_from_engine(cpu, exec_engine)
+                        update_cpu_from_engine(cpu, exec_engine, cpu_symbols)
+                        # The instruction will be executed again
+                        if budget:
+                            vmmngr.budget_refund()
                         return line.offset
 
                 # Get next bloc address
                 ad = expr_simp(exec_engine.eval_expr(self.ir_arch.IRDst))
 
                 # Updates @cpu instance according to new CPU values
-                update_cpu_from_engine(cpu, exec_engine)
+                update_cpu_from_engine(cpu, exec_engine, cpu_symbols)
 
                 # Manage resulting address
                 if isinstance(ad, m2_expr.ExprInt):
@@ -194,6 +262,8 @@ class JitCore_Python(jitcore.JitCore):
         fc_ptr = self.lbl2jitbloc[label]
 
         self.cpu = cpu
+        if self.cpu_symbols is None:
+            self.cpu_symbols = get_cpu_symbols(cpu, self.symbexec)
 
         # Execute the function
         return fc_ptr(cpu, vmmngr)
@@ -7,6 +7,9 @@ from collections import Sequence, namedtuple
 from miasm2.jitter.csts import *
 from miasm2.core.utils import *
 from miasm2.core.bin_stream import bin_stream_vm
+from miasm2.core.interval import interval
+from miasm2.jitter.trace import RegisterMap, iter_records
+from miasm2.jitter.coverage import write_drcov
 from miasm2.ir.ir2C import init_arch_C
 
 hnd = logging.StreamHandler()
@@ -39,6 +42,10 @@ except ImportError:
     log.error('cannot import VmMngr')
 
 
+# Argument namedtuple types, by argument names
+ARGS_TYPES = {}
+
+
 def named_arguments(func):
     """Function decorator to allow the use of .func_args_*() methods
     with either the number of arguments or the list of the argument
@@ -53,21 +60,27 @@ def named_arguments(func):
     def newfunc(self, args):
         if isinstance(args, Sequence):
             ret_ad, arg_vals = func(self, len(args))
-            arg_vals = namedtuple("args", args)(*arg_vals)
-            # func_name(arguments) return address
-            log_func.info('%s(%s) ret addr: %s',
-                whoami(),
-                ', '.join("%s=0x%x" % (field, value)
-                          for field, value in arg_vals._asdict().iteritems()),
-                hex(ret_ad))
-            return ret_ad, namedtuple("args", args)(*arg_vals)
+            args = tuple(args)
+            args_type = ARGS_TYPES.get(args)
+            if args_type is None:
+                args_type = ARGS_TYPES[args] = namedtuple("args", args)
+            arg_vals = args_type(*arg_vals)
+            if log_func.isEnabledFor(logging.INFO):
+                # func_name(arguments) return address
+                log_func.info('%s(%s) ret addr: %s',
+                    whoami(),
+                    ', '.join("%s=0x%x" % (field, value)
+                              for field, value in zip(args, arg_vals)),
+                    hex(ret_ad))
+            return ret_ad, arg_vals
         else:
             ret_ad, arg_vals = func(self, args)
-            # func_name(arguments) return address
-            log_func.info('%s(%s) ret addr: %s',
-                whoami(),
-                ', '.join(hex(arg) for arg in arg_vals),
-                hex(ret_ad))
+            if log_func.isEnabledFor(logging.INFO):
+                # func_name(arguments) return address
+                log_func.info('%s(%s) ret addr: %s',
+                    whoami(),
+                    ', '.join(hex(arg) for arg in arg_vals),
+                    hex(ret_ad))
             return ret_ad, arg_vals
     return newfunc
 
@@ -164,6 +177,10 @@ class ExceptionHandle():
     def memoryBreakpoint(cls):
         return cls(EXCEPT_BREAKPOINT_INTERN)
 
+    @classmethod
+    def budgetExhausted(cls):
+        return cls(EXCEPT_BUDGET)
+
     def __eq__(self, to_cmp):
         if not isinstance(to_cmp, ExceptionHandle):
             return False
@@ -234,6 +251,11 @@ class jitter:
         self.exceptions_handler = CallbackHandlerBitflag()
         self.init_exceptions_handler()
         self.exec_cb = None
+        self.cpu_snapshot = None
+        self.snapshot_objects = []
+        self.objects_snapshot = None
+        self.regmap = RegisterMap(jcore.get_gpreg_offset_all())
+        self.trace_file = None
 
     def init_exceptions_handler(self):
         "Add common exceptions handlers"
@@ -250,9 +272,16 @@ class jitter:
             "Stop the execution and return an identifier"
             return ExceptionHandle.memoryBreakpoint()
 
+        def exception_budget(jitter):
+            """Stop the execution and return an identifier. The run can be
+            continued, once the budget updated (see set_budget)"""
+            self.vm.set_exception(self.vm.get_exception() & ~EXCEPT_BUDGET)
+            return ExceptionHandle.budgetExhausted()
+
         self.add_exception_handler(EXCEPT_CODE_AUTOMOD, exception_automod)
         self.add_exception_handler(EXCEPT_BREAKPOINT_INTERN,
                                    exception_memory_breakpoint)
+        self.add_exception_handler(EXCEPT_BUDGET, exception_budget)
 
     def add_breakpoint(self, addr, callback):
         """Add a callback associated with addr.
@@ -325,14 +354,39 @@ class jitter:
             if res is not True:
                 yield res
 
-    def init_run(self, pc):
+    def init_run(self, pc, max_instructions=None, timeout=None):
         """Create an iterator on pc with runiter.
         @pc: address of code to run
+        @max_instructions, @timeout: (optional) execution budgets (see
+        set_budget)
         """
+        self.set_budget(max_instructions, timeout)
         self.run_iterator = self.runiter_once(pc)
         self.pc = pc
         self.run = True
 
+    def set_budget(self, max_instructions=None, timeout=None):
+        """Limit the execution enforced by the jitted code, and reset the
+        executed instructions counter (see get_executed_instructions).
+        Once a budget is exhausted, continue_run returns
+        ExceptionHandle.budgetExhausted(), with pc on the next instruction to
+        execute.
+        @max_instructions: (optional) number of instructions to execute
+        @timeout: (optional) execution time, in seconds. The clock is checked
+        periodically, on blocks entries
+        """
+        self.vm.set_budget(max_instructions, timeout)
+
+    def get_executed_instructions(self):
+        """Number of instructions executed since the budget was set, if a
+        budget is enabled. Instructions left on an exception, and executed
+        again, are counted once"""
+        return self.vm.get_budget()[0]
+
+    def get_budget_exhausted(self):
+        "BUDGET_* limits reached since the budget was set"
+        return self.vm.get_budget()[1]
+
     def continue_run(self, step=False):
         """PRE: init_run.
         Continue the run of the current session until iterator returns or run is
@@ -355,7 +409,7 @@ class jitter:
 
     def init_stack(self):
         self.vm.add_memory_page(
-            self.stack_base, PAGE_READ | PAGE_WRITE, "\x00" * self.stack_size)
+            self.stack_base, PAGE_READ | PAGE_WRITE, self.stack_size)
         sp = self.arch.getsp(self.attrib)
         setattr(self.cpu, sp.name, self.stack_base + self.stack_size)
         # regs = self.cpu.get_gpreg()
@@ -365,32 +419,145 @@ class jitter:
     def get_exception(self):
         return self.cpu.get_exception() | self.vm.get_exception()
 
+    def snapshot(self):
+        """Snapshot the current state of the sandbox: memory pages, memory
+        exception flags, cpu state and the state of the objects registered
+        with add_snapshot_object. Memory is saved lazily (copy on write),
+        so taking a snapshot is cheap and a restore only copies back the
+        pages written since the snapshot.
+        Only one snapshot is kept: a new call replaces the previous one.
+        """
+        self.vm.snapshot()
+        self.cpu_snapshot = self.cpu.get_state()
+        self.objects_snapshot = [(obj, obj.get_state())
+                                 for obj in self.snapshot_objects]
+
+    def restore_snapshot(self):
+        """Restore the state saved by the last call to snapshot. The
+        snapshot is kept, so it can be restored again.
+        Jitted code overlapping the restored memory is invalidated.
+        """
+        if self.cpu_snapshot is None:
+            raise RuntimeError("no snapshot")
+        restored = interval()
+        for addr, size in self.vm.restore_snapshot():
+            restored.add(addr, addr + size - 1)
+        self.cpu.set_state(self.cpu_snapshot)
+        for obj, state in self.objects_snapshot:
+            obj.set_state(state)
+
+        modified = restored & self.jit.blocs_mem_interval
+        if not modified.empty:
+            self.jit.addr_mod += modified
+            self.jit.updt_automod_code(self.vm)
+
+    def drop_snapshot(self):
+        "Forget the last snapshot, releasing the saved pages"
+        self.vm.drop_snapshot()
+        self.cpu_snapshot = None
+        self.objects_snapshot = None
+
+    def add_snapshot_object(self, obj):
+        """Save and restore the state of @obj, living outside of the sandbox
+        memory (such as an OS emulation structure), with the snapshots.
+        @obj: object providing get_state() and set_state(state), like the cpu
+        If a snapshot is already taken, the current state of @obj is saved
+        in it.
+        """
+        if obj in self.snapshot_objects:
+            return
+        self.snapshot_objects.append(obj)
+        if self.objects_snapshot is not None:
+            self.objects_snapshot.append((obj, obj.get_state()))
+
+    def trace_start(self, flags=TRACE_BLOCK, capacity=0x10000, fname=None):
+        """Start recording an execution trace (see miasm2.jitter.trace)
+        @flags: TRACE_* events to record
+        @capacity: number of records kept in memory
+        @fname: (optional) trace file. If not set, the trace is a ring buffer
+        keeping the last @capacity records (see get_trace)
+        """
+        self.trace_stop()
+        fd, state, words = -1, None, None
+        if flags & TRACE_REGS:
+            state = self.cpu.get_regs_view()
+            words = [word for word in self.regmap.words
+                     if word + 8 <= len(state)]
+        if fname is not None:
+            self.trace_file = open(fname, "wb")
+            fd = self.trace_file.fileno()
+        try:
+            self.vm.trace_start(flags, capacity, fd, state, words)
+        except:
+            self.trace_stop()
+            raise
+
+    def trace_stop(self):
+        """Stop the execution trace and close its file
+        Return the number of records emitted"""
+        try:
+            return self.vm.trace_stop()
+        finally:
+            if self.trace_file is not None:
+                self.trace_file.close()
+                self.trace_file = None
+
+    def get_trace(self):
+        "List of the TraceRecord kept in memory, oldest first"
+        return list(iter_records(self.vm.get_trace()))
+
+    def coverage_start(self, reset=True):
+        """Count the executions of each jitted block
+        @reset: (optional) forget the previous counters
+        """
+        if reset:
+            self.vm.coverage_reset()
+        self.vm.coverage_start()
+
+    def coverage_stop(self):
+        "Stop counting the blocks executions; counters are kept"
+        self.vm.coverage_stop()
+
+    def get_coverage(self):
+        "Dictionary executed block address -> executions count"
+        return dict((addr, count)
+                    for addr, count, _, _ in self.vm.get_coverage())
+
+    def get_instructions_count(self):
+        """Number of instructions executed while counting blocks
+        A block left on an exception is counted as fully executed"""
+        return sum(count * instrs
+                   for _, count, instrs, _ in self.vm.get_coverage())
+
+    def coverage_drcov(self, fname, modules=None):
+        """Export the executed blocks to the drcov file @fname
+        @modules: (optional) list of (path, base, end) of the modules of
+        interest. By default, each mapped memory region is a module
+        Return the number of blocks written
+        """
+        blocks = [(addr, size) for addr, _, _, size in self.vm.get_coverage()]
+        if modules is None:
+            modules = [("region_%x" % base, base, base + size)
+                       for base, size, _ in self.vm.get_regions()]
+        with open(fname, "wb") as fdesc:
+            return write_drcov(fdesc, blocks, modules)
+
     # commun functions
     def get_str_ansi(self, addr, max_char=None):
         """Get ansi str from vm.
         @addr: address in memory
         @max_char: maximum len"""
-        l = 0
-        tmp = addr
-        while ((max_char is None or l < max_char) and
-            self.vm.get_mem(tmp, 1) != "\x00"):
-            tmp += 1
-            l += 1
-        return self.vm.get_mem(addr, l)
+        return self.vm.get_c_str(addr, max_char)
 
     def get_str_unic(self, addr, max_char=None):
         """Get unicode str from vm.
         @addr: address in memory
-        @max_char: maximum len"""
-        l = 0
-        tmp = addr
-        while ((max_char is None or l < max_char) and
-            self.vm.get_mem(tmp, 2) != "\x00\x00"):
-            tmp += 2
-            l += 2
-        s = self.vm.get_mem(addr, l)
-        s = s[::2]  # TODO: real unicode decoding
-        return s
+        @max_char: maximum len (in bytes)
+        Characters out of latin-1 are replaced by '?'"""
+        if max_char is not None:
+            max_char = (max_char + 1) / 2
+        s = self.vm.get_wide_str(addr, max_char)
+        return s.encode("latin-1", "replace")
 
     def set_str_ansi(self, addr, s):
         """Set an ansi string in memory"""
@@ -407,30 +574,47 @@ class jitter:
         """Resolve the name of the function which cause the handler call. Then
         call the corresponding handler from users callback.
         """
-        fname = jitter.libs.fad2cname[jitter.pc]
-        if fname in jitter.user_globals:
-            func = jitter.user_globals[fname]
-        else:
-            log.debug('%r', fname)
-            raise ValueError('unknown api', hex(jitter.pc), repr(fname))
+        func = jitter.lib_handlers.get(jitter.pc)
+        if func is None:
+            func = jitter.resolve_lib_handler(jitter.pc)
+            if func is None:
+                fname = jitter.libs.fad2cname[jitter.pc]
+                log.debug('%r', fname)
+                raise ValueError('unknown api', hex(jitter.pc), repr(fname))
         func(jitter)
         jitter.pc = getattr(jitter.cpu, jitter.ir_arch.pc.name)
         return True
 
+    def resolve_lib_handler(self, f_addr):
+        """Return the user function handling the library function at @f_addr,
+        or None if it is not defined. Resolved handlers are cached.
+        @f_addr: library function address
+        """
+        func = self.user_globals.get(self.libs.fad2cname.get(f_addr))
+        if func is not None:
+            self.lib_handlers[f_addr] = func
+        return func
+
     def handle_function(self, f_addr):
         """Add a brakpoint which will trigger the function handler"""
+        self.resolve_lib_handler(f_addr)
         self.add_breakpoint(f_addr, self.handle_lib)
 
     def add_lib_handler(self, libs, user_globals=None):
         """Add a function to handle libs call with breakpoints
         @libs: libimp instance
         @user_globals: dictionnary for defined user function
+
+        Handlers are resolved once, when their breakpoint is added or on
+        their first call: later updates of @user_globals only affect
+        functions not resolved yet.
         """
         if user_globals is None:
             user_globals = {}
 
         self.libs = libs
         self.user_globals = user_globals
+        self.lib_handlers = {}
 
         for f_addr in libs.fad2cname:
             self.handle_function(f_addr)
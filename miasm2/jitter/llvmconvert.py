@@ -128,6 +128,9 @@ class LLVMContext_JIT(LLVMContext):
             self.add_shared_library(lib_fname)
         self.add_memlookups()
         self.add_get_exceptionflag()
+        self.add_coverage()
+        self.add_budget()
+        self.add_trace()
         self.add_op()
         self.add_log_functions()
         self.vmcpu = {}
@@ -155,6 +158,33 @@ class LLVMContext_JIT(LLVMContext):
         self.add_fc({"get_exception_flag": {"ret": LLVMType.int(64),
                                             "args": [p8]}})
 
+    def add_coverage(self):
+        "Add 'coverage_block' function"
+        p8 = llvm_c.PointerType.pointer(LLVMType.int(8))
+        self.add_fc({"coverage_block": {"ret": LLVMType.void(),
+                                        "args": [p8,
+                                                 LLVMType.int(64),
+                                                 LLVMType.int(32),
+                                                 LLVMType.int(32)]}})
+
+    def add_budget(self):
+        "Add execution budgets functions"
+        p8 = llvm_c.PointerType.pointer(LLVMType.int(8))
+        for name in ["budget_block", "budget_instr", "budget_refund"]:
+            self.add_fc({name: {"ret": LLVMType.void(),
+                                "args": [p8]}})
+
+    def add_trace(self):
+        "Add 'trace_block' and 'trace_instr' functions"
+        p8 = llvm_c.PointerType.pointer(LLVMType.int(8))
+        self.add_fc({"trace_block": {"ret": LLVMType.void(),
+                                     "args": [p8,
+                                              LLVMType.int(64),
+                                              LLVMType.int(32)]}})
+        self.add_fc({"trace_instr": {"ret": LLVMType.void(),
+                                     "args": [p8,
+                                              LLVMType.int(64)]}})
+
     def add_op(self):
         "Add operations functions"
 
@@ -723,6 +753,10 @@ class LLVMFunction():
 
         # Then Bloc
         builder.position_at_end(then_block)
+        if except_do_not_update_pc is True:
+            # The instruction will be executed again
+            fc_ptr = self.mod.get_function_named("budget_refund")
+            builder.call(fc_ptr, [self.local_vars["vmmngr"]])
         self.set_ret(llvm_c.Constant.int(self.ret_type, pc_to_return))
 
         builder.position_at_end(merge_block)
@@ -730,6 +764,19 @@ class LLVMFunction():
         # Reactivate object caching
         self.main_stream = current_main_stream
 
+    def add_budget_instr(self):
+        """Count the instruction to come; if the instructions budget is
+        exhausted, an exception is raised instead"""
+        fc_ptr = self.mod.get_function_named("budget_instr")
+        self.builder.call(fc_ptr, [self.local_vars["vmmngr"]])
+
+    def add_trace_instr(self, line):
+        "Record the execution of the instruction @line, if it is traced"
+        fc_ptr = self.mod.get_function_named("trace_instr")
+        self.builder.call(fc_ptr, [self.local_vars["vmmngr"],
+                                   llvm_c.Constant.int(LLVMType.int(64),
+                                                       line.offset)])
+
     def log_instruction(self, instruction, line):
         "Print current instruction and registers if options are set"
 
@@ -753,7 +800,9 @@ class LLVMFunction():
             # Check general errors only at the beggining of instruction
             if line.offset not in self.offsets_jitted:
                 self.offsets_jitted.add(line.offset)
+                self.add_budget_instr()
                 self.check_error(line)
+                self.add_trace_instr(line)
 
                 # Log mn and registers if options is set
                 self.log_instruction(instruction, line)
@@ -941,8 +990,30 @@ class LLVMFunction():
         for irbloc in blocs:
             self.add_irbloc(irbloc)
 
-        # Branch entry_bbl on first label
+        # Trace and count the block execution, then check the time budget
         builder.position_at_end(entry_bbl)
+        lines = dict((line.offset, line) for irbloc in blocs
+                     for line in irbloc.lines)
+        label = blocs[0].label
+        size = max(line.offset + line.l
+                   for line in lines.itervalues()) - label.offset
+        fc_ptr = self.mod.get_function_named("trace_block")
+        builder.call(fc_ptr, [self.local_vars["vmmngr"],
+                              llvm_c.Constant.int(LLVMType.int(64),
+                                                  label.offset),
+                              llvm_c.Constant.int(LLVMType.int(32),
+                                                  len(lines))])
+        fc_ptr = self.mod.get_function_named("coverage_block")
+        builder.call(fc_ptr, [self.local_vars["vmmngr"],
+                              llvm_c.Constant.int(LLVMType.int(64),
+                                                  label.offset),
+                              llvm_c.Constant.int(LLVMType.int(32),
+                                                  len(lines)),
+                              llvm_c.Constant.int(LLVMType.int(32), size)])
+        fc_ptr = self.mod.get_function_named("budget_block")
+        builder.call(fc_ptr, [self.local_vars["vmmngr"]])
+
+        # Branch entry_bbl on first label
         first_label_bbl = self.get_basic_bloc_by_label(blocs[0].label)
         builder.branch(first_label_bbl)
 
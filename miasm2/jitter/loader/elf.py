@@ -47,10 +47,14 @@ def preload_elf(vm, e, runtime_lib, patch_vm_imp=True):
 
 
 
-def vm_load_elf(vm, fdata, **kargs):
+def vm_load_elf(vm, fdata, fstream=None, **kargs):
     """
     Very dirty elf loader
     TODO XXX: implement real loader
+
+    @fstream: (optional) file object whose content is @fdata. If set,
+    segments are read from the file by the VM (and mapped, when possible)
+    instead of being copied from Python strings
     """
     #log.setLevel(logging.DEBUG)
     e = elf_init.ELF(fdata, **kargs)
@@ -61,21 +65,23 @@ def vm_load_elf(vm, fdata, **kargs):
             continue
         log.debug('0x%x 0x%x 0x%x 0x%x', p.ph.vaddr, p.ph.memsz, p.ph.offset,
                   p.ph.filesz)
-        data_o = e._content[p.ph.offset:p.ph.offset + p.ph.filesz]
         addr_o = p.ph.vaddr
         a_addr = addr_o & ~0xFFF
         b_addr = addr_o + max(p.ph.memsz, p.ph.filesz)
         b_addr = (b_addr + 0xFFF) & ~0xFFF
-        all_data[addr_o] = data_o
+        all_data[addr_o] = (p.ph.offset, p.ph.filesz)
         # -2: Trick to avoid merging 2 consecutive pages
         i += [(a_addr, b_addr-2)]
     for a, b in i.intervals:
         #print hex(a), hex(b)
-        vm.add_memory_page(a, PAGE_READ | PAGE_WRITE, "\x00"*(b+2-a))
+        vm.add_memory_page(a, PAGE_READ | PAGE_WRITE, b + 2 - a)
 
 
-    for r_vaddr, data in all_data.items():
-        vm.set_mem(r_vaddr, data)
+    for r_vaddr, (offset, size) in all_data.items():
+        if fstream is not None:
+            vm.set_mem_from_file(r_vaddr, fstream, offset, size)
+        else:
+            vm.set_mem(r_vaddr, e._content[offset:offset + size])
     return e
 
 class libimp_elf(libimp):
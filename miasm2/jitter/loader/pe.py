@@ -89,12 +89,15 @@ def get_export_name_addr_list(e):
     return out
 
 
-def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
+def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, fstream=None, **kargs):
     """Load a PE in memory (@vm) from a data buffer @fdata
     @vm: VmMngr instance
     @fdata: data buffer to parse
     @align_s: (optional) If False, keep gaps between section
     @load_hdr: (optional) If False, do not load the NThdr in memory
+    @fstream: (optional) file object whose content is @fdata. If set, sections
+    content is read from the file by the VM (and mapped, when possible)
+    instead of being copied from Python strings
     Return the corresponding PE instance.
 
     Extra arguments are passed to PE instanciation.
@@ -104,6 +107,29 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
     # Parse and build a PE instance
     pe = pe_init.PE(fdata, **kargs)
 
+    # Sections raw data (offset, length) in the file, before any alignment
+    raw_data = {}
+    if fstream is not None and not pe.loadfrommem:
+        for section in pe.SHList:
+            offset = section.offset
+            # Raw data may be truncated by the end of file
+            length = max(0, min(len(section.data), len(fdata) - offset))
+            # The parser may have read the data elsewhere (for instance, an
+            # unaligned raw offset is rounded): copy it in this case
+            if fdata.startswith(section.data[:length], offset):
+                raw_data[section] = (offset, length)
+
+    def set_section_mem(section):
+        "Set the content of @section in memory"
+        addr = pe.rva2virt(section.addr)
+        if section in raw_data:
+            # Section data may have been truncated or zero padded since
+            offset, length = raw_data[section]
+            vm.set_mem_from_file(addr, fstream, offset,
+                                 min(length, len(section.data)))
+        else:
+            vm.set_mem(addr, str(section.data))
+
     # Check if all section are aligned
     aligned = True
     for section in pe.SHList:
@@ -120,10 +146,10 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
             min_len = min(pe.SHList[0].addr, 0x1000)
 
             # Get and pad the pe_hdr
-            pe_hdr = pe.content[:hdr_len] + max(
-                0, (min_len - hdr_len)) * "\x00"
+            pe_hdr = pe.content[:hdr_len]
             vm.add_memory_page(pe.NThdr.ImageBase, PAGE_READ | PAGE_WRITE,
-                               pe_hdr)
+                               len(pe_hdr) + max(0, (min_len - hdr_len)))
+            vm.set_mem(pe.NThdr.ImageBase, pe_hdr)
 
         # Align sections size
         if align_s:
@@ -140,12 +166,12 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
             last_section = pe.SHList[-1]
             last_section.size = (last_section.size + 0xfff) & 0xfffff000
 
-        # Pad sections with null bytes and map them
+        # Map zero filled sections, then set their content
         for section in pe.SHList:
-            data = str(section.data)
-            data += "\x00" * (section.size - len(data))
             vm.add_memory_page(pe.rva2virt(section.addr),
-                               PAGE_READ | PAGE_WRITE, data)
+                               PAGE_READ | PAGE_WRITE,
+                               max(section.size, len(section.data)))
+            set_section_mem(section)
 
         return pe
 
@@ -153,7 +179,6 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
     log.warning('PE is not aligned, creating big section')
     min_addr = 0 if load_hdr else None
     max_addr = None
-    data = ""
 
     for i, section in enumerate(pe.SHList):
         if i < len(pe.SHList) - 1:
@@ -177,13 +202,13 @@ def vm_load_pe(vm, fdata, align_s=True, load_hdr=True, **kargs):
     # Create only one big section containing the whole PE
     vm.add_memory_page(min_addr,
                        PAGE_READ | PAGE_WRITE,
-                       (max_addr - min_addr) * "\x00")
+                       max_addr - min_addr)
 
     # Copy each sections content in memory
     for section in pe.SHList:
         log.debug('Map 0x%x bytes to 0x%x', len(section.data),
                   pe.rva2virt(section.addr))
-        vm.set_mem(pe.rva2virt(section.addr), str(section.data))
+        set_section_mem(section)
 
     return pe
 
@@ -198,8 +223,8 @@ def vm_load_pe_lib(vm, fname_in, libs, lib_path_base, **kargs):
     Extra arguments are passed to vm_load_pe
     """
     fname = os.path.join(lib_path_base, fname_in)
-    with open(fname) as fstream:
-        pe = vm_load_pe(vm, fstream.read(), **kargs)
+    with open(fname, "rb") as fstream:
+        pe = vm_load_pe(vm, fstream.read(), fstream=fstream, **kargs)
     libs.add_export_lib(pe, fname_in)
     return pe
 
@@ -243,12 +268,10 @@ def vm2pe(myjit, fname, libs=None, e_orig=None,
         img_base = e_orig.NThdr.ImageBase
 
     mye.NThdr.ImageBase = img_base
-    all_mem = myjit.vm.get_all_memory()
-    addrs = all_mem.keys()
-    addrs.sort()
     mye.Opthdr.AddressOfEntryPoint = mye.virt2rva(myjit.pc)
     first = True
-    for ad in addrs:
+    # Regions are sorted by address; only dump the ones in range
+    for ad, size, _ in myjit.vm.get_regions():
         if not min_addr <= ad < max_addr:
             continue
         log.debug("0x%x", ad)
@@ -256,13 +279,13 @@ def vm2pe(myjit, fname, libs=None, e_orig=None,
             mye.SHList.add_section(
                 "%.8X" % ad,
                 addr=ad - mye.NThdr.ImageBase,
-                data=all_mem[ad]['data'],
+                data=myjit.vm.get_mem(ad, size),
                 offset=min_section_offset)
         else:
             mye.SHList.add_section(
                 "%.8X" % ad,
                 addr=ad - mye.NThdr.ImageBase,
-                data=all_mem[ad]['data'])
+                data=myjit.vm.get_mem(ad, size))
         first = False
     if libs:
         if added_funcs is not None:
@@ -0,0 +1,113 @@
+"""Execution traces recorded by the jitter
+
+A trace is a sequence of fixed size records (struct trace_record of
+vm_mngr.h), in the host byte order:
+- TRACE_REGS: a 8 bytes word of the cpu state, at offset @info, holds @value.
+  The trace starts with the whole tracked state, then only modified words
+  are recorded, before the next block / instruction record
+- TRACE_BLOCK: a block of @info instructions is executed at @addr
+- TRACE_INSTR: an instruction is executed at @addr
+- TRACE_MEM_READ / TRACE_MEM_WRITE: @size bytes are accessed at @addr, with
+  @value
+"""
+
+import struct
+import sys
+from collections import namedtuple
+
+from miasm2.jitter.csts import TRACE_REGS
+
+TraceRecord = namedtuple("TraceRecord", ["type", "size", "info", "addr",
+                                         "value"])
+
+RECORD = struct.Struct("=BBHIQQ")
+WORD_SIZE = 8
+
+
+def iter_records(data):
+    """Iterate on the TraceRecord of the raw trace @data"""
+    unpack_from = RECORD.unpack_from
+    for offset in xrange(0, len(data) - len(data) % RECORD.size,
+                         RECORD.size):
+        rtype, size, _, info, addr, value = unpack_from(data, offset)
+        yield TraceRecord(rtype, size, info, addr, value)
+
+
+def read_trace(fname, chunk_records=0x10000):
+    """Iterate on the TraceRecord of the trace file @fname
+    @chunk_records: number of records read at once"""
+    with open(fname, "rb") as fdesc:
+        while True:
+            data = fdesc.read(RECORD.size * chunk_records)
+            if not data:
+                break
+            for record in iter_records(data):
+                yield record
+
+
+class RegisterMap(object):
+    """Location of the registers in the cpu state
+
+    Register sizes are not known: a register is assumed to span up to the
+    next register offset, with at most @max_size bytes.
+    """
+
+    def __init__(self, offsets, max_size=16):
+        """
+        @offsets: register name -> offset in the cpu state, as returned by
+        get_gpreg_offset_all of the JitCore module
+        @max_size: maximum size of a register, in bytes
+        """
+        items = sorted(offsets.iteritems(), key=lambda item: item[1])
+        starts = sorted(set(offsets.itervalues()))
+        next_start = dict(zip(starts, starts[1:]))
+        # name -> (offset, size)
+        self.extents = {}
+        for name, offset in items:
+            end = min(next_start.get(offset, offset + WORD_SIZE),
+                      offset + max_size)
+            self.extents[name] = (offset, end - offset)
+
+    @property
+    def words(self):
+        "Sorted offsets of the 8 bytes words covering the registers"
+        words = set()
+        for offset, size in self.extents.itervalues():
+            for word in xrange(offset - offset % WORD_SIZE, offset + size,
+                               WORD_SIZE):
+                words.add(word)
+        return sorted(words)
+
+
+class RegisterState(object):
+    """Registers values, rebuilt from the TRACE_REGS records of a trace"""
+
+    def __init__(self, regmap):
+        """
+        @regmap: RegisterMap instance used to record the trace
+        """
+        self.regmap = regmap
+        self.state = bytearray()
+        # word offset -> names of the registers it overlaps
+        self.word2regs = {}
+        for name, (offset, size) in regmap.extents.iteritems():
+            for word in xrange(offset - offset % WORD_SIZE, offset + size,
+                               WORD_SIZE):
+                self.word2regs.setdefault(word, []).append(name)
+
+    def update(self, record):
+        """Apply the TRACE_REGS @record; return the names of the registers it
+        overlaps"""
+        assert record.type == TRACE_REGS
+        end = record.info + WORD_SIZE
+        if len(self.state) < end:
+            self.state.extend("\x00" * (end - len(self.state)))
+        self.state[record.info:end] = struct.pack("=Q", record.value)
+        return self.word2regs.get(record.info, [])
+
+    def __getitem__(self, name):
+        offset, size = self.regmap.extents[name]
+        data = str(self.state[offset:offset + size])
+        if sys.byteorder == "little":
+            data = data[::-1]
+        return int(data.encode("hex") or "0", 16)
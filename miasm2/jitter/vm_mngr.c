@@ -25,6 +25,17 @@
 #include <stdint.h>
 #include <inttypes.h>
 #include <math.h>
+#include <errno.h>
+
+#ifdef _WIN32
+#include <io.h>
+#include <windows.h>
+#else
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <time.h>
+#endif
 
 #include "queue.h"
 #include "vm_mngr.h"
@@ -123,6 +134,43 @@ uint64_t get_mem_base_addr(vm_mngr_t* vm_mngr, uint64_t ad, uint64_t *addr_base)
 	return 0;
 }
 
+/* Return the memory page containing @ad, or NULL. Unlike
+   get_memory_page_from_address, a missing page is not reported as an access
+   violation
+*/
+struct memory_page_node * find_memory_page(vm_mngr_t* vm_mngr, uint64_t ad)
+{
+	struct memory_page_node * mpn;
+
+	/* Pages are sorted by address */
+	LIST_FOREACH(mpn, &vm_mngr->memory_page_pool, next){
+		if (ad < mpn->ad)
+			return NULL;
+		if (ad < mpn->ad + mpn->size)
+			return mpn;
+	}
+	return NULL;
+}
+
+/* Return 1 if the @size bytes starting at @ad are mapped, possibly across
+   several contiguous pages
+*/
+int is_mapped(vm_mngr_t* vm_mngr, uint64_t ad, uint64_t size)
+{
+	struct memory_page_node * mpn;
+	uint64_t len;
+
+	while (size){
+		mpn = find_memory_page(vm_mngr, ad);
+		if (!mpn)
+			return 0;
+		len = MIN(size, mpn->size - (ad - mpn->ad));
+		ad += len;
+		size -= len;
+	}
+	return 1;
+}
+
 struct memory_page_node * get_memory_page_from_address(vm_mngr_t* vm_mngr, uint64_t ad)
 {
 	struct memory_page_node * mpn;
@@ -155,6 +203,132 @@ struct memory_page_node * get_memory_page_from_address(vm_mngr_t* vm_mngr, uint6
 
 
 
+/* Save the content of the snapshotted chunks of @mpn overlapping [ad, ad +
+   size[ before their first modification */
+static void snapshot_page_write(vm_mngr_t* vm_mngr,
+				struct memory_page_node * mpn,
+				uint64_t ad, uint64_t size)
+{
+	uint64_t index, index_stop, len;
+	struct snapshot_chunk *dirty;
+
+	if (mpn->snapshot_chunks == NULL || size == 0)
+		return;
+
+	index = (ad - mpn->ad) >> MEMORY_PAGE_POOL_MASK_BIT;
+	index_stop = (ad - mpn->ad + size - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+	for (; index <= index_stop; index++) {
+		if (mpn->snapshot_dirty[index])
+			continue;
+		if (mpn->snapshot_chunks[index] == NULL) {
+			len = MIN(PAGE_SIZE, mpn->size - (index << MEMORY_PAGE_POOL_MASK_BIT));
+			mpn->snapshot_chunks[index] = malloc(len);
+			if (mpn->snapshot_chunks[index] == NULL) {
+				fprintf(stderr, "cannot alloc snapshot chunk\n");
+				exit(-1);
+			}
+			memcpy(mpn->snapshot_chunks[index],
+			       (char*)mpn->ad_hp + (index << MEMORY_PAGE_POOL_MASK_BIT),
+			       len);
+		}
+		if (vm_mngr->snapshot_dirty_count == vm_mngr->snapshot_dirty_max) {
+			vm_mngr->snapshot_dirty_max = MAX(0x100, 2 * vm_mngr->snapshot_dirty_max);
+			dirty = realloc(vm_mngr->snapshot_dirty,
+					vm_mngr->snapshot_dirty_max * sizeof(*dirty));
+			if (dirty == NULL) {
+				fprintf(stderr, "cannot alloc snapshot dirty list\n");
+				exit(-1);
+			}
+			vm_mngr->snapshot_dirty = dirty;
+		}
+		dirty = &vm_mngr->snapshot_dirty[vm_mngr->snapshot_dirty_count++];
+		dirty->mpn = mpn;
+		dirty->index = index;
+		mpn->snapshot_dirty[index] = 1;
+	}
+}
+
+
+/* Read @size bytes of the file @fd at @offset into @dst */
+static int read_file(char* dst, int fd, uint64_t offset, uint64_t size)
+{
+	int ret;
+
+#ifdef _WIN32
+	if (_lseeki64(fd, offset, SEEK_SET) < 0) {
+		PyErr_SetFromErrno(PyExc_IOError);
+		return -1;
+	}
+#endif
+	while (size) {
+#ifdef _WIN32
+		ret = _read(fd, dst, MIN(size, 0x10000000));
+#else
+		ret = pread(fd, dst, MIN(size, 0x10000000), offset);
+#endif
+		if (ret < 0) {
+			PyErr_SetFromErrno(PyExc_IOError);
+			return -1;
+		}
+		if (ret == 0) {
+			PyErr_SetString(PyExc_IOError, "unexpected end of file");
+			return -1;
+		}
+		dst += ret;
+		offset += ret;
+		size -= ret;
+	}
+	return 0;
+}
+
+/* Return 1 if the memory of a page of @size bytes is an anonymous mapping
+   (see alloc_page_memory). Smaller pages are allocated on the heap, as each
+   mapping costs at least one host page */
+static int page_is_mapping(uint64_t size)
+{
+#ifdef _WIN32
+	return 0;
+#else
+	return size >= MAX(PAGE_MMAP_MIN_SIZE, (uint64_t)sysconf(_SC_PAGESIZE));
+#endif
+}
+
+/* Fill @dst (inside a page of @page_size bytes allocated by
+   alloc_page_memory) with @size bytes of the file @fd at @offset. If the
+   page is a mapping, host pages entirely covered are mapped from the file
+   (private mapping, copied on write) if the file offset and the memory
+   address are congruent; the remaining bytes are read */
+static int page_write_file(char* dst, uint64_t page_size, int fd,
+			   uint64_t offset, uint64_t size)
+{
+#ifndef _WIN32
+	uintptr_t host_page, start, stop;
+	struct stat st;
+
+	host_page = sysconf(_SC_PAGESIZE);
+	start = ((uintptr_t)dst + host_page - 1) & ~(host_page - 1);
+	stop = ((uintptr_t)dst + size) & ~(host_page - 1);
+	if (page_is_mapping(page_size) &&
+	    ((uintptr_t)dst - offset) % host_page == 0 && start < stop &&
+	    /* Accessing a mapping past the end of the file would fault */
+	    fstat(fd, &st) == 0 && offset + size <= (uint64_t)st.st_size) {
+		if (read_file(dst, fd, offset, start - (uintptr_t)dst) < 0)
+			return -1;
+		if (mmap((void*)start, stop - start, PROT_READ | PROT_WRITE,
+			 MAP_PRIVATE | MAP_FIXED, fd,
+			 offset + (start - (uintptr_t)dst)) == MAP_FAILED) {
+			PyErr_SetFromErrno(PyExc_IOError);
+			return -1;
+		}
+		return read_file((char*)stop, fd,
+				 offset + (stop - (uintptr_t)dst),
+				 (uintptr_t)dst + size - stop);
+	}
+#endif
+	return read_file(dst, fd, offset, size);
+}
+
+
 static uint64_t memory_page_read(vm_mngr_t* vm_mngr, unsigned int my_size, uint64_t ad)
 {
 	struct memory_page_node * mpn;
@@ -272,6 +446,7 @@ static void memory_page_write(vm_mngr_t* vm_mngr, unsigned int my_size,
 
 	/* write fits in a page */
 	if (ad - mpn->ad + my_size/8 <= mpn->size){
+		snapshot_page_write(vm_mngr, mpn, ad, my_size/8);
 		switch(my_size){
 		case 8:
 			*((unsigned char*)addr) = src&0xFF;
@@ -319,6 +494,7 @@ static void memory_page_write(vm_mngr_t* vm_mngr, unsigned int my_size,
 			if (!mpn)
 				return;
 
+			snapshot_page_write(vm_mngr, mpn, ad, 1);
 			addr = &((unsigned char*)mpn->ad_hp)[ad - mpn->ad];
 			*((unsigned char*)addr) = src&0xFF;
 			my_size -= 8;
@@ -328,6 +504,253 @@ static void memory_page_write(vm_mngr_t* vm_mngr, unsigned int my_size,
 	}
 }
 
+/* Write the pending trace records to the trace file */
+void trace_flush(vm_mngr_t* vm_mngr)
+{
+	struct trace_info *trace = &vm_mngr->trace;
+	char *buffer;
+	uint64_t size;
+	int ret;
+
+	if (!trace->records || trace->fd < 0)
+		return;
+	/* The buffer is flushed when full: pending records start at its
+	   beginning */
+	buffer = (char*)trace->records;
+	size = (trace->count - trace->flushed) * sizeof(struct trace_record);
+	trace->flushed = trace->count;
+	while (size) {
+#ifdef _WIN32
+		ret = _write(trace->fd, buffer, (unsigned int)MIN(size, 0x10000000));
+#else
+		ret = write(trace->fd, buffer, MIN(size, 0x10000000));
+#endif
+		if (ret < 0) {
+			if (errno == EINTR)
+				continue;
+			trace->error = errno;
+			return;
+		}
+		buffer += ret;
+		size -= ret;
+	}
+}
+
+/* Free the trace buffer */
+void trace_reset(vm_mngr_t* vm_mngr)
+{
+	struct trace_info *trace = &vm_mngr->trace;
+
+	free(trace->records);
+	free(trace->cpu_words);
+	free(trace->cpu_prev);
+	memset(trace, 0, sizeof(*trace));
+	trace->fd = -1;
+}
+
+void trace_add(vm_mngr_t* vm_mngr, uint8_t type, uint8_t size, uint32_t info,
+	       uint64_t addr, uint64_t value)
+{
+	struct trace_info *trace = &vm_mngr->trace;
+	struct trace_record *record;
+
+	if (trace->fd >= 0 && trace->count - trace->flushed == trace->capacity)
+		trace_flush(vm_mngr);
+	/* Ring buffer: the oldest record is overwritten */
+	record = &trace->records[trace->count % trace->capacity];
+	record->type = type;
+	record->size = size;
+	record->reserved = 0;
+	record->info = info;
+	record->addr = addr;
+	record->value = value;
+	trace->count++;
+}
+
+/* Record the tracked cpu state words modified since the last call */
+static void trace_regs(vm_mngr_t* vm_mngr)
+{
+	struct trace_info *trace = &vm_mngr->trace;
+	uint64_t i;
+	uint64_t value;
+
+	for (i = 0; i < trace->cpu_words_count; i++) {
+		memcpy(&value, trace->cpu + trace->cpu_words[i], sizeof(value));
+		if (value == trace->cpu_prev[i])
+			continue;
+		trace->cpu_prev[i] = value;
+		trace_add(vm_mngr, TRACE_REGS, sizeof(value), trace->cpu_words[i],
+			  0, value);
+	}
+}
+
+/* Record the execution of @count instructions from @addr, if block events
+   are traced */
+void trace_block(vm_mngr_t* vm_mngr, uint64_t addr, uint32_t count)
+{
+	if (!(vm_mngr->trace.flags & TRACE_BLOCK))
+		return;
+	if (vm_mngr->trace.flags & TRACE_REGS)
+		trace_regs(vm_mngr);
+	trace_add(vm_mngr, TRACE_BLOCK, 0, count, addr, 0);
+}
+
+/* Record the execution of the instruction at @addr, if instruction events
+   are traced */
+void trace_instr(vm_mngr_t* vm_mngr, uint64_t addr)
+{
+	if (!(vm_mngr->trace.flags & TRACE_INSTR))
+		return;
+	if (vm_mngr->trace.flags & TRACE_REGS)
+		trace_regs(vm_mngr);
+	trace_add(vm_mngr, TRACE_INSTR, 0, 0, addr, 0);
+}
+
+static uint64_t coverage_hash(uint64_t addr, uint64_t capacity)
+{
+	return ((addr * 0x9E3779B97F4A7C15ULL) >> 32) & (capacity - 1);
+}
+
+/* Return the slot of @addr in @entries, or the empty slot where it belongs */
+static struct coverage_entry *coverage_find(struct coverage_entry *entries,
+					    uint64_t capacity, uint64_t addr)
+{
+	uint64_t i = coverage_hash(addr, capacity);
+
+	while (entries[i].count && entries[i].addr != addr)
+		i = (i + 1) & (capacity - 1);
+	return &entries[i];
+}
+
+static int coverage_grow(struct coverage_info *coverage)
+{
+	struct coverage_entry *entries;
+	uint64_t capacity;
+	uint64_t i;
+
+	capacity = coverage->capacity ? coverage->capacity * 2 : 0x400;
+	entries = calloc(capacity, sizeof(*entries));
+	if (!entries)
+		return -1;
+	for (i = 0; i < coverage->capacity; i++) {
+		if (!coverage->entries[i].count)
+			continue;
+		*coverage_find(entries, capacity, coverage->entries[i].addr) =
+			coverage->entries[i];
+	}
+	free(coverage->entries);
+	coverage->entries = entries;
+	coverage->capacity = capacity;
+	return 0;
+}
+
+/* Count an execution of the block at @addr */
+void coverage_block(vm_mngr_t* vm_mngr, uint64_t addr, uint32_t instrs,
+		    uint32_t size)
+{
+	struct coverage_info *coverage = &vm_mngr->coverage;
+	struct coverage_entry *entry;
+
+	if (!coverage->enabled)
+		return;
+	if (2 * (coverage->used + 1) > coverage->capacity &&
+	    coverage_grow(coverage)) {
+		fprintf(stderr, "Cannot grow coverage table\n");
+		return;
+	}
+	entry = coverage_find(coverage->entries, coverage->capacity, addr);
+	if (!entry->count) {
+		entry->addr = addr;
+		coverage->used++;
+	}
+	/* The block may have been modified and jitted again */
+	entry->instrs = instrs;
+	entry->size = size;
+	entry->count++;
+}
+
+/* Forget the blocks counters */
+void coverage_reset(vm_mngr_t* vm_mngr)
+{
+	free(vm_mngr->coverage.entries);
+	vm_mngr->coverage.entries = NULL;
+	vm_mngr->coverage.capacity = 0;
+	vm_mngr->coverage.used = 0;
+}
+
+/* Monotonic clock, in microseconds */
+uint64_t budget_clock(void)
+{
+#ifdef _WIN32
+	return (uint64_t)GetTickCount64() * 1000;
+#else
+	struct timespec now;
+
+	clock_gettime(CLOCK_MONOTONIC, &now);
+	return (uint64_t)now.tv_sec * 1000000 + now.tv_nsec / 1000;
+#endif
+}
+
+/* Set the execution budgets and reset the instructions counter
+   @enabled: BUDGET_* limits to enforce
+   @max_instructions: instructions to execute, for BUDGET_INSTRUCTIONS
+   @timeout: execution time in microseconds, for BUDGET_TIME */
+void budget_set(vm_mngr_t* vm_mngr, int enabled, uint64_t max_instructions,
+		uint64_t timeout)
+{
+	struct budget_info *budget = &vm_mngr->budget;
+
+	budget->enabled = enabled;
+	budget->exhausted = 0;
+	budget->executed = 0;
+	budget->ticks = 0;
+	budget->max_instructions = enabled & BUDGET_INSTRUCTIONS ?
+		max_instructions : UINT64_MAX;
+	budget->deadline = enabled & BUDGET_TIME ? budget_clock() + timeout : 0;
+}
+
+static void budget_exhausted(vm_mngr_t* vm_mngr, int limit)
+{
+	vm_mngr->budget.exhausted |= limit;
+	vm_mngr->exception_flags |= EXCEPT_BUDGET;
+}
+
+/* Called on each block entry: check the time budget, periodically */
+void budget_block(vm_mngr_t* vm_mngr)
+{
+	struct budget_info *budget = &vm_mngr->budget;
+
+	if (!(budget->enabled & BUDGET_TIME))
+		return;
+	if (++budget->ticks & BUDGET_TIME_PERIOD)
+		return;
+	if (budget_clock() >= budget->deadline)
+		budget_exhausted(vm_mngr, BUDGET_TIME);
+}
+
+/* Called before each instruction: count it, or raise EXCEPT_BUDGET instead
+   of running it if the instructions budget is exhausted. An instruction
+   which will not run, because of a pending exception, is not counted */
+void budget_instr(vm_mngr_t* vm_mngr)
+{
+	struct budget_info *budget = &vm_mngr->budget;
+
+	if (!budget->enabled || vm_mngr->exception_flags)
+		return;
+	if (budget->executed >= budget->max_instructions)
+		budget_exhausted(vm_mngr, BUDGET_INSTRUCTIONS);
+	else
+		budget->executed++;
+}
+
+/* Uncount the current instruction, left on an exception before its end: it
+   will be executed again */
+void budget_refund(vm_mngr_t* vm_mngr)
+{
+	if (vm_mngr->budget.enabled && vm_mngr->budget.executed)
+		vm_mngr->budget.executed--;
+}
+
 /* TODO: Those functions have to be moved to a common operations file, with
  * parity, ...
  */
@@ -439,46 +862,54 @@ void vm_MEM_WRITE_08(vm_mngr_t* vm_mngr, uint64_t addr, unsigned char src)
 {
 	check_write_code_bloc(vm_mngr, 8, addr);
 	memory_page_write(vm_mngr, 8, addr, src);
+	TRACE_MEM(vm_mngr, TRACE_MEM_WRITE, 1, addr, src);
 }
 
 void vm_MEM_WRITE_16(vm_mngr_t* vm_mngr, uint64_t addr, unsigned short src)
 {
 	check_write_code_bloc(vm_mngr, 16, addr);
 	memory_page_write(vm_mngr, 16, addr, src);
+	TRACE_MEM(vm_mngr, TRACE_MEM_WRITE, 2, addr, src);
 }
 void vm_MEM_WRITE_32(vm_mngr_t* vm_mngr, uint64_t addr, unsigned int src)
 {
 	check_write_code_bloc(vm_mngr, 32, addr);
 	memory_page_write(vm_mngr, 32, addr, src);
+	TRACE_MEM(vm_mngr, TRACE_MEM_WRITE, 4, addr, src);
 }
 void vm_MEM_WRITE_64(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t src)
 {
 	check_write_code_bloc(vm_mngr, 64, addr);
 	memory_page_write(vm_mngr, 64, addr, src);
+	TRACE_MEM(vm_mngr, TRACE_MEM_WRITE, 8, addr, src);
 }
 
 unsigned char vm_MEM_LOOKUP_08(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned char ret;
     ret = memory_page_read(vm_mngr, 8, addr);
+    TRACE_MEM(vm_mngr, TRACE_MEM_READ, 1, addr, ret);
     return ret;
 }
 unsigned short vm_MEM_LOOKUP_16(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned short ret;
     ret = memory_page_read(vm_mngr, 16, addr);
+    TRACE_MEM(vm_mngr, TRACE_MEM_READ, 2, addr, ret);
     return ret;
 }
 unsigned int vm_MEM_LOOKUP_32(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     unsigned int ret;
     ret = memory_page_read(vm_mngr, 32, addr);
+    TRACE_MEM(vm_mngr, TRACE_MEM_READ, 4, addr, ret);
     return ret;
 }
 uint64_t vm_MEM_LOOKUP_64(vm_mngr_t* vm_mngr, uint64_t addr)
 {
     uint64_t ret;
     ret = memory_page_read(vm_mngr, 64, addr);
+    TRACE_MEM(vm_mngr, TRACE_MEM_READ, 8, addr, ret);
     return ret;
 }
 
@@ -515,6 +946,45 @@ int vm_read_mem(vm_mngr_t* vm_mngr, uint64_t addr, char** buffer_ptr, uint64_t s
        return 0;
 }
 
+/*
+   Compute in @length the length in bytes of the string at @addr, made of
+   @unit_size bytes characters and ended by a null character. At most
+   @max_size bytes are scanned.
+   Return -1 if the string reaches unmapped memory.
+*/
+int vm_strlen(vm_mngr_t* vm_mngr, uint64_t addr, unsigned int unit_size,
+	      uint64_t max_size, uint64_t *length)
+{
+       uint64_t len = 0;
+       uint64_t avail, i;
+       unsigned char *ptr;
+       int zero = 1;
+       struct memory_page_node * mpn;
+
+       while (len < max_size){
+	      mpn = get_memory_page_from_address(vm_mngr, addr + len);
+	      if (!mpn){
+		      PyErr_SetString(PyExc_RuntimeError, "cannot find address");
+		      return -1;
+	      }
+	      ptr = (unsigned char*)mpn->ad_hp + (addr + len - mpn->ad);
+	      avail = MIN(max_size - len, mpn->size - (addr + len - mpn->ad));
+	      /* Characters may span two pages */
+	      for (i = 0; i < avail; i++, len++){
+		      if (len % unit_size == 0)
+			      zero = 1;
+		      if (ptr[i])
+			      zero = 0;
+		      if (zero && len % unit_size == unit_size - 1){
+			      *length = len + 1 - unit_size;
+			      return 0;
+		      }
+	      }
+       }
+       *length = len;
+       return 0;
+}
+
 int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size)
 {
        uint64_t len;
@@ -531,6 +1001,7 @@ int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size)
 	      }
 
 	      len = MIN(size, mpn->size - (addr - mpn->ad));
+	      snapshot_page_write(vm_mngr, mpn, addr, len);
 	      memcpy(mpn->ad_hp + (addr-mpn->ad), buffer, len);
 	      buffer += len;
 	      addr += len;
@@ -540,6 +1011,36 @@ int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size)
        return 0;
 }
 
+/* Write @size bytes of the file @fd, starting at @offset, at @addr */
+int vm_write_mem_file(vm_mngr_t* vm_mngr, uint64_t addr, int fd,
+		      uint64_t offset, uint64_t size)
+{
+       uint64_t len;
+       struct memory_page_node * mpn;
+
+       check_write_code_bloc(vm_mngr, size * 8, addr);
+
+       /* write is multiple page wide */
+       while (size){
+	      mpn = get_memory_page_from_address(vm_mngr, addr);
+	      if (!mpn){
+		      PyErr_SetString(PyExc_RuntimeError, "cannot find address");
+		      return -1;
+	      }
+
+	      len = MIN(size, mpn->size - (addr - mpn->ad));
+	      snapshot_page_write(vm_mngr, mpn, addr, len);
+	      if (page_write_file((char*)mpn->ad_hp + (addr - mpn->ad),
+				  mpn->size, fd, offset, len) < 0)
+		      return -1;
+	      offset += len;
+	      addr += len;
+	      size -= len;
+       }
+
+       return 0;
+}
+
 
 
 unsigned int parity(unsigned int a)
@@ -1292,6 +1793,60 @@ uint64_t double_to_mem_64(double d)
 	return m;
 }
 
+/* Allocate @size bytes of zero filled memory for a page. On POSIX systems,
+   large pages are anonymous mappings: host pages are only materialised on
+   their first write */
+static void* alloc_page_memory(unsigned int size)
+{
+#ifndef _WIN32
+	void* p;
+
+	if (page_is_mapping(size)) {
+		p = mmap(NULL, size, PROT_READ | PROT_WRITE,
+			 MAP_PRIVATE | MAP_ANONYMOUS, -1, 0);
+		if (p == MAP_FAILED)
+			return NULL;
+		return p;
+	}
+#endif
+	return calloc(MAX(size, 1), 1);
+}
+
+/* Free the pages unmapped while buffers on guest memory were exported, if
+   they are all released */
+void release_memory_pages(vm_mngr_t* vm_mngr)
+{
+	struct memory_page_node * mpn;
+
+	if (vm_mngr->memory_exports)
+		return;
+	while (!LIST_EMPTY(&vm_mngr->memory_page_released)) {
+		mpn = LIST_FIRST(&vm_mngr->memory_page_released);
+		LIST_REMOVE(mpn, next);
+		free_memory_page_node(mpn);
+	}
+}
+
+/* Free the unmapped page @mpn, or keep it until the exported buffers on
+   guest memory are released */
+static void unmap_memory_page_node(vm_mngr_t* vm_mngr,
+				   struct memory_page_node * mpn)
+{
+	LIST_INSERT_HEAD(&vm_mngr->memory_page_released, mpn, next);
+	release_memory_pages(vm_mngr);
+}
+
+void free_memory_page_node(struct memory_page_node * mpn)
+{
+#ifndef _WIN32
+	if (page_is_mapping(mpn->size))
+		munmap(mpn->ad_hp, mpn->size);
+	else
+#endif
+		free(mpn->ad_hp);
+	free(mpn);
+}
+
 struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size, unsigned int access)
 {
 	struct memory_page_node * mpn;
@@ -1302,7 +1857,7 @@ struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size
 		fprintf(stderr, "cannot alloc mpn\n");
 		return NULL;
 	}
-	p = malloc(size);
+	p = alloc_page_memory(size);
 	if (!p){
 		free(mpn);
 		fprintf(stderr, "cannot alloc %d\n", size);
@@ -1312,6 +1867,9 @@ struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size
 	mpn->size = size;
 	mpn->access = access;
 	mpn->ad_hp = p;
+	mpn->snapshot_chunks = NULL;
+	mpn->snapshot_dirty = NULL;
+	mpn->snapshot_access = access;
 
 	return mpn;
 }
@@ -1381,11 +1939,12 @@ void reset_memory_page_pool(vm_mngr_t* vm_mngr)
 	struct memory_page_node * mpn;
 	unsigned int i;
 
+	drop_snapshot(vm_mngr);
+	vm_mngr->memory_generation++;
 	while (!LIST_EMPTY(&vm_mngr->memory_page_pool)) {
 		mpn = LIST_FIRST(&vm_mngr->memory_page_pool);
 		LIST_REMOVE(mpn, next);
-		free(mpn->ad_hp);
-		free(mpn);
+		unmap_memory_page_node(vm_mngr, mpn);
 	}
 	for (i=0;i<MAX_MEMORY_PAGE_POOL_TAB; i++)
 		vm_mngr->memory_page_pool_tab[i] = NULL;
@@ -1393,6 +1952,127 @@ void reset_memory_page_pool(vm_mngr_t* vm_mngr)
 }
 
 
+/* Number of snapshot chunks of the page @mpn */
+static uint64_t snapshot_chunks_count(struct memory_page_node * mpn)
+{
+	return (mpn->size + PAGE_SIZE - 1) >> MEMORY_PAGE_POOL_MASK_BIT;
+}
+
+/* Forget the current snapshot, if any */
+void drop_snapshot(vm_mngr_t* vm_mngr)
+{
+	struct memory_page_node * mpn;
+	uint64_t i;
+
+	LIST_FOREACH(mpn, &vm_mngr->memory_page_pool, next){
+		if (mpn->snapshot_chunks == NULL)
+			continue;
+		for (i = 0; i < snapshot_chunks_count(mpn); i++)
+			free(mpn->snapshot_chunks[i]);
+		free(mpn->snapshot_chunks);
+		free(mpn->snapshot_dirty);
+		mpn->snapshot_chunks = NULL;
+		mpn->snapshot_dirty = NULL;
+	}
+	free(vm_mngr->snapshot_dirty);
+	vm_mngr->snapshot_dirty = NULL;
+	vm_mngr->snapshot_dirty_count = 0;
+	vm_mngr->snapshot_dirty_max = 0;
+	vm_mngr->snapshot_active = 0;
+}
+
+/* Snapshot the memory pages (their content, access and the pages list) and
+   the exception flags. Nothing is copied here: page chunks are saved on
+   their first modification */
+void take_snapshot(vm_mngr_t* vm_mngr)
+{
+	struct memory_page_node * mpn;
+	uint64_t count;
+
+	drop_snapshot(vm_mngr);
+	LIST_FOREACH(mpn, &vm_mngr->memory_page_pool, next){
+		/* At least one element, to mark the page as snapshotted */
+		count = MAX(snapshot_chunks_count(mpn), 1);
+		mpn->snapshot_chunks = calloc(count, sizeof(char*));
+		mpn->snapshot_dirty = calloc(count, 1);
+		if (mpn->snapshot_chunks == NULL || mpn->snapshot_dirty == NULL) {
+			fprintf(stderr, "cannot alloc snapshot\n");
+			exit(-1);
+		}
+		mpn->snapshot_access = mpn->access;
+	}
+	vm_mngr->snapshot_exception_flags = vm_mngr->exception_flags;
+	vm_mngr->snapshot_exception_flags_new = vm_mngr->exception_flags_new;
+	vm_mngr->snapshot_active = 1;
+}
+
+static int append_restored_range(PyObject* restored, uint64_t ad, uint64_t size)
+{
+	PyObject *range;
+	int ret;
+
+	range = Py_BuildValue("(KK)", ad, size);
+	if (range == NULL)
+		return -1;
+	ret = PyList_Append(restored, range);
+	Py_DECREF(range);
+	return ret;
+}
+
+/* Restore the memory state saved by take_snapshot. Only the chunks modified
+   since the snapshot (or its last restore) are copied back; the snapshot is
+   kept for further restores.
+   Restored memory ranges (address, size) are appended to the list
+   @restored, including pages mapped after the snapshot, which are removed.
+   Return -1 on error (no snapshot), 0 otherwise */
+int restore_snapshot(vm_mngr_t* vm_mngr, PyObject* restored)
+{
+	struct memory_page_node * mpn;
+	struct memory_page_node * mpn_next;
+	struct snapshot_chunk *dirty;
+	uint64_t i, offset, len;
+
+	if (!vm_mngr->snapshot_active) {
+		PyErr_SetString(PyExc_RuntimeError, "no snapshot");
+		return -1;
+	}
+
+	/* Remove pages added after the snapshot */
+	vm_mngr->memory_generation++;
+	mpn = LIST_FIRST(&vm_mngr->memory_page_pool);
+	while (mpn) {
+		mpn_next = LIST_NEXT(mpn, next);
+		if (mpn->snapshot_chunks == NULL) {
+			if (append_restored_range(restored, mpn->ad, mpn->size) < 0)
+				return -1;
+			LIST_REMOVE(mpn, next);
+			unmap_memory_page_node(vm_mngr, mpn);
+		}
+		else
+			mpn->access = mpn->snapshot_access;
+		mpn = mpn_next;
+	}
+
+	/* Restore modified chunks */
+	for (i = 0; i < vm_mngr->snapshot_dirty_count; i++) {
+		dirty = &vm_mngr->snapshot_dirty[i];
+		mpn = dirty->mpn;
+		offset = dirty->index << MEMORY_PAGE_POOL_MASK_BIT;
+		len = MIN(PAGE_SIZE, mpn->size - offset);
+		memcpy((char*)mpn->ad_hp + offset,
+		       mpn->snapshot_chunks[dirty->index], len);
+		mpn->snapshot_dirty[dirty->index] = 0;
+		if (append_restored_range(restored, mpn->ad + offset, len) < 0)
+			return -1;
+	}
+	vm_mngr->snapshot_dirty_count = 0;
+
+	vm_mngr->exception_flags = vm_mngr->snapshot_exception_flags;
+	vm_mngr->exception_flags_new = vm_mngr->snapshot_exception_flags_new;
+	return 0;
+}
+
+
 void reset_code_bloc_pool(vm_mngr_t* vm_mngr)
 {
 	struct code_bloc_node * cbp;
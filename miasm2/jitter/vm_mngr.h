@@ -62,9 +62,94 @@ LIST_HEAD(memory_breakpoint_info_head, memory_breakpoint_info);
 #define MAX_MEMORY_PAGE_POOL_TAB 0x100000
 #define MEMORY_PAGE_POOL_MASK_BIT 12
 #define PAGE_SIZE (1<<MEMORY_PAGE_POOL_MASK_BIT)
+/* VM pages of at least this size are backed by an anonymous mapping */
+#define PAGE_MMAP_MIN_SIZE 0x10000
 #define VM_BIG_ENDIAN 1
 #define VM_LITTLE_ENDIAN 2
 
+/* Execution trace events */
+#define TRACE_BLOCK 1
+#define TRACE_INSTR 2
+#define TRACE_MEM_READ 4
+#define TRACE_MEM_WRITE 8
+#define TRACE_REGS 16
+
+/*
+   Trace record, as stored in the trace buffer and file
+   - TRACE_BLOCK: @addr: block address, @info: instructions count
+   - TRACE_INSTR: @addr: instruction address
+   - TRACE_MEM_READ / TRACE_MEM_WRITE: @addr, @size (in bytes) and @value
+     of the access
+   - TRACE_REGS: @info: offset in the cpu state of a 8 bytes word modified
+     since the previous block / instruction record, @value: its new value
+*/
+struct trace_record {
+	uint8_t type;
+	uint8_t size;
+	uint16_t reserved;
+	uint32_t info;
+	uint64_t addr;
+	uint64_t value;
+};
+
+struct trace_info {
+	uint64_t flags;
+	struct trace_record *records;
+	uint64_t capacity;
+	/* Records emitted since the trace start */
+	uint64_t count;
+	/* Records written to the trace file */
+	uint64_t flushed;
+	/* Trace file descriptor, -1 for a ring buffer */
+	int fd;
+	/* errno of the last failed write */
+	int error;
+	/* Registers tracking: tracked words of the cpu state and their
+	   previous value */
+	char *cpu;
+	uint32_t *cpu_words;
+	uint64_t *cpu_prev;
+	uint64_t cpu_words_count;
+};
+
+/* Execution counter of a block, for coverage */
+struct coverage_entry {
+	uint64_t addr;
+	/* 0 for an empty slot */
+	uint64_t count;
+	/* Instructions count and size (in bytes) of the block */
+	uint32_t instrs;
+	uint32_t size;
+};
+
+struct coverage_info {
+	int enabled;
+	/* Open addressing hash table indexed by block address; its capacity
+	   is a power of 2 */
+	struct coverage_entry *entries;
+	uint64_t capacity;
+	uint64_t used;
+};
+
+/* Execution budgets, checked by the jitted code */
+#define BUDGET_INSTRUCTIONS 1
+#define BUDGET_TIME 2
+/* The clock is read once every (BUDGET_TIME_PERIOD + 1) blocks */
+#define BUDGET_TIME_PERIOD 0xFF
+
+struct budget_info {
+	/* BUDGET_* limits enabled; instructions are counted if any */
+	int enabled;
+	/* BUDGET_* limit reached */
+	int exhausted;
+	/* Instructions executed since the budget was set */
+	uint64_t executed;
+	uint64_t max_instructions;
+	/* Monotonic clock deadline, in microseconds */
+	uint64_t deadline;
+	uint64_t ticks;
+};
+
 typedef struct {
 	int sex;
 	struct memory_page_list_head memory_page_pool;
@@ -80,8 +165,35 @@ typedef struct {
 	uint64_t exception_flags;
 	uint64_t exception_flags_new;
 	PyObject *addr2obj;
+
+	/* Snapshot */
+	int snapshot_active;
+	uint64_t snapshot_exception_flags;
+	uint64_t snapshot_exception_flags_new;
+	/* Chunks modified since the snapshot (or its last restore) */
+	struct snapshot_chunk *snapshot_dirty;
+	uint64_t snapshot_dirty_count;
+	uint64_t snapshot_dirty_max;
+
+	struct trace_info trace;
+
+	struct coverage_info coverage;
+
+	struct budget_info budget;
+
+	/* Guest memory views: the generation changes each time pages may be
+	   unmapped. Pages unmapped while buffers on guest memory are exported
+	   are only freed once they are all released */
+	uint64_t memory_generation;
+	uint64_t memory_exports;
+	struct memory_page_list_head memory_page_released;
 }vm_mngr_t;
 
+#define TRACE_MEM(vm_mngr, type, size, addr, value) do {		\
+		if ((vm_mngr)->trace.flags & (type))			\
+			trace_add((vm_mngr), (type), (size), 0, (addr), (value)); \
+	} while (0)
+
 
 
 typedef struct {
@@ -99,6 +211,18 @@ struct memory_page_node {
 	uint64_t access;
 	void* ad_hp;
 	LIST_ENTRY(memory_page_node)   next;
+
+	/* Snapshot: page content is saved by chunks of PAGE_SIZE bytes, on
+	   their first modification (copy on write). NULL if the page is not
+	   part of the snapshot */
+	char **snapshot_chunks;
+	unsigned char *snapshot_dirty;
+	uint64_t snapshot_access;
+};
+
+struct snapshot_chunk {
+	struct memory_page_node *mpn;
+	uint64_t index;
 };
 
 
@@ -143,9 +267,28 @@ struct memory_breakpoint_info {
 #define EXCEPT_PRIV_INSN ((1<<17) | EXCEPT_DO_NOT_UPDATE_PC)
 #define EXCEPT_ILLEGAL_INSN ((1<<18) | EXCEPT_DO_NOT_UPDATE_PC)
 #define EXCEPT_UNK_MNEMO ((1<<19) | EXCEPT_DO_NOT_UPDATE_PC)
+// execution budget exhausted, raised before the instruction
+#define EXCEPT_BUDGET (1<<20)
 
 
 int is_mem_mapped(vm_mngr_t* vm_mngr, uint64_t ad);
+int is_mapped(vm_mngr_t* vm_mngr, uint64_t ad, uint64_t size);
+void trace_add(vm_mngr_t* vm_mngr, uint8_t type, uint8_t size, uint32_t info,
+	       uint64_t addr, uint64_t value);
+void trace_block(vm_mngr_t* vm_mngr, uint64_t addr, uint32_t count);
+void trace_instr(vm_mngr_t* vm_mngr, uint64_t addr);
+void trace_flush(vm_mngr_t* vm_mngr);
+void trace_reset(vm_mngr_t* vm_mngr);
+void coverage_block(vm_mngr_t* vm_mngr, uint64_t addr, uint32_t instrs,
+		    uint32_t size);
+void coverage_reset(vm_mngr_t* vm_mngr);
+uint64_t budget_clock(void);
+void budget_set(vm_mngr_t* vm_mngr, int enabled, uint64_t max_instructions,
+		uint64_t timeout);
+void budget_block(vm_mngr_t* vm_mngr);
+void budget_instr(vm_mngr_t* vm_mngr);
+void budget_refund(vm_mngr_t* vm_mngr);
+struct memory_page_node * find_memory_page(vm_mngr_t* vm_mngr, uint64_t ad);
 uint64_t get_mem_base_addr(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t *addr_base);
 unsigned int MEM_LOOKUP(vm_mngr_t* vm_mngr, unsigned int my_size, uint64_t addr);
 
@@ -156,6 +299,10 @@ void vm_MEM_WRITE_32(vm_mngr_t* vm_mngr, uint64_t addr, unsigned int src);
 void vm_MEM_WRITE_64(vm_mngr_t* vm_mngr, uint64_t addr, uint64_t src);
 
 
+uint16_t set_endian16(vm_mngr_t* vm_mngr, uint16_t val);
+uint32_t set_endian32(vm_mngr_t* vm_mngr, uint32_t val);
+uint64_t set_endian64(vm_mngr_t* vm_mngr, uint64_t val);
+
 unsigned char vm_MEM_LOOKUP_08(vm_mngr_t* vm_mngr, uint64_t addr);
 unsigned short vm_MEM_LOOKUP_16(vm_mngr_t* vm_mngr, uint64_t addr);
 unsigned int vm_MEM_LOOKUP_32(vm_mngr_t* vm_mngr, uint64_t addr);
@@ -172,7 +319,11 @@ unsigned int MEM_LOOKUP_32_PASSTHROUGH(uint64_t addr);
 uint64_t MEM_LOOKUP_64_PASSTHROUGH(uint64_t addr);
 
 int vm_read_mem(vm_mngr_t* vm_mngr, uint64_t addr, char** buffer_ptr, uint64_t size);
+int vm_strlen(vm_mngr_t* vm_mngr, uint64_t addr, unsigned int unit_size,
+	      uint64_t max_size, uint64_t *length);
 int vm_write_mem(vm_mngr_t* vm_mngr, uint64_t addr, char *buffer, uint64_t size);
+int vm_write_mem_file(vm_mngr_t* vm_mngr, uint64_t addr, int fd,
+		      uint64_t offset, uint64_t size);
 
 
 unsigned int parity(unsigned int a);
@@ -283,9 +434,11 @@ struct code_bloc_node * create_code_bloc_node(uint64_t ad_start, uint64_t ad_sto
 void add_code_bloc(vm_mngr_t* vm_mngr, struct code_bloc_node* cbp);
 
 struct memory_page_node * create_memory_page_node(uint64_t ad, unsigned int size, unsigned int access);//memory_page* mp);
+void free_memory_page_node(struct memory_page_node * mpn);
 void init_memory_page_pool(vm_mngr_t* vm_mngr);
 void init_code_bloc_pool(vm_mngr_t* vm_mngr);
 void reset_memory_page_pool(vm_mngr_t* vm_mngr);
+void release_memory_pages(vm_mngr_t* vm_mngr);
 void reset_code_bloc_pool(vm_mngr_t* vm_mngr);
 void dump_code_bloc_pool(vm_mngr_t* vm_mngr);
 void add_memory_page(vm_mngr_t* vm_mngr, struct memory_page_node* mpn_a);
@@ -300,6 +453,10 @@ void add_memory_page(vm_mngr_t* vm_mngr, struct memory_page_node* mpn);
 
 void check_write_code_bloc(vm_mngr_t* vm_mngr, uint64_t my_size, uint64_t addr);
 
+void take_snapshot(vm_mngr_t* vm_mngr);
+void drop_snapshot(vm_mngr_t* vm_mngr);
+int restore_snapshot(vm_mngr_t* vm_mngr, PyObject* restored);
+
 
 char* dump(vm_mngr_t* vm_mngr);
 void dump_memory_breakpoint_pool(vm_mngr_t* vm_mngr);
@@ -139,11 +139,15 @@ PyObject* vm_add_memory_page(VmMngr* self, PyObject* args)
 	PyGetInt(addr, page_addr);
 	PyGetInt(access, page_access);
 
-	if(!PyString_Check(item_str))
-		RAISE(PyExc_TypeError,"arg must be str");
-
-	buf_size = PyString_Size(item_str);
-	PyString_AsStringAndSize(item_str, &buf_data, &length);
+	if (PyString_Check(item_str)) {
+		buf_size = PyString_Size(item_str);
+		PyString_AsStringAndSize(item_str, &buf_data, &length);
+	}
+	else {
+		/* Zero filled page, materialised on first write */
+		PyGetInt(item_str, buf_size);
+		buf_data = NULL;
+	}
 
 	/*
 	fprintf(stderr, "add page %"PRIX64" %"PRIX64" %"PRIX64"\n",
@@ -153,12 +157,12 @@ PyObject* vm_add_memory_page(VmMngr* self, PyObject* args)
 	if (mpn == NULL)
 		RAISE(PyExc_TypeError,"cannot create page");
 	if (is_mpn_in_tab(&self->vm_mngr, mpn)) {
-		free(mpn->ad_hp);
-		free(mpn);
+		free_memory_page_node(mpn);
 		RAISE(PyExc_TypeError,"known page in memory");
 	}
 
-	memcpy(mpn->ad_hp, buf_data, buf_size);
+	if (buf_data != NULL)
+		memcpy(mpn->ad_hp, buf_data, buf_size);
 	add_memory_page(&self->vm_mngr, mpn);
 
 	return PyLong_FromUnsignedLongLong((uint64_t)ret);
@@ -225,7 +229,36 @@ PyObject* vm_set_mem(VmMngr* self, PyObject* args)
        return Py_None;
 }
 
+PyObject* vm_set_mem_from_file(VmMngr* self, PyObject* args)
+{
+       PyObject *py_addr;
+       PyObject *py_file;
+       PyObject *py_offset;
+       PyObject *py_size;
+
+       uint64_t addr;
+       uint64_t offset;
+       uint64_t size;
+       int fd;
+
+       if (!PyArg_ParseTuple(args, "OOOO", &py_addr, &py_file, &py_offset,
+			     &py_size))
+	      return NULL;
+
+       PyGetInt(py_addr, addr);
+       PyGetInt(py_offset, offset);
+       PyGetInt(py_size, size);
 
+       fd = PyObject_AsFileDescriptor(py_file);
+       if (fd < 0)
+	      return NULL;
+
+       if (vm_write_mem_file(&self->vm_mngr, addr, fd, offset, size) < 0)
+	      return NULL;
+
+       Py_INCREF(Py_None);
+       return Py_None;
+}
 
 
 PyObject* vm_get_mem(VmMngr* self, PyObject* args)
@@ -406,6 +439,672 @@ PyObject* vm_get_all_memory(VmMngr* self, PyObject* args)
 	return dict;
 }
 
+PyObject* vm_trace_start(VmMngr* self, PyObject* args)
+{
+	PyObject *py_flags;
+	PyObject *py_capacity;
+	PyObject *cpu_state = Py_None;
+	PyObject *words = Py_None;
+	PyObject *seq = NULL;
+	Py_buffer view;
+	Py_ssize_t i, offset, state_len;
+	uint64_t flags;
+	uint64_t capacity;
+	int fd = -1;
+	struct trace_info *trace = &self->vm_mngr.trace;
+
+	if (!PyArg_ParseTuple(args, "OO|iOO", &py_flags, &py_capacity, &fd,
+			      &cpu_state, &words))
+		return NULL;
+
+	PyGetInt(py_flags, flags);
+	PyGetInt(py_capacity, capacity);
+
+	if (capacity == 0 || capacity > SIZE_MAX / sizeof(struct trace_record))
+		RAISE(PyExc_ValueError, "bad trace capacity");
+	if ((flags & TRACE_REGS) && cpu_state == Py_None)
+		RAISE(PyExc_ValueError, "a cpu state is needed to trace registers");
+
+	trace_flush(&self->vm_mngr);
+	trace_reset(&self->vm_mngr);
+
+	trace->records = malloc(capacity * sizeof(struct trace_record));
+	if (!trace->records)
+		return PyErr_NoMemory();
+	trace->capacity = capacity;
+	trace->fd = fd;
+
+	if (cpu_state != Py_None) {
+		if (PyObject_GetBuffer(cpu_state, &view, PyBUF_SIMPLE) < 0)
+			goto error;
+		/* The cpu state must outlive the trace (JitCpu states are never
+		   freed) */
+		trace->cpu = view.buf;
+		state_len = view.len;
+		PyBuffer_Release(&view);
+
+		seq = PySequence_Fast(words, "words must be a sequence");
+		if (!seq)
+			goto error;
+		trace->cpu_words_count = PySequence_Fast_GET_SIZE(seq);
+		trace->cpu_words = malloc(trace->cpu_words_count * sizeof(uint32_t) + 1);
+		trace->cpu_prev = malloc(trace->cpu_words_count * sizeof(uint64_t) + 1);
+		if (!trace->cpu_words || !trace->cpu_prev) {
+			PyErr_NoMemory();
+			goto error;
+		}
+		for (i = 0; i < (Py_ssize_t)trace->cpu_words_count; i++) {
+			offset = PyInt_AsSsize_t(PySequence_Fast_GET_ITEM(seq, i));
+			if (offset == -1 && PyErr_Occurred())
+				goto error;
+			if (offset < 0 || offset + (Py_ssize_t)sizeof(uint64_t) > state_len) {
+				PyErr_SetString(PyExc_ValueError,
+						"word out of the cpu state");
+				goto error;
+			}
+			trace->cpu_words[i] = (uint32_t)offset;
+			memcpy(&trace->cpu_prev[i], trace->cpu + offset,
+			       sizeof(uint64_t));
+			/* The trace starts with the whole registers state */
+			if (flags & TRACE_REGS)
+				trace_add(&self->vm_mngr, TRACE_REGS,
+					  sizeof(uint64_t), (uint32_t)offset, 0,
+					  trace->cpu_prev[i]);
+		}
+		Py_CLEAR(seq);
+	}
+
+	trace->flags = flags;
+	Py_INCREF(Py_None);
+	return Py_None;
+
+error:
+	Py_XDECREF(seq);
+	trace_reset(&self->vm_mngr);
+	return NULL;
+}
+
+PyObject* vm_trace_stop(VmMngr* self, PyObject* args)
+{
+	struct trace_info *trace = &self->vm_mngr.trace;
+	int error;
+
+	trace_flush(&self->vm_mngr);
+	trace->flags = 0;
+	trace->fd = -1;
+	if (trace->error) {
+		error = trace->error;
+		trace->error = 0;
+		errno = error;
+		return PyErr_SetFromErrno(PyExc_IOError);
+	}
+	return PyLong_FromUnsignedLongLong(trace->count);
+}
+
+PyObject* vm_get_trace(VmMngr* self, PyObject* args)
+{
+	struct trace_info *trace = &self->vm_mngr.trace;
+	PyObject *obj_out;
+	char *buffer;
+	uint64_t count, start, first;
+
+	if (!trace->records)
+		return PyString_FromStringAndSize(NULL, 0);
+
+	count = MIN(trace->count - trace->flushed, trace->capacity);
+	start = (trace->count - count) % trace->capacity;
+	first = MIN(count, trace->capacity - start);
+
+	obj_out = PyString_FromStringAndSize(NULL, count * sizeof(struct trace_record));
+	if (!obj_out)
+		return NULL;
+	buffer = PyString_AS_STRING(obj_out);
+	memcpy(buffer, &trace->records[start], first * sizeof(struct trace_record));
+	memcpy(buffer + first * sizeof(struct trace_record), trace->records,
+	       (count - first) * sizeof(struct trace_record));
+	return obj_out;
+}
+
+PyObject* vm_get_trace_flags(VmMngr* self, PyObject* args)
+{
+	return PyLong_FromUnsignedLongLong(self->vm_mngr.trace.flags);
+}
+
+PyObject* vm_trace_block(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_count;
+	uint64_t addr;
+	uint64_t count;
+
+	if (!PyArg_ParseTuple(args, "OO", &py_addr, &py_count))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	PyGetInt(py_count, count);
+
+	trace_block(&self->vm_mngr, addr, (uint32_t)count);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_trace_instr(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	uint64_t addr;
+
+	if (!PyArg_ParseTuple(args, "O", &py_addr))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+
+	trace_instr(&self->vm_mngr, addr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_trace_mem(VmMngr* self, PyObject* args)
+{
+	PyObject *py_type;
+	PyObject *py_addr;
+	PyObject *py_size;
+	PyObject *py_value;
+	uint64_t type;
+	uint64_t addr;
+	uint64_t size;
+	uint64_t value;
+
+	if (!PyArg_ParseTuple(args, "OOOO", &py_type, &py_addr, &py_size,
+			      &py_value))
+		return NULL;
+
+	PyGetInt(py_type, type);
+	PyGetInt(py_addr, addr);
+	PyGetInt(py_size, size);
+	PyGetInt(py_value, value);
+
+	if (type != TRACE_MEM_READ && type != TRACE_MEM_WRITE)
+		RAISE(PyExc_ValueError, "bad memory access type");
+	TRACE_MEM(&self->vm_mngr, type, (uint8_t)size, addr, value);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_coverage_start(VmMngr* self, PyObject* args)
+{
+	self->vm_mngr.coverage.enabled = 1;
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_coverage_stop(VmMngr* self, PyObject* args)
+{
+	self->vm_mngr.coverage.enabled = 0;
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_coverage_reset(VmMngr* self, PyObject* args)
+{
+	coverage_reset(&self->vm_mngr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_coverage_block(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_instrs;
+	PyObject *py_size;
+	uint64_t addr;
+	uint64_t instrs;
+	uint64_t size;
+
+	if (!PyArg_ParseTuple(args, "OOO", &py_addr, &py_instrs, &py_size))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	PyGetInt(py_instrs, instrs);
+	PyGetInt(py_size, size);
+
+	coverage_block(&self->vm_mngr, addr, (uint32_t)instrs, (uint32_t)size);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_set_budget(VmMngr* self, PyObject* args)
+{
+	PyObject *py_instructions;
+	PyObject *py_timeout;
+	uint64_t max_instructions = 0;
+	double timeout = 0;
+	int enabled = 0;
+
+	if (!PyArg_ParseTuple(args, "OO", &py_instructions, &py_timeout))
+		return NULL;
+
+	if (py_instructions != Py_None) {
+		PyGetInt(py_instructions, max_instructions);
+		enabled |= BUDGET_INSTRUCTIONS;
+	}
+	if (py_timeout != Py_None) {
+		timeout = PyFloat_AsDouble(py_timeout);
+		if (timeout == -1 && PyErr_Occurred())
+			return NULL;
+		if (timeout < 0)
+			RAISE(PyExc_ValueError, "negative timeout");
+		enabled |= BUDGET_TIME;
+	}
+	budget_set(&self->vm_mngr, enabled, max_instructions,
+		   (uint64_t)(timeout * 1000000));
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_get_budget(VmMngr* self, PyObject* args)
+{
+	return Py_BuildValue("(Ki)",
+			     (unsigned PY_LONG_LONG)self->vm_mngr.budget.executed,
+			     self->vm_mngr.budget.exhausted);
+}
+
+PyObject* vm_budget_block(VmMngr* self, PyObject* args)
+{
+	budget_block(&self->vm_mngr);
+	return PyInt_FromLong(self->vm_mngr.budget.enabled);
+}
+
+PyObject* vm_budget_instr(VmMngr* self, PyObject* args)
+{
+	budget_instr(&self->vm_mngr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_budget_refund(VmMngr* self, PyObject* args)
+{
+	budget_refund(&self->vm_mngr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static int coverage_entry_cmp(const void *entry1, const void *entry2)
+{
+	uint64_t addr1 = (*(struct coverage_entry**)entry1)->addr;
+	uint64_t addr2 = (*(struct coverage_entry**)entry2)->addr;
+
+	return addr1 < addr2 ? -1 : addr1 > addr2;
+}
+
+PyObject* vm_get_coverage(VmMngr* self, PyObject* args)
+{
+	struct coverage_info *coverage = &self->vm_mngr.coverage;
+	struct coverage_entry **entries;
+	PyObject *list;
+	PyObject *item;
+	uint64_t i, count = 0;
+
+	entries = malloc(coverage->used * sizeof(*entries) + 1);
+	if (!entries)
+		return PyErr_NoMemory();
+	for (i = 0; i < coverage->capacity; i++)
+		if (coverage->entries[i].count)
+			entries[count++] = &coverage->entries[i];
+	qsort(entries, count, sizeof(*entries), coverage_entry_cmp);
+
+	list = PyList_New(count);
+	if (!list)
+		goto end;
+	for (i = 0; i < count; i++) {
+		item = Py_BuildValue("(KKII)",
+				     (unsigned PY_LONG_LONG)entries[i]->addr,
+				     (unsigned PY_LONG_LONG)entries[i]->count,
+				     entries[i]->instrs, entries[i]->size);
+		if (!item) {
+			Py_DECREF(list);
+			list = NULL;
+			goto end;
+		}
+		PyList_SET_ITEM(list, i, item);
+	}
+end:
+	free(entries);
+	return list;
+}
+
+static PyObject* region_to_tuple(struct memory_page_node * mpn)
+{
+	return Py_BuildValue("(KKi)",
+			     (unsigned PY_LONG_LONG)mpn->ad,
+			     (unsigned PY_LONG_LONG)mpn->size,
+			     mpn->access);
+}
+
+PyObject* vm_is_mapped(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_size = NULL;
+	uint64_t addr;
+	uint64_t size = 1;
+
+	if (!PyArg_ParseTuple(args, "O|O", &py_addr, &py_size))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	if (py_size) {
+		PyGetInt(py_size, size);
+	}
+
+	return PyBool_FromLong(is_mapped(&self->vm_mngr, addr, size));
+}
+
+PyObject* vm_get_region(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	uint64_t addr;
+	struct memory_page_node * mpn;
+
+	if (!PyArg_ParseTuple(args, "O", &py_addr))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+
+	mpn = find_memory_page(&self->vm_mngr, addr);
+	if (!mpn){
+		Py_INCREF(Py_None);
+		return Py_None;
+	}
+	return region_to_tuple(mpn);
+}
+
+PyObject* vm_get_regions(VmMngr* self, PyObject* args)
+{
+	PyObject *list;
+	PyObject *region;
+	struct memory_page_node * mpn;
+
+	list = PyList_New(0);
+	if (!list)
+		return NULL;
+
+	LIST_FOREACH(mpn, &self->vm_mngr.memory_page_pool, next){
+		region = region_to_tuple(mpn);
+		if (!region || PyList_Append(list, region) < 0){
+			Py_XDECREF(region);
+			Py_DECREF(list);
+			return NULL;
+		}
+		Py_DECREF(region);
+	}
+	return list;
+}
+
+/* Read only buffer exporter on guest memory lying in one page. It keeps the
+   Vm alive, and refuses to export buffers once the memory may have been
+   unmapped since its creation. Exported buffers keep the host memory of
+   the page valid until they are released */
+typedef struct {
+	PyObject_HEAD
+	VmMngr *vm;
+	uint64_t addr;
+	uint64_t size;
+	uint64_t generation;
+} MemView;
+
+static void MemView_dealloc(MemView* self)
+{
+	Py_XDECREF(self->vm);
+	self->ob_type->tp_free((PyObject*)self);
+}
+
+static int MemView_getbuffer(MemView* self, Py_buffer* view, int flags)
+{
+	vm_mngr_t* vm_mngr = &self->vm->vm_mngr;
+	struct memory_page_node * mpn;
+
+	mpn = find_memory_page(vm_mngr, self->addr);
+	if (self->generation != vm_mngr->memory_generation || mpn == NULL) {
+		PyErr_SetString(PyExc_ValueError,
+				"guest memory unmapped since the view creation");
+		view->obj = NULL;
+		return -1;
+	}
+	if (PyBuffer_FillInfo(view, (PyObject*)self,
+			      (char*)mpn->ad_hp + (self->addr - mpn->ad),
+			      (Py_ssize_t)self->size, 1, flags) < 0)
+		return -1;
+	vm_mngr->memory_exports++;
+	return 0;
+}
+
+static void MemView_releasebuffer(MemView* self, Py_buffer* view)
+{
+	vm_mngr_t* vm_mngr = &self->vm->vm_mngr;
+
+	vm_mngr->memory_exports--;
+	release_memory_pages(vm_mngr);
+}
+
+static PyBufferProcs MemView_as_buffer = {
+	0,                                      /* bf_getreadbuffer */
+	0,                                      /* bf_getwritebuffer */
+	0,                                      /* bf_getsegcount */
+	0,                                      /* bf_getcharbuffer */
+	(getbufferproc)MemView_getbuffer,       /* bf_getbuffer */
+	(releasebufferproc)MemView_releasebuffer, /* bf_releasebuffer */
+};
+
+static PyTypeObject MemViewType = {
+	PyObject_HEAD_INIT(NULL)
+	0,                         /*ob_size*/
+	"VmMngr.MemView",          /*tp_name*/
+	sizeof(MemView),           /*tp_basicsize*/
+	0,                         /*tp_itemsize*/
+	(destructor)MemView_dealloc, /*tp_dealloc*/
+	0,                         /*tp_print*/
+	0,                         /*tp_getattr*/
+	0,                         /*tp_setattr*/
+	0,                         /*tp_compare*/
+	0,                         /*tp_repr*/
+	0,                         /*tp_as_number*/
+	0,                         /*tp_as_sequence*/
+	0,                         /*tp_as_mapping*/
+	0,                         /*tp_hash */
+	0,                         /*tp_call*/
+	0,                         /*tp_str*/
+	0,                         /*tp_getattro*/
+	0,                         /*tp_setattro*/
+	&MemView_as_buffer,        /*tp_as_buffer*/
+	Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER, /*tp_flags*/
+	"Buffer exporter on guest memory", /* tp_doc */
+};
+
+PyObject* vm_get_mem_view(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_len;
+	PyObject *obj_out;
+	PyObject *view;
+	MemView *exporter;
+	struct memory_page_node * mpn;
+	uint64_t addr;
+	uint64_t size;
+	char * buf_out;
+
+	if (!PyArg_ParseTuple(args, "OO", &py_addr, &py_len))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	PyGetInt(py_len, size);
+
+	mpn = find_memory_page(&self->vm_mngr, addr);
+	if (mpn != NULL && size <= mpn->size - (addr - mpn->ad)) {
+		/* View on the page memory */
+		exporter = PyObject_New(MemView, &MemViewType);
+		if (!exporter)
+			return NULL;
+		Py_INCREF(self);
+		exporter->vm = self;
+		exporter->addr = addr;
+		exporter->size = size;
+		exporter->generation = self->vm_mngr.memory_generation;
+		view = PyMemoryView_FromObject((PyObject*)exporter);
+		Py_DECREF(exporter);
+		return view;
+	}
+
+	/* The range spans several pages: view on a copy */
+	if (vm_read_mem(&self->vm_mngr, addr, &buf_out, size) < 0)
+		return NULL;
+	obj_out = PyString_FromStringAndSize(buf_out, size);
+	free(buf_out);
+	if (!obj_out)
+		return NULL;
+	view = PyMemoryView_FromObject(obj_out);
+	Py_DECREF(obj_out);
+	return view;
+}
+
+/* Return the raw content of the null terminated string described by @args
+   (address, max_char=None), made of @unit_size bytes characters */
+static PyObject* read_str(VmMngr* self, PyObject* args, unsigned int unit_size)
+{
+	PyObject *py_addr;
+	PyObject *py_max = Py_None;
+	PyObject *obj_out;
+	uint64_t addr;
+	uint64_t max_char;
+	uint64_t max_size = (uint64_t)-1;
+	uint64_t length;
+	char * buf_out;
+
+	if (!PyArg_ParseTuple(args, "O|O", &py_addr, &py_max))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	if (py_max != Py_None) {
+		PyGetInt(py_max, max_char);
+		if (max_char < max_size / unit_size)
+			max_size = max_char * unit_size;
+	}
+
+	if (vm_strlen(&self->vm_mngr, addr, unit_size, max_size, &length) < 0)
+		return NULL;
+	if (length == 0)
+		return PyString_FromStringAndSize(NULL, 0);
+	if (vm_read_mem(&self->vm_mngr, addr, &buf_out, length) < 0)
+		return NULL;
+	obj_out = PyString_FromStringAndSize(buf_out, length);
+	free(buf_out);
+	return obj_out;
+}
+
+PyObject* vm_get_c_str(VmMngr* self, PyObject* args)
+{
+	return read_str(self, args, 1);
+}
+
+PyObject* vm_get_wide_str(VmMngr* self, PyObject* args)
+{
+	PyObject *raw;
+	PyObject *obj_out;
+	int byteorder;
+
+	raw = read_str(self, args, 2);
+	if (!raw)
+		return NULL;
+	byteorder = self->vm_mngr.sex == __BIG_ENDIAN ? 1 : -1;
+	obj_out = PyUnicode_DecodeUTF16(PyString_AS_STRING(raw),
+					PyString_GET_SIZE(raw),
+					"replace", &byteorder);
+	Py_DECREF(raw);
+	return obj_out;
+}
+
+PyObject* vm_read_struct(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_fmt;
+	PyObject *struct_mod;
+	PyObject *py_size;
+	PyObject *data;
+	PyObject *obj_out = NULL;
+	uint64_t addr;
+	uint64_t size;
+	char * buf_out;
+
+	if (!PyArg_ParseTuple(args, "OO", &py_addr, &py_fmt))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+
+	struct_mod = PyImport_ImportModule("struct");
+	if (!struct_mod)
+		return NULL;
+	py_size = PyObject_CallMethod(struct_mod, "calcsize", "O", py_fmt);
+	if (!py_size)
+		goto out;
+	size = PyInt_AsLong(py_size);
+	Py_DECREF(py_size);
+
+	if (size == 0)
+		data = PyString_FromStringAndSize(NULL, 0);
+	else {
+		if (vm_read_mem(&self->vm_mngr, addr, &buf_out, size) < 0)
+			goto out;
+		data = PyString_FromStringAndSize(buf_out, size);
+		free(buf_out);
+	}
+	if (!data)
+		goto out;
+	obj_out = PyObject_CallMethod(struct_mod, "unpack", "OO", py_fmt, data);
+	Py_DECREF(data);
+out:
+	Py_DECREF(struct_mod);
+	return obj_out;
+}
+
+PyObject* vm_read_u32_array(VmMngr* self, PyObject* args)
+{
+	PyObject *py_addr;
+	PyObject *py_count;
+	PyObject *list;
+	PyObject *item;
+	uint64_t addr;
+	uint64_t count;
+	uint64_t i;
+	uint32_t value;
+	char * buf_out;
+
+	if (!PyArg_ParseTuple(args, "OO", &py_addr, &py_count))
+		return NULL;
+
+	PyGetInt(py_addr, addr);
+	PyGetInt(py_count, count);
+
+	if (count > PY_SSIZE_T_MAX / 4)
+		RAISE(PyExc_ValueError, "count too big");
+	list = PyList_New((Py_ssize_t)count);
+	if (!list || count == 0)
+		return list;
+	if (vm_read_mem(&self->vm_mngr, addr, &buf_out, count * 4) < 0){
+		Py_DECREF(list);
+		return NULL;
+	}
+	for (i = 0; i < count; i++){
+		memcpy(&value, buf_out + i * 4, sizeof(value));
+		item = PyInt_FromSize_t(set_endian32(&self->vm_mngr, value));
+		if (!item){
+			free(buf_out);
+			Py_DECREF(list);
+			return NULL;
+		}
+		PyList_SET_ITEM(list, (Py_ssize_t)i, item);
+	}
+	free(buf_out);
+	return list;
+}
+
 
 PyObject* vm_reset_memory_page_pool(VmMngr* self, PyObject* args)
 {
@@ -424,6 +1123,35 @@ PyObject* vm_reset_code_bloc_pool(VmMngr* self, PyObject* args)
 }
 
 
+PyObject* vm_snapshot(VmMngr* self, PyObject* args)
+{
+	take_snapshot(&self->vm_mngr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+PyObject* vm_restore_snapshot(VmMngr* self, PyObject* args)
+{
+	PyObject *restored;
+
+	restored = PyList_New(0);
+	if (restored == NULL)
+		return NULL;
+	if (restore_snapshot(&self->vm_mngr, restored) < 0) {
+		Py_DECREF(restored);
+		return NULL;
+	}
+	return restored;
+}
+
+PyObject* vm_drop_snapshot(VmMngr* self, PyObject* args)
+{
+	drop_snapshot(&self->vm_mngr);
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+
 PyObject* vm_add_code_bloc(VmMngr *self, PyObject *args)
 {
 	PyObject *item1;
@@ -515,6 +1243,8 @@ VmMngr_dealloc(VmMngr* self)
     vm_reset_memory_page_pool(self, NULL);
     vm_reset_code_bloc_pool(self, NULL);
     vm_reset_memory_breakpoint(self, NULL);
+    trace_reset(&self->vm_mngr);
+    coverage_reset(&self->vm_mngr);
     self->ob_type->tp_free((PyObject*)self);
 }
 
@@ -556,6 +1286,10 @@ static PyMethodDef VmMngr_methods[] = {
 	 "X"},
 	{"set_mem", (PyCFunction)vm_set_mem, METH_VARARGS,
 	 "X"},
+	{"set_mem_from_file", (PyCFunction)vm_set_mem_from_file, METH_VARARGS,
+	 "set_mem_from_file(address, file, offset, size): set memory at address "
+	 "with size bytes of file (object or descriptor) starting at offset. "
+	 "Whole host pages are mapped from the file (copy on write)"},
 	{"set_addr2obj", (PyCFunction)vm_set_addr2obj, METH_VARARGS,
 	 "X"},
 	{"add_code_bloc",(PyCFunction)vm_add_code_bloc, METH_VARARGS,
@@ -563,7 +1297,8 @@ static PyMethodDef VmMngr_methods[] = {
 	{"get_mem", (PyCFunction)vm_get_mem, METH_VARARGS,
 	 "X"},
 	{"add_memory_page",(PyCFunction)vm_add_memory_page, METH_VARARGS,
-	 "X"},
+	 "add_memory_page(address, access, data or size): map a new page. If "
+	 "a size is given, the page is zero filled"},
 	{"add_memory_breakpoint",(PyCFunction)vm_add_memory_breakpoint, METH_VARARGS,
 	 "X"},
 	{"remove_memory_breakpoint",(PyCFunction)vm_remove_memory_breakpoint, METH_VARARGS,
@@ -574,12 +1309,95 @@ static PyMethodDef VmMngr_methods[] = {
 	 "X"},
 	{"get_all_memory",(PyCFunction)vm_get_all_memory, METH_VARARGS,
 	 "X"},
+	{"is_mapped", (PyCFunction)vm_is_mapped, METH_VARARGS,
+	 "is_mapped(address, size=1): True if the size bytes starting at "
+	 "address are mapped"},
+	{"get_region", (PyCFunction)vm_get_region, METH_VARARGS,
+	 "get_region(address): (base, size, access) of the page containing "
+	 "address, or None"},
+	{"get_regions", (PyCFunction)vm_get_regions, METH_VARARGS,
+	 "get_regions(): list of the mapped pages (base, size, access), sorted "
+	 "by address. Page content is not copied"},
+	{"get_c_str", (PyCFunction)vm_get_c_str, METH_VARARGS,
+	 "get_c_str(address, max_char=None): null terminated string at "
+	 "address, of at most max_char characters"},
+	{"get_wide_str", (PyCFunction)vm_get_wide_str, METH_VARARGS,
+	 "get_wide_str(address, max_char=None): null terminated UTF-16 string "
+	 "at address, of at most max_char characters, as an unicode object"},
+	{"read_struct", (PyCFunction)vm_read_struct, METH_VARARGS,
+	 "read_struct(address, fmt): unpack the struct module format fmt from "
+	 "the memory at address"},
+	{"read_u32_array", (PyCFunction)vm_read_u32_array, METH_VARARGS,
+	 "read_u32_array(address, count): list of count 32 bits integers at "
+	 "address, in the VM endianness"},
+	{"get_mem_view", (PyCFunction)vm_get_mem_view, METH_VARARGS,
+	 "get_mem_view(address, size): read only memoryview on guest memory. "
+	 "If the range lies in one page, the view is on the page memory "
+	 "(zero copy), otherwise on a copy"},
 	{"reset_memory_page_pool", (PyCFunction)vm_reset_memory_page_pool, METH_VARARGS,
 	 "X"},
 	{"reset_memory_breakpoint", (PyCFunction)vm_reset_memory_breakpoint, METH_VARARGS,
 	 "X"},
 	{"reset_code_bloc_pool", (PyCFunction)vm_reset_code_bloc_pool, METH_VARARGS,
 	 "X"},
+	{"snapshot", (PyCFunction)vm_snapshot, METH_VARARGS,
+	 "Snapshot the memory and the exception flags (copy on write)"},
+	{"restore_snapshot", (PyCFunction)vm_restore_snapshot, METH_VARARGS,
+	 "Restore the last snapshot; return the list of the restored memory "
+	 "ranges (address, size)"},
+	{"drop_snapshot", (PyCFunction)vm_drop_snapshot, METH_VARARGS,
+	 "Forget the last snapshot"},
+	{"trace_start", (PyCFunction)vm_trace_start, METH_VARARGS,
+	 "trace_start(flags, capacity, fd=-1, cpu_state=None, words=None): "
+	 "record the TRACE_* events of flags in a buffer of capacity records. "
+	 "The buffer is a ring if fd is -1, else it is written to fd when full. "
+	 "Registers (TRACE_REGS) are tracked by 8 bytes words at the offsets "
+	 "words of the cpu_state buffer"},
+	{"trace_stop", (PyCFunction)vm_trace_stop, METH_VARARGS,
+	 "Stop the trace and flush it to its file; return the number of "
+	 "records emitted"},
+	{"get_trace", (PyCFunction)vm_get_trace, METH_VARARGS,
+	 "Raw trace records still in the buffer (not written to the file), "
+	 "oldest first"},
+	{"get_trace_flags", (PyCFunction)vm_get_trace_flags, METH_VARARGS,
+	 "TRACE_* events currently recorded"},
+	{"trace_block", (PyCFunction)vm_trace_block, METH_VARARGS,
+	 "trace_block(address, count): record the execution of a block of "
+	 "count instructions (for Python side jitters)"},
+	{"trace_instr", (PyCFunction)vm_trace_instr, METH_VARARGS,
+	 "trace_instr(address): record the execution of an instruction (for "
+	 "Python side jitters)"},
+	{"trace_mem", (PyCFunction)vm_trace_mem, METH_VARARGS,
+	 "trace_mem(type, address, size, value): record a memory access (for "
+	 "Python side jitters)"},
+	{"coverage_start", (PyCFunction)vm_coverage_start, METH_VARARGS,
+	 "Count the executions of each block"},
+	{"coverage_stop", (PyCFunction)vm_coverage_stop, METH_VARARGS,
+	 "Stop counting the blocks executions (counters are kept)"},
+	{"coverage_reset", (PyCFunction)vm_coverage_reset, METH_VARARGS,
+	 "Forget the blocks counters"},
+	{"coverage_block", (PyCFunction)vm_coverage_block, METH_VARARGS,
+	 "coverage_block(address, instrs, size): count an execution of a block "
+	 "of instrs instructions and size bytes (for Python side jitters)"},
+	{"get_coverage", (PyCFunction)vm_get_coverage, METH_VARARGS,
+	 "List of the executed blocks (address, count, instrs, size), sorted by "
+	 "address"},
+	{"set_budget", (PyCFunction)vm_set_budget, METH_VARARGS,
+	 "set_budget(max_instructions, timeout): limit the execution to "
+	 "max_instructions instructions and timeout seconds (None for no "
+	 "limit); EXCEPT_BUDGET is raised once a limit is reached. Reset the "
+	 "executed instructions counter"},
+	{"get_budget", (PyCFunction)vm_get_budget, METH_VARARGS,
+	 "(instructions executed since set_budget, BUDGET_* limits reached)"},
+	{"budget_block", (PyCFunction)vm_budget_block, METH_VARARGS,
+	 "budget_block(): check the budgets on a block entry and return the "
+	 "BUDGET_* limits enabled (for Python side jitters)"},
+	{"budget_instr", (PyCFunction)vm_budget_instr, METH_VARARGS,
+	 "budget_instr(): count an instruction before its execution (for Python "
+	 "side jitters)"},
+	{"budget_refund", (PyCFunction)vm_budget_refund, METH_VARARGS,
+	 "budget_refund(): uncount an instruction left on an exception (for "
+	 "Python side jitters)"},
 	{"set_alarm", (PyCFunction)set_alarm, METH_VARARGS,
 	 "X"},
 	{"get_exception",(PyCFunction)vm_get_exception, METH_VARARGS,
@@ -599,6 +1417,7 @@ static int
 VmMngr_init(VmMngr *self, PyObject *args, PyObject *kwds)
 {
 	memset(&(self->vm_mngr), 0, sizeof(self->vm_mngr));
+	self->vm_mngr.trace.fd = -1;
 	return 0;
 }
 
@@ -667,6 +1486,8 @@ initVmMngr(void)
 
     if (PyType_Ready(&VmMngrType) < 0)
 	return;
+    if (PyType_Ready(&MemViewType) < 0)
+	return;
 
     m = Py_InitModule("VmMngr", VmMngr_Methods);
     if (m == NULL)
@@ -6,26 +6,11 @@ BASE_SB_PATH = "file_sb"
 
 
 def get_str_ansi(jitter, ad_str, max_char=None):
-    l = 0
-    tmp = ad_str
-    while ((max_char is None or l < max_char) and
-           jitter.vm.get_mem(tmp, 1) != "\x00"):
-        tmp += 1
-        l += 1
-    return jitter.vm.get_mem(ad_str, l)
+    return jitter.get_str_ansi(ad_str, max_char)
 
 
 def get_str_unic(jitter, ad_str, max_char=None):
-    l = 0
-    tmp = ad_str
-    while ((max_char is None or l < max_char) and
-           jitter.vm.get_mem(tmp, 2) != "\x00\x00"):
-        tmp += 2
-        l += 2
-    s = jitter.vm.get_mem(ad_str, l)
-    # TODO: real unicode decoding
-    s = s[::2]
-    return s
+    return jitter.get_str_unic(ad_str, max_char)
 
 
 def set_str_ansi(s):
@@ -38,13 +23,59 @@ def set_str_unic(s):
 
 
 class heap(object):
-    "Light heap simulation"
+    """Light heap simulation
+
+    Allocations are carved out of large arenas (VM pages of @arena_size
+    bytes), rounded to size classes. Freed chunks are kept in a free list
+    per size class and reused by the next allocations of the same class.
+    Allocations bigger than half an arena get their own page.
+
+    Arenas are tied to the VM in which they are mapped: using the heap with
+    another VM starts new arenas. The heap state is saved and restored with
+    the jitter snapshots.
+    """
 
     addr = 0x20000000
     align = 0x1000
     size = 32
     mask = (1 << size) - 1
 
+    # Allocation granularity
+    chunk_align = 0x10
+    # Chunks up to this size are rounded to a multiple of @chunk_align,
+    # bigger ones to a power of two
+    small_size = 0x400
+    arena_size = 0x100000
+
+    def __init__(self):
+        self.vm = None
+        self.reset()
+
+    def reset(self):
+        "Forget all arenas and allocations"
+        # Current arena: next free address, end address
+        self.arena_ptr = self.arena_end = 0
+        # size class -> list of free chunks address
+        self.free_chunks = {}
+        # chunk address -> requested size
+        self.allocations = {}
+
+    def get_state(self):
+        "Return a copy of the heap state (see jitter.add_snapshot_object)"
+        free_chunks = dict((chunk_size, list(chunks))
+                           for chunk_size, chunks in self.free_chunks.items())
+        return (self.addr, self.arena_ptr, self.arena_end, free_chunks,
+                dict(self.allocations))
+
+    def set_state(self, state):
+        "Restore the heap @state returned by get_state"
+        (self.addr, self.arena_ptr, self.arena_end, free_chunks,
+         allocations) = state
+        # The state may be restored again
+        self.free_chunks = dict((chunk_size, list(chunks))
+                                for chunk_size, chunks in free_chunks.items())
+        self.allocations = dict(allocations)
+
     def next_addr(self, size):
         """
         @size: the size to allocate
@@ -55,16 +86,113 @@ class heap(object):
         self.addr &= self.mask ^ (self.align - 1)
         return ret
 
+    def size_class(self, size):
+        """Return the size of the chunk holding an allocation of @size bytes
+        @size: the size to allocate
+        """
+        if size <= self.small_size:
+            size = max(size, 1)
+            return (size + self.chunk_align - 1) & ~(self.chunk_align - 1)
+        if size > self.arena_size / 2:
+            return (size + self.align - 1) & ~(self.align - 1)
+        return 1 << (size - 1).bit_length()
+
+    def new_chunk(self, jitter, chunk_size):
+        """Carve a chunk of @chunk_size bytes from the current arena, mapping
+        a new arena if needed
+        @jitter: a jitter instance
+        @chunk_size: the chunk size
+        """
+        if chunk_size > self.arena_size / 2:
+            # Dedicated arena, the current one is kept
+            addr = self.next_addr(chunk_size)
+            jitter.vm.add_memory_page(addr, PAGE_READ | PAGE_WRITE,
+                                      chunk_size)
+            return addr
+        if self.arena_ptr + chunk_size > self.arena_end:
+            self.arena_ptr = self.next_addr(self.arena_size)
+            self.arena_end = self.arena_ptr + self.arena_size
+            jitter.vm.add_memory_page(self.arena_ptr, PAGE_READ | PAGE_WRITE,
+                                      self.arena_size)
+        addr = self.arena_ptr
+        self.arena_ptr += chunk_size
+        return addr
+
     def alloc(self, jitter, size):
         """
         @jitter: a jitter instance
         @size: the size to allocate
+        Return the address of a zero filled memory chunk of @size bytes
         """
-
-        addr = self.next_addr(size)
-        jitter.vm.add_memory_page(addr, PAGE_READ | PAGE_WRITE, "\x00" * size)
+        if jitter.vm is not self.vm:
+            self.vm = jitter.vm
+            self.reset()
+            jitter.add_snapshot_object(self)
+
+        chunk_size = self.size_class(size)
+        free_chunks = self.free_chunks.get(chunk_size)
+        if free_chunks:
+            addr = free_chunks.pop()
+            jitter.vm.set_mem(addr, "\x00" * size)
+        else:
+            addr = self.new_chunk(jitter, chunk_size)
+        self.allocations[addr] = size
         return addr
 
+    def free(self, jitter, addr):
+        """
+        @jitter: a jitter instance
+        @addr: address of the chunk to free
+        Return False if @addr is not an allocated chunk
+        """
+        if jitter.vm is not self.vm:
+            return False
+        size = self.allocations.pop(addr, None)
+        if size is None:
+            return False
+        self.free_chunks.setdefault(self.size_class(size), []).append(addr)
+        return True
+
+    def realloc(self, jitter, addr, size):
+        """
+        @jitter: a jitter instance
+        @addr: address of the chunk to resize (or 0)
+        @size: the new size
+        Return the address of the resized chunk, 0 if it has been freed or
+        if @addr is not an allocated chunk
+        """
+        if addr == 0:
+            return self.alloc(jitter, size)
+        if size == 0:
+            self.free(jitter, addr)
+            return 0
+        if jitter.vm is not self.vm:
+            return 0
+        old_size = self.allocations.get(addr)
+        if old_size is None:
+            return 0
+        if self.size_class(old_size) == self.size_class(size):
+            if size > old_size:
+                jitter.vm.set_mem(addr + old_size, "\x00" * (size - old_size))
+            self.allocations[addr] = size
+            return addr
+        new_addr = self.alloc(jitter, size)
+        jitter.vm.set_mem(new_addr,
+                          jitter.vm.get_mem(addr, min(old_size, size)))
+        self.free(jitter, addr)
+        return new_addr
+
+    def get_size(self, addr):
+        """Return the requested size of the allocated chunk at @addr, or None
+        @addr: chunk address
+        """
+        return self.allocations.get(addr)
+
+    def leaks(self):
+        """Return the list of the (address, size) of the chunks not freed,
+        sorted by address"""
+        return sorted(self.allocations.iteritems())
+
 
 def windows_to_sbpath(path):
     """Convert a Windows path to a valid filename within the sandbox
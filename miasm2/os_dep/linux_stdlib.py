@@ -65,28 +65,18 @@ def xxx_puts(jitter):
     writes the string s and a trailing newline to stdout.
     '''
     ret_addr, args = jitter.func_args_stdcall(['s'])
-    index = args.s
-    char = jitter.vm.get_mem(index, 1)
-    while char != '\x00':
-        stdout.write(char)
-        index += 1
-        char = jitter.vm.get_mem(index, 1)
+    stdout.write(jitter.get_str_ansi(args.s))
     stdout.write('\n')
     return jitter.func_ret_stdcall(ret_addr, 1)
 
 
 def get_fmt_args(jitter, fmt, cur_arg):
     output = ""
-    while True:
-        char = jitter.vm.get_mem(fmt, 1)
-        fmt += 1
-        if char == '\x00':
-            break
+    fmt = iter(jitter.get_str_ansi(fmt))
+    for char in fmt:
         if char == '%':
             token = '%'
-            while True:
-                char = jitter.vm.get_mem(fmt, 1)
-                fmt += 1
+            for char in fmt:
                 token += char
                 if char.lower() in '%cdfsux':
                     break
@@ -148,8 +138,26 @@ def xxx_malloc(jitter):
     jitter.func_ret_stdcall(ret_ad, addr)
 
 
+def xxx_calloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["nmemb", "size"])
+    size = args.nmemb * args.size
+    if size > linobjs.heap.mask:
+        # Overflow
+        addr = 0
+    else:
+        addr = linobjs.heap.alloc(jitter, size)
+    jitter.func_ret_stdcall(ret_ad, addr)
+
+
+def xxx_realloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["ptr", "size"])
+    addr = linobjs.heap.realloc(jitter, args.ptr, args.size)
+    jitter.func_ret_stdcall(ret_ad, addr)
+
+
 def xxx_free(jitter):
     ret_ad, args = jitter.func_args_stdcall(["ptr"])
+    linobjs.heap.free(jitter, args.ptr)
     jitter.func_ret_stdcall(ret_ad, 0)
 
 
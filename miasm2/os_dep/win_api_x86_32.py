@@ -16,7 +16,7 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 #
 import struct
-import inspect
+import sys
 import os
 import stat
 import time
@@ -232,7 +232,7 @@ process_list = [
 
 
 def whoami():
-    return inspect.stack()[1][3]
+    return sys._getframe(1).f_code.co_name
 
 
 class hobj:
@@ -256,10 +256,23 @@ def kernel32_HeapAlloc(jitter):
 
 
 def kernel32_HeapFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["heap", "flags", "pmem"])
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem"])
+    winobjs.heap.free(jitter, args.pmem)
     jitter.func_ret_stdcall(ret_ad, 1)
 
 
+def kernel32_HeapReAlloc(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem", "size"])
+    alloc_addr = winobjs.heap.realloc(jitter, args.pmem, args.size)
+    jitter.func_ret_stdcall(ret_ad, alloc_addr)
+
+
+def kernel32_HeapSize(jitter):
+    ret_ad, args = jitter.func_args_stdcall(["heap", "flags", "pmem"])
+    size = winobjs.heap.get_size(args.pmem)
+    jitter.func_ret_stdcall(ret_ad, 0xFFFFFFFF if size is None else size)
+
+
 def kernel32_GlobalAlloc(jitter):
     ret_ad, args = jitter.func_args_stdcall(["uflags", "msize"])
     alloc_addr = winobjs.heap.alloc(jitter, args.msize)
@@ -267,7 +280,8 @@ def kernel32_GlobalAlloc(jitter):
 
 
 def kernel32_LocalFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["lpvoid"])
+    ret_ad, args = jitter.func_args_stdcall(["lpvoid"])
+    winobjs.heap.free(jitter, args.lpvoid)
     jitter.func_ret_stdcall(ret_ad, 0)
 
 
@@ -278,7 +292,8 @@ def kernel32_LocalAlloc(jitter):
 
 
 def kernel32_GlobalFree(jitter):
-    ret_ad, _ = jitter.func_args_stdcall(["addr"])
+    ret_ad, args = jitter.func_args_stdcall(["addr"])
+    winobjs.heap.free(jitter, args.addr)
     jitter.func_ret_stdcall(ret_ad, 0)
 
 
@@ -736,17 +751,17 @@ def kernel32_VirtualAlloc(jitter):
     if args.lpvoid == 0:
         alloc_addr = winobjs.heap.next_addr(args.dwsize)
         jitter.vm.add_memory_page(
-            alloc_addr, access_dict[args.flprotect], "\x00" * args.dwsize)
+            alloc_addr, access_dict[args.flprotect], args.dwsize)
     else:
-        all_mem = jitter.vm.get_all_memory()
-        if args.lpvoid in all_mem:
+        region = jitter.vm.get_region(args.lpvoid)
+        if region is not None and region[0] == args.lpvoid:
             alloc_addr = args.lpvoid
             jitter.vm.set_mem_access(args.lpvoid, access_dict[args.flprotect])
         else:
             alloc_addr = winobjs.heap.next_addr(args.dwsize)
             # alloc_addr = args.lpvoid
             jitter.vm.add_memory_page(
-                alloc_addr, access_dict[args.flprotect], "\x00" * args.dwsize)
+                alloc_addr, access_dict[args.flprotect], args.dwsize)
 
     log.debug('Memory addr: %x', alloc_addr)
     jitter.func_ret_stdcall(ret_ad, alloc_addr)
@@ -1096,7 +1111,7 @@ def ntdll_RtlHashUnicodeString(jitter):
     if args.h_id != 1:
         raise ValueError('unk hash unicode', args.h_id)
 
-    l1, l2, ptra = struct.unpack('HHL', jitter.vm.get_mem(args.ad_ctxu, 8))
+    l1, l2, ptra = jitter.vm.read_struct(args.ad_ctxu, 'HHI')
     s = jitter.vm.get_mem(ptra, l1)
     s = s[:-1]
     hv = 0
@@ -1131,10 +1146,8 @@ def ntdll_RtlFindCharInUnicodeString(jitter):
     if args.flags != 0:
         raise ValueError('unk flags')
 
-    ml1, ml2, mptra = struct.unpack('HHL',
-                                    jitter.vm.get_mem(args.main_str_ad, 8))
-    sl1, sl2, sptra = struct.unpack(
-        'HHL', jitter.vm.get_mem(args.search_chars_ad, 8))
+    ml1, ml2, mptra = jitter.vm.read_struct(args.main_str_ad, 'HHI')
+    sl1, sl2, sptra = jitter.vm.read_struct(args.search_chars_ad, 'HHI')
     main_data = jitter.vm.get_mem(mptra, ml1)[:-1]
     search_data = jitter.vm.get_mem(sptra, sl1)[:-1]
 
@@ -1259,8 +1272,8 @@ def ntoskrnl_RtlGetVersion(jitter):
 def ntoskrnl_RtlVerifyVersionInfo(jitter):
     ret_ad, args = jitter.func_args_stdcall(['ptr_version'])
 
-    s = jitter.vm.get_mem(args.ptr_version, 0x5 * 4)
-    s_size, s_majv, s_minv, s_buildn, s_platform = struct.unpack('IIIII', s)
+    s_size, s_majv, s_minv, s_buildn, s_platform = jitter.vm.read_struct(
+        args.ptr_version, 'IIIII')
     raise NotImplementedError("Untested case")
     # jitter.vm.set_mem(args.ptr_version, s)
     # jitter.func_ret_stdcall(ret_ad, 0)
@@ -1350,9 +1363,7 @@ def ntoskrnl_ExAllocatePoolWithTagPriority(jitter):
     ret_ad, args = jitter.func_args_stdcall(["pool_type",
                                              "nbr_of_bytes",
                                              "tag", "priority"])
-    alloc_addr = winobjs.heap.next_addr(args.nbr_of_bytes)
-    jitter.vm.add_memory_page(
-        alloc_addr, PAGE_READ | PAGE_WRITE, "\x00" * args.nbr_of_bytes)
+    alloc_addr = winobjs.heap.alloc(jitter, args.nbr_of_bytes)
 
     jitter.func_ret_stdcall(ret_ad, alloc_addr)
 
@@ -1705,7 +1716,7 @@ def ntdll_ZwAllocateVirtualMemory(jitter):
 
     alloc_addr = winobjs.heap.next_addr(dwsize)
     jitter.vm.add_memory_page(
-        alloc_addr, access_dict[args.flprotect], "\x00" * dwsize)
+        alloc_addr, access_dict[args.flprotect], dwsize)
     jitter.vm.set_mem(args.lppvoid, pck32(alloc_addr))
 
     jitter.func_ret_stdcall(ret_ad, 0)
@@ -1731,14 +1742,12 @@ def ntdll_RtlInitString(jitter):
 def ntdll_RtlAnsiStringToUnicodeString(jitter):
     ret_ad, args = jitter.func_args_stdcall(["dst", "src", "alloc_str"])
 
-    l1, l2, p_src = struct.unpack('HHI', jitter.vm.get_mem(args.src, 0x8))
+    l1, l2, p_src = jitter.vm.read_struct(args.src, 'HHI')
     s = get_str_ansi(jitter, p_src)
     s = ("\x00".join(s + "\x00"))
     l = len(s) + 1
     if args.alloc_str:
-        alloc_addr = winobjs.heap.next_addr(l)
-        jitter.vm.add_memory_page(
-            alloc_addr, PAGE_READ | PAGE_WRITE, "\x00" * l)
+        alloc_addr = winobjs.heap.alloc(jitter, l)
     else:
         alloc_addr = p_src
     jitter.vm.set_mem(alloc_addr, s)
@@ -1751,8 +1760,7 @@ def ntdll_LdrLoadDll(jitter):
     ret_ad, args = jitter.func_args_stdcall(["path", "flags",
                                              "modname", "modhandle"])
 
-    l1, l2, p_src = struct.unpack('HHI',
-                                  jitter.vm.get_mem(args.modname, 0x8))
+    l1, l2, p_src = jitter.vm.read_struct(args.modname, 'HHI')
     s = get_str_unic(jitter, p_src)
     libname = s.lower()
 
@@ -1773,7 +1781,7 @@ def ntdll_LdrGetProcedureAddress(jitter):
     ret_ad, args = jitter.func_args_stdcall(["libbase", "pfname",
                                              "opt", "p_ad"])
 
-    l1, l2, p_src = struct.unpack('HHI', jitter.vm.get_mem(args.pfname, 0x8))
+    l1, l2, p_src = jitter.vm.read_struct(args.pfname, 'HHI')
     fname = get_str_ansi(jitter, p_src)
 
     ad = winobjs.runtime_dll.lib_get_add_func(args.libbase, fname)
@@ -2315,24 +2323,20 @@ def kernel32_VirtualQuery(jitter):
     }
     access_dict_inv = dict([(x[1], x[0]) for x in access_dict.iteritems()])
 
-    all_mem = jitter.vm.get_all_memory()
-    found = None
-    for basead, m in all_mem.iteritems():
-        if basead <= args.ad < basead + m['size']:
-            found = args.ad, m
-            break
-    if not found:
+    region = jitter.vm.get_region(args.ad)
+    if region is None:
         raise ValueError('cannot find mem', hex(args.ad))
+    basead, size, access = region
 
     if args.dwl != 0x1c:
         raise ValueError('strange mem len', hex(args.dwl))
     s = struct.pack('IIIIIII',
                     args.ad,
                     basead,
-                    access_dict_inv[m['access']],
-                    m['size'],
+                    access_dict_inv[access],
+                    size,
                     0x1000,
-                    access_dict_inv[m['access']],
+                    access_dict_inv[access],
                     0x01000000)
     jitter.vm.set_mem(args.lpbuffer, s)
     jitter.func_ret_stdcall(ret_ad, args.dwl)
@@ -2473,8 +2477,26 @@ def msvcrt_malloc(jitter):
     jitter.func_ret_cdecl(ret_ad, addr)
 
 
+def msvcrt_calloc(jitter):
+    ret_ad, args = jitter.func_args_cdecl(["num", "size"])
+    size = args.num * args.size
+    if size > winobjs.heap.mask:
+        # Overflow
+        addr = 0
+    else:
+        addr = winobjs.heap.alloc(jitter, size)
+    jitter.func_ret_cdecl(ret_ad, addr)
+
+
+def msvcrt_realloc(jitter):
+    ret_ad, args = jitter.func_args_cdecl(["ptr", "msize"])
+    addr = winobjs.heap.realloc(jitter, args.ptr, args.msize)
+    jitter.func_ret_cdecl(ret_ad, addr)
+
+
 def msvcrt_free(jitter):
-    ret_ad, _ = jitter.func_args_cdecl(["ptr"])
+    ret_ad, args = jitter.func_args_cdecl(["ptr"])
+    winobjs.heap.free(jitter, args.ptr)
     jitter.func_ret_cdecl(ret_ad, 0)
 
 
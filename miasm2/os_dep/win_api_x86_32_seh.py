@@ -553,8 +553,7 @@ def fake_seh_handler(myjit, except_code):
     seh_ptr = upck32(myjit.vm.get_mem(tib_address, 4))
 
     # Retrieve seh fields
-    old_seh, eh, safe_place = struct.unpack(
-        'III', myjit.vm.get_mem(seh_ptr, 0xc))
+    old_seh, eh, safe_place = myjit.vm.read_u32_array(seh_ptr, 3)
 
     # Get space on stack for exception handling
     myjit.cpu.ESP -= 0x3c8
@@ -623,7 +622,7 @@ def dump_seh(myjit):
         if loop > MAX_SEH:
             log.warn("Too many seh, quit")
             return
-        prev_seh, eh = struct.unpack('II', myjit.vm.get_mem(cur_seh_ptr, 8))
+        prev_seh, eh = myjit.vm.read_u32_array(cur_seh_ptr, 2)
         log.info('\t' * indent + 'seh_ptr: %x { prev_seh: %x eh %x }',
                  cur_seh_ptr, prev_seh, eh)
         if prev_seh in [0xFFFFFFFF, 0]:
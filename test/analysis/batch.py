@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from elfesteem import pe_init
+
+from miasm2.analysis.batch import BatchWorker, run_batch, EXIT_RETURN, \
+    EXIT_STOPPED, EXIT_TIMEOUT, EXIT_INSTRUCTIONS, EXIT_ERROR
+from miasm2.analysis.machine import Machine
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32
+from miasm2.core import parse_asm, asmbloc
+from miasm2.core.interval import interval
+
+machine = Machine("x86_32")
+
+SAMPLES = {
+    "api": '''
+main:
+    PUSH 0
+    PUSH title
+    PUSH msg
+    PUSH 0
+    CALL DWORD PTR [ MessageBoxA ]
+    PUSH 0x40
+    PUSH 0x1000
+    PUSH 0x1000
+    PUSH 0
+    CALL DWORD PTR [ VirtualAlloc ]
+    MOV  DWORD PTR [EAX], 0x1
+    RET
+title:
+.string "Hello!"
+msg:
+.string "World!"
+''',
+    "loop": '''
+main:
+    INC  EAX
+    JMP  main
+''',
+    "crash": '''
+main:
+    MOV  EAX, DWORD PTR [0x10]
+    RET
+''',
+    "exit": '''
+main:
+    PUSH 0
+    CALL DWORD PTR [ ExitProcess ]
+    RET
+''',
+}
+
+
+def build_pe(source, fname):
+    "Assemble @source in the PE @fname, importing a few functions"
+    pe = pe_init.PE()
+    s_text = pe.SHList.add_section(name="text", addr=0x1000, rawsize=0x1000)
+    s_iat = pe.SHList.add_section(name="iat", rawsize=0x100)
+    imports = [("USER32.dll", s_iat.addr, ["MessageBoxA"]),
+               ("KERNEL32.dll", s_iat.addr + 0x80, ["VirtualAlloc",
+                                                    "ExitProcess"])]
+    new_dll = [({"name": dllname, "firstthunk": firstthunk}, funcs)
+               for dllname, firstthunk, funcs in imports]
+    pe.DirImport.add_dlldesc(new_dll)
+    s_myimp = pe.SHList.add_section(name="myimp", rawsize=len(pe.DirImport))
+    pe.DirImport.set_rva(s_myimp.addr)
+    pe.Opthdr.AddressOfEntryPoint = s_text.addr
+
+    blocks, symbol_pool = parse_asm.parse_txt(machine.mn, 32, source)
+    symbol_pool.set_offset(symbol_pool.getby_name("main"),
+                           pe.rva2virt(s_text.addr))
+    for _, firstthunk, funcs in imports:
+        for i, func in enumerate(funcs):
+            symbol_pool.set_offset(symbol_pool.getby_name_create(func),
+                                   pe.rva2virt(firstthunk + 4 * i))
+    dst_interval = interval([(pe.rva2virt(s_text.addr),
+                              pe.rva2virt(s_text.addr + s_text.size))])
+    patches = asmbloc.asm_resolve_final(machine.mn, blocks, symbol_pool,
+                                        dst_interval)
+    for offset, raw in patches.items():
+        s_text.data[offset - pe.rva2virt(s_text.addr)] = raw
+    open(fname, "wb").write(str(pe))
+    return symbol_pool
+
+
+def kernel32_ExitProcess(jitter):
+    ret_ad, _ = jitter.func_args_stdcall(["exitcode"])
+    jitter.func_ret_stdcall(ret_ad, 0)
+    jitter.run = False
+
+
+class TestBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.samples = {}
+        cls.symbols = {}
+        for name, source in SAMPLES.iteritems():
+            fname = os.path.join(cls.directory, name + ".exe")
+            cls.symbols[name] = build_pe(source, fname)
+            cls.samples[name] = fname
+        cls.options = Sandbox_Win_x86_32.parser().parse_args(["--jitter",
+                                                              "python"])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def test_worker(self):
+        worker = BatchWorker(self.options,
+                             {"kernel32_ExitProcess": kernel32_ExitProcess})
+        regions = worker.jitter.vm.get_regions()
+
+        result = worker.run_sample(self.samples["api"])
+        self.assertEqual(result["exit"], EXIT_RETURN)
+        self.assertEqual(result["error"], None)
+        calls = result["api_calls"]
+        self.assertEqual([call[0] for call in calls],
+                         ["user32_MessageBoxA", "kernel32_VirtualAlloc"])
+        self.assertEqual(calls[0][2], 0)
+        stats = result["stats"]
+        self.assertEqual(stats["api_calls"], 2)
+        self.assertEqual(stats["instructions"], 12)
+        # Back to the initial state
+        self.assertEqual(worker.jitter.vm.get_regions(), regions)
+        self.assertEqual(worker.jitter.vm.is_mapped(calls[1][2]), False)
+        # Same result for a new run
+        result2 = worker.run_sample(self.samples["api"])
+        self.assertEqual(result2["api_calls"], calls)
+        self.assertEqual(result2["stats"]["instructions"], 12)
+
+        result = worker.run_sample(self.samples["exit"])
+        self.assertEqual(result["exit"], EXIT_STOPPED)
+        self.assertEqual([call[0] for call in result["api_calls"]],
+                         ["kernel32_ExitProcess"])
+
+        result = worker.run_sample(self.samples["crash"])
+        self.assertEqual(result["exit"], EXIT_ERROR)
+        self.assertNotEqual(result["error"], None)
+
+        result = worker.run_sample(self.samples["loop"], timeout=0.2)
+        self.assertEqual(result["exit"], EXIT_TIMEOUT)
+        self.assertTrue(result["stats"]["duration"] >= 0.2)
+
+        result = worker.run_sample(self.samples["loop"],
+                                   max_instructions=2000)
+        self.assertEqual(result["exit"], EXIT_INSTRUCTIONS)
+        self.assertTrue(result["stats"]["instructions"] >= 2000)
+
+        # The worker is still usable
+        result = worker.run_sample(self.samples["api"])
+        self.assertEqual(result["api_calls"], calls)
+        self.assertEqual(worker.jitter.vm.get_regions(), regions)
+
+    def test_run_batch(self):
+        fnames = [self.samples[name] for name in ["api", "loop", "exit"] * 2]
+        custom_methods = {"kernel32_ExitProcess": kernel32_ExitProcess}
+        results = list(run_batch(fnames, self.options, workers=0,
+                                 timeout=0.5, custom_methods=custom_methods))
+        self.assertEqual([result["sample"] for result in results], fnames)
+        self.assertEqual([result["exit"] for result in results],
+                         [EXIT_RETURN, EXIT_TIMEOUT, EXIT_STOPPED] * 2)
+
+        # Worker processes
+        results_mp = list(run_batch(fnames, self.options, workers=2,
+                                    timeout=0.5,
+                                    custom_methods=custom_methods))
+        self.assertEqual(sorted((result["sample"], result["exit"],
+                                 result["api_calls"])
+                                for result in results_mp),
+                         sorted((result["sample"], result["exit"],
+                                 result["api_calls"])
+                                for result in results))
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestBatch)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
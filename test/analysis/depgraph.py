@@ -5,7 +5,7 @@ from miasm2.ir.analysis import ira
 from miasm2.ir.ir import ir, irbloc
 from miasm2.core.graph import DiGraph
 from miasm2.analysis.depgraph import DependencyNode, DependencyGraph,\
-    DependencyDict
+    DependencyDict, SolverSession
 from itertools import count
 
 EMULATION=True
@@ -106,10 +106,10 @@ class GraphTest(DiGraph):
         if (set([n.nostep_repr for n in self._nodes]) !=
                 set([n.nostep_repr for n in graph.nodes()])):
             return False
-        if (sorted([(src.nostep_repr, dst.nostep_repr)
-                    for (src, dst) in self._edges])
-        != sorted([(src.nostep_repr, dst.nostep_repr)
-                   for (src, dst) in graph.edges()])):
+        if (set([(src.nostep_repr, dst.nostep_repr)
+                 for (src, dst) in self._edges])
+        != set([(src.nostep_repr, dst.nostep_repr)
+                for (src, dst) in graph.edges()])):
             return False
         return True
 
@@ -1131,6 +1131,16 @@ for test_nb, test in enumerate([(G1_IRA, G1_INPUT, G1_OUTPUT),
                                    ]):
         if g_ind == 4:
             # TODO: Implicit specifications
+            if EMULATION:
+                # A shared solver session must agree with standalone solvers
+                session = SolverSession(g_ira)
+                for result in g_dep.get_from_depnodes(depnodes, heads):
+                    emul_result = result.emul()
+                    is_sat = result.is_satisfiable
+                    if (result.emul(session=session) != emul_result or
+                            result.is_satisfiable != is_sat):
+                        FAILED.add((test_nb + 1, "session"))
+                assert len(session.stats) > 0
             continue
         print " - Class %s - %s" % (g_dep.__class__.__name__,
                                     suffix_key_list[g_ind])
@@ -1149,10 +1159,16 @@ for test_nb, test in enumerate([(G1_IRA, G1_INPUT, G1_OUTPUT),
                        [depnode.element for
                         depnode in depnodes],
                        list(depnodes)[0].line_nb,
-                       heads)
+                       heads),
+             (result for _, result in g_dep.get_many(
+                 [(list(depnodes)[0].label,
+                   [depnode.element for depnode in depnodes],
+                   list(depnodes)[0].line_nb,
+                   heads)],
+                 processes=2, ordered=True)),
              ]):
-            print " - - API %s" % ("get_from_depnodes"
-                                   if api_i == 0 else "get")
+            print " - - API %s" % ["get_from_depnodes", "get",
+                                   "get_many"][api_i]
 
             # Expand result iterator
             g_list = list(g_list)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import socket
+import struct
+import threading
+import time
+import unittest
+
+from miasm2.analysis.debugging import Debugguer
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+CODE_ADDR = 0x400000
+DATA_ADDR = 0x500000
+DATA = "".join(chr(i & 0xFF) for i in xrange(0x2000))
+
+machine = Machine("x86_32")
+
+ASM = '''
+main:
+    MOV    EAX, 0x11223344
+    MOV    EBX, DWORD PTR [0x500000]
+loop:
+    INC    ECX
+    JMP    loop
+fault:
+    MOV    EAX, 0x1
+    MOV    EBX, DWORD PTR [0x10]
+    JMP    fault
+'''
+
+
+# Unreachable from main, the other snippet is placed explicitly
+CODE, LABELS = assemble_at(machine, ASM, {"main": CODE_ADDR,
+                                          "fault": CODE_ADDR + 0x80})
+LOOP_ADDR, FAULT_ADDR = LABELS["loop"], LABELS["fault"]
+
+
+def pack32(value):
+    return struct.pack("<I", value).encode("hex")
+
+
+class GdbClient(object):
+
+    "Minimal GDB client, speaking the remote serial protocol"
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(("localhost", port), timeout=30)
+        self.buffer = ""
+        self.ack_mode = True
+
+    def recv(self):
+        data = self.sock.recv(0x10000)
+        if not data:
+            raise EOFError("Connection closed")
+        self.buffer += data
+
+    def read_char(self):
+        if not self.buffer:
+            self.recv()
+        char, self.buffer = self.buffer[0], self.buffer[1:]
+        return char
+
+    def send(self, msg, escape=False):
+        if escape:
+            msg = "".join("}" + chr(ord(char) ^ 0x20) if char in "#$}*"
+                          else char for char in msg)
+        checksum = sum(bytearray(msg)) & 0xFF
+        self.sock.sendall("$%s#%02x" % (msg, checksum))
+        if self.ack_mode:
+            assert self.read_char() == "+"
+
+    def read_packet(self):
+        while True:
+            start = self.buffer.find("$")
+            end = self.buffer.find("#", start)
+            if start != -1 and end != -1 and len(self.buffer) >= end + 3:
+                break
+            self.recv()
+        # Nothing, even acks, between packets in no-ack mode
+        if not self.ack_mode:
+            assert start == 0
+        packet = self.buffer[start + 1:end]
+        checksum = int(self.buffer[end + 1:end + 3], 16)
+        self.buffer = self.buffer[end + 3:]
+        assert checksum == sum(bytearray(packet)) & 0xFF
+        if self.ack_mode:
+            self.sock.sendall("+")
+        return packet
+
+    def query(self, msg, escape=False):
+        self.send(msg, escape)
+        return self.read_packet()
+
+    def close(self):
+        self.sock.close()
+
+
+class TestGdbServer(unittest.TestCase):
+
+    def setUp(self):
+        jitter = jitter_at(machine, "python", CODE, CODE_ADDR)
+        jitter.vm.add_memory_page(DATA_ADDR, PAGE_READ | PAGE_WRITE, DATA)
+        self.dbg = Debugguer(jitter)
+        self.dbg.init_run(CODE_ADDR)
+        self.server = machine.gdbserver(self.dbg, 0)
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.daemon = True
+        self.thread.start()
+        self.client = GdbClient(self.server.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.thread.join(10)
+
+    def test_session(self):
+        client = self.client
+        self.assertEqual(client.query("qSupported:swbreak+"),
+                         "PacketSize=10000;QStartNoAckMode+")
+        # Bad checksum
+        client.sock.sendall("$g#00")
+        self.assertEqual(client.read_char(), "-")
+        self.assertEqual(client.query("QStartNoAckMode"), "OK")
+        client.ack_mode = False
+        self.assertEqual(client.query("?"), "S05")
+        self.assertEqual(client.query("qUnknown"), "")
+
+        # Registers
+        regs = client.query("g")
+        self.assertEqual(regs[8 * 8:9 * 8], pack32(CODE_ADDR))
+        self.assertEqual(client.query("P3=%s" % pack32(0x1234)), "OK")
+        self.assertEqual(client.query("p3"), pack32(0x1234))
+        self.assertEqual(client.query("p100"), "E00")
+
+        # Step
+        self.assertEqual(client.query("vCont?"), "vCont;c;C;s;S")
+        self.assertEqual(client.query("vCont;s:1;c"), "S05")
+        self.assertEqual(client.query("p8"), pack32(CODE_ADDR + 5))
+        self.assertEqual(client.query("p0"), pack32(0x11223344))
+
+        # Memory: a large read, a partial read and an unmapped one
+        self.assertEqual(client.query("m%x,%x" % (DATA_ADDR, len(DATA))),
+                         DATA.encode("hex"))
+        self.assertEqual(client.query("m%x,20" % (DATA_ADDR + 0x1FF0)),
+                         DATA[-0x10:].encode("hex"))
+        self.assertEqual(client.query("m0,10"), "E14")
+
+        # Binary and hex writes
+        self.assertEqual(client.query("X%x,0:" % DATA_ADDR), "OK")
+        payload = "}#$*\x00\xff"
+        self.assertEqual(client.query("X%x,%x:%s" % (DATA_ADDR, len(payload),
+                                                     payload),
+                                      escape=True), "OK")
+        self.assertEqual(client.query("M%x,2:abcd" % (DATA_ADDR + 6)), "OK")
+        self.assertEqual(client.query("m%x,8" % DATA_ADDR),
+                         (payload + "\xab\xcd").encode("hex"))
+        self.assertEqual(client.query("X0,1:a"), "E14")
+
+        # Breakpoint
+        self.assertEqual(client.query("Z0,%x,1" % LOOP_ADDR), "OK")
+        self.assertEqual(client.query("vCont;c"), "S05")
+        self.assertEqual(client.query("p8"), pack32(LOOP_ADDR))
+        self.assertEqual(client.query("p3"), pack32(0x2a24237d))
+        self.assertEqual(client.query("z0,%x,1" % LOOP_ADDR), "OK")
+
+        # Interrupt the infinite loop
+        client.send("c")
+        time.sleep(0.3)
+        client.sock.sendall("\x03")
+        self.assertEqual(client.read_packet(), "S02")
+        ecx = struct.unpack("<I", client.query("p1").decode("hex"))[0]
+        self.assertTrue(ecx > 0)
+
+        # Patch the jitted loop: INC ECX -> INC EDX
+        self.assertEqual(client.query("M%x,1:42" % LOOP_ADDR), "OK")
+        client.send("c")
+        time.sleep(0.3)
+        client.sock.sendall("\x03")
+        self.assertEqual(client.read_packet(), "S02")
+        self.assertEqual(client.query("p1"), pack32(ecx))
+        self.assertNotEqual(client.query("p2"), pack32(0))
+
+        # Detach, and attach again
+        self.assertEqual(client.query("D"), "OK")
+        client.close()
+        self.client = client = GdbClient(self.server.port)
+        self.assertEqual(client.query("?"), "S02")
+
+        # Kill
+        client.send("k")
+        self.thread.join(10)
+        self.assertFalse(self.thread.is_alive())
+
+    def test_fault(self):
+        client = self.client
+        # An access violation stops the target, the server goes on
+        self.assertEqual(client.query("c%x" % FAULT_ADDR), "S0B")
+        self.assertEqual(client.query("?"), "S0B")
+        self.assertEqual(client.query("p8"), pack32(FAULT_ADDR))
+        # The fault is raised again on resume
+        self.assertEqual(client.query("c"), "S0B")
+        self.assertEqual(client.query("s"), "S05")
+        self.assertEqual(client.query("s"), "S0B")
+        self.assertEqual(client.query("p8"), pack32(FAULT_ADDR + 5))
+        self.assertEqual(client.query("s%x" % CODE_ADDR), "S05")
+        self.assertEqual(client.query("p8"), pack32(CODE_ADDR + 5))
+
+        # Fix the faulting instruction: MOV EBX, 0x10
+        self.assertEqual(client.query("M%x,5:bb10000000" % (FAULT_ADDR + 5)),
+                         "OK")
+        self.assertEqual(client.query("Z0,%x,1" % FAULT_ADDR), "OK")
+        self.assertEqual(client.query("c%x" % (FAULT_ADDR + 5)), "S05")
+        self.assertEqual(client.query("p8"), pack32(FAULT_ADDR))
+        self.assertEqual(client.query("p3"), pack32(0x10))
+        client.send("k")
+        self.thread.join(10)
+        self.assertFalse(self.thread.is_alive())
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestGdbServer)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
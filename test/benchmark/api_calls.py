@@ -0,0 +1,81 @@
+"""Benchmark emulated API calls in a Sandbox_Win_x86_32: dispatch
+GetProcAddress and GetTickCount stubs directly, then run a loop calling
+them"""
+import time
+
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32
+from miasm2.core import parse_asm, asmbloc
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+from miasm2.os_dep import win_api_x86_32
+
+CODE_ADDR = 0x10000000
+DATA_ADDR = 0x10100000
+
+parser = Sandbox_Win_x86_32.parser(description=__doc__)
+parser.add_argument("filename", nargs="?",
+                    default="../../example/samples/box_upx.exe",
+                    help="PE loaded in the sandbox (default: box_upx.exe)")
+parser.add_argument("-n", "--calls", type=int, default=2000,
+                    help="Number of loop iterations")
+parser.set_defaults(jitter="python")
+options = parser.parse_args()
+
+sb = Sandbox_Win_x86_32(options.filename, options, win_api_x86_32.__dict__)
+jitter = sb.jitter
+runtime = win_api_x86_32.winobjs.runtime_dll
+kernel32 = runtime.lib_get_add_base("kernel32.dll")
+
+ASM = '''
+main:
+    MOV    ESI, %(calls)d
+loop:
+    PUSH   %(name)d
+    PUSH   %(kernel32)d
+    MOV    EAX, %(GetProcAddress)d
+    CALL   EAX
+    CALL   EAX
+    DEC    ESI
+    JNZ    loop
+end:
+    RET
+''' % {"calls": options.calls,
+       "name": DATA_ADDR,
+       "kernel32": kernel32,
+       "GetProcAddress": runtime.lib_get_add_func(kernel32,
+                                                  "GetProcAddress")}
+
+blocks, symbol_pool = parse_asm.parse_txt(sb.machine.mn, 32, ASM)
+symbol_pool.set_offset(symbol_pool.getby_name("main"), CODE_ADDR)
+patches = asmbloc.asm_resolve_final(sb.machine.mn, blocks, symbol_pool)
+jitter.vm.add_memory_page(CODE_ADDR, PAGE_READ | PAGE_WRITE, 0x1000)
+for offset, raw in patches.items():
+    jitter.vm.set_mem(offset, raw)
+jitter.vm.add_memory_page(DATA_ADDR, PAGE_READ | PAGE_WRITE,
+                          "GetTickCount\x00")
+jitter.add_breakpoint(symbol_pool.getby_name("end").offset,
+                      lambda jitter: False)
+
+# Stub dispatch only
+get_proc_address = runtime.lib_get_add_func(kernel32, "GetProcAddress")
+get_tick_count = runtime.lib_get_add_func(kernel32, "GetTickCount")
+start = time.time()
+for _ in xrange(options.calls):
+    jitter.push_uint32_t(DATA_ADDR)
+    jitter.push_uint32_t(kernel32)
+    jitter.push_uint32_t(CODE_ADDR)
+    jitter.pc = get_proc_address
+    jitter.handle_lib(jitter)
+    jitter.push_uint32_t(CODE_ADDR)
+    jitter.pc = get_tick_count
+    jitter.handle_lib(jitter)
+duration = time.time() - start
+print "%-8s: %d API calls: %.3fs, %.1f calls/s" % (
+    "dispatch", 2 * options.calls, duration, 2 * options.calls / duration)
+
+# Emulated code
+start = time.time()
+jitter.init_run(CODE_ADDR)
+jitter.continue_run()
+duration = time.time() - start
+print "%-8s: %d API calls: %.3fs, %.1f calls/s" % (
+    "run", 2 * options.calls, duration, 2 * options.calls / duration)
@@ -0,0 +1,88 @@
+"""Benchmark the assembler (parse_asm.parse_txt, asm_resolve_final) on a
+generated x86_32 program"""
+import random
+import resource
+import time
+from argparse import ArgumentParser
+
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.core import parse_asm, asmbloc, cpu
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--instructions", type=int, default=5000,
+                    help="Number of instructions of the generated program")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+parser.add_argument("--stream", action="store_true",
+                    help="Only parse the program, line by line, using "
+                    "parse_txt_stream")
+args = parser.parse_args()
+
+REGS = ["EAX", "EBX", "ECX", "EDX", "ESI", "EDI"]
+INSTRS = [
+    lambda rnd: "MOV %s, 0x%x" % (rnd.choice(REGS), rnd.randrange(1 << 32)),
+    lambda rnd: "ADD %s, %s" % (rnd.choice(REGS), rnd.choice(REGS)),
+    lambda rnd: "XOR %s, 0x%x" % (rnd.choice(REGS), rnd.randrange(0x100)),
+    lambda rnd: "LEA %s, DWORD PTR [%s + 0x%x]" % (rnd.choice(REGS),
+                                                    rnd.choice(REGS),
+                                                    rnd.randrange(0x1000)),
+    lambda rnd: "MOV DWORD PTR [%s], %s" % (rnd.choice(REGS),
+                                            rnd.choice(REGS)),
+    lambda rnd: "INC %s" % rnd.choice(REGS),
+    lambda rnd: "PUSH %s" % rnd.choice(REGS),
+    lambda rnd: "POP %s" % rnd.choice(REGS),
+]
+
+
+def gen_lines(nb_instrs, rnd):
+    """Yield the lines of a x86_32 program of about @nb_instrs
+    instructions, made of blocks ending with conditional jumps to random
+    (near or far) blocks"""
+    nb_blocks = max(1, nb_instrs / 10)
+    for block_nb in xrange(nb_blocks):
+        yield "lbl_%d:" % block_nb
+        for _ in xrange(9):
+            yield "    " + rnd.choice(INSTRS)(rnd)
+        yield "    JZ lbl_%d" % rnd.randrange(nb_blocks)
+    yield "    RET"
+
+
+if args.stream:
+    start = time.time()
+    nb_blocks = nb_lines = 0
+    symbol_pool = asmbloc.asm_symbol_pool()
+    for bloc in parse_asm.parse_txt_stream(mn_x86, 32,
+                                           gen_lines(args.instructions,
+                                                     random.Random(args.seed)),
+                                           symbol_pool):
+        nb_blocks += 1
+        nb_lines += len(bloc.lines)
+    duration = time.time() - start
+    print "parse_txt_stream:   %8.3fs %10d instr/s" % (duration,
+                                                       nb_lines / duration)
+    print "%d blocks, max RSS: %d KB" % (
+        nb_blocks, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    exit(0)
+
+source = "\n".join(gen_lines(args.instructions, random.Random(args.seed)))
+
+start = time.time()
+blocs, symbol_pool = parse_asm.parse_txt(mn_x86, 32, source)
+duration = time.time() - start
+nb_lines = sum(len(bloc.lines) for bloc in blocs)
+print "parse_txt:          %8.3fs %10d instr/s" % (duration,
+                                                   nb_lines / duration)
+print "%d operand scans, max RSS: %d KB" % (
+    cpu.total_scans, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+symbol_pool.set_offset(symbol_pool.getby_name("lbl_0"), 0)
+start = time.time()
+stats = {}
+patches = asmbloc.asm_resolve_final(mn_x86, blocs, symbol_pool, stats=stats)
+duration = time.time() - start
+print "asm_resolve_final:  %8.3fs %10d instr/s" % (duration,
+                                                   nb_lines / duration)
+print "%(iterations)d iterations, %(blocks)d blocks assembled, " \
+    "%(encoded)d/%(instructions)d instructions encoded" % stats
+print "%d instructions, %d bytes" % (nb_lines,
+                                     sum(len(x) for x in patches.values()))
@@ -0,0 +1,30 @@
+"""Benchmark the per sample setup cost: a new Sandbox_Win_x86_32 for each
+sample, or a warm BatchWorker loading the sample then restoring its
+environment"""
+import time
+
+from miasm2.analysis.batch import BatchWorker
+from miasm2.analysis.sandbox import Sandbox_Win_x86_32
+
+parser = Sandbox_Win_x86_32.parser(description=__doc__)
+parser.add_argument("filename", nargs="?",
+                    default="../../example/samples/box_upx.exe",
+                    help="PE to load (default: box_upx.exe sample)")
+parser.add_argument("-n", "--iterations", type=int, default=20,
+                    help="Number of iterations")
+args = parser.parse_args()
+
+start = time.time()
+for _ in xrange(args.iterations):
+    Sandbox_Win_x86_32(args.filename, args)
+sandbox = time.time() - start
+
+worker = BatchWorker(args)
+start = time.time()
+for _ in xrange(args.iterations):
+    worker.load(args.filename)
+    worker.reset()
+batch = time.time() - start
+
+print "Sandbox: %.1f samples/s" % (args.iterations / sandbox)
+print "BatchWorker: %.1f samples/s" % (args.iterations / batch)
@@ -0,0 +1,65 @@
+"""Benchmark raw decode throughput: linear sweep disassembly of a file, read
+through a bin_stream"""
+import random
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.bin_stream import bin_stream_str, bin_stream_file
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("filename", nargs="?",
+                    default="../../example/samples/box_upx.exe",
+                    help="File to decode (default: box_upx.exe sample)")
+parser.add_argument("-m", "--architecture", default="x86_32",
+                    help="Architecture used to decode the file")
+parser.add_argument("-n", "--max-bytes", type=int, default=None,
+                    help="Only decode the first bytes of the file")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+args = parser.parse_args()
+
+machine = Machine(args.architecture)
+mn, attrib = machine.mn, machine.dis_engine(None).attrib
+
+
+def bench_getbits(bs, size, rnd):
+    "Read 100000 random bit fields from @bs"
+    fields = []
+    for _ in xrange(100000):
+        length = rnd.choice([1, 3, 8, 16, 32])
+        fields.append((rnd.randrange((size - 8) * 8), length))
+    start = time.time()
+    for offset, length in fields:
+        bs.getbits(offset, length)
+    duration = time.time() - start
+    print "%-20s getbits: %10d fields/s" % (bs.__class__.__name__,
+                                            len(fields) / duration)
+
+
+def bench_decode(bs, size):
+    "Decode @bs from its start, one instruction after the other"
+    offset = nb_instrs = 0
+    start = time.time()
+    while offset < size:
+        try:
+            instr = mn.dis(bs, attrib, offset)
+        except Exception:
+            offset += 1
+            continue
+        nb_instrs += 1
+        offset += instr.l
+    duration = time.time() - start
+    print "%-20s decode:  %10d instr/s %10d bytes/s" % (
+        bs.__class__.__name__, nb_instrs / duration, size / duration)
+
+
+with open(args.filename) as fdesc:
+    data = fdesc.read()
+    size = len(data) if args.max_bytes is None else min(args.max_bytes,
+                                                        len(data))
+    print "%s: %d bytes decoded as %s" % (args.filename, size,
+                                          args.architecture)
+    for bs in [bin_stream_str(data), bin_stream_file(fdesc)]:
+        bench_getbits(bs, size, random.Random(args.seed))
+        bench_decode(bs, size)
@@ -0,0 +1,57 @@
+"""Benchmark the execution budgets overhead on a simple counting loop"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--iterations", type=int, default=500,
+                    help="Number of loop iterations")
+parser.add_argument("-j", "--jitter", default="python",
+                    help="Jitter engine (tcc, llvm, python)")
+args = parser.parse_args()
+
+ASM = '''
+main:
+    MOV    ECX, %d
+loop:
+    ADD    EAX, ECX
+    XOR    EBX, EAX
+    DEC    ECX
+    JNZ    loop
+    RET
+''' % args.iterations
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+code, _ = assemble_at(machine, ASM, {"main": CODE_ADDR})
+jitter = jitter_at(machine, args.jitter, code, CODE_ADDR, RET_ADDR)
+
+
+def run(**budget):
+    start = time.time()
+    call_at(jitter, CODE_ADDR, RET_ADDR, **budget)
+    return time.time() - start
+
+# Jit the blocks first
+run()
+
+# Best of 3 interleaved runs
+references, instructions, timeouts = [], [], []
+for _ in xrange(3):
+    references.append(run())
+    instructions.append(run(max_instructions=1 << 62))
+    timeouts.append(run(timeout=3600))
+reference = min(references)
+
+print "%d iterations: %.3fs without budget" % (args.iterations, reference)
+for name, durations in [("instructions", instructions),
+                        ("time", timeouts)]:
+    duration = min(durations)
+    print "%s budget: %.3fs (%+.1f%%)" % (name, duration,
+                                          (duration - reference) * 100 /
+                                          reference)
+print "%d instructions counted" % jitter.get_executed_instructions()
@@ -0,0 +1,56 @@
+"""Benchmark the blocks execution counters overhead on a simple counting
+loop"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--iterations", type=int, default=500,
+                    help="Number of loop iterations")
+parser.add_argument("-j", "--jitter", default="python",
+                    help="Jitter engine (tcc, llvm, python)")
+args = parser.parse_args()
+
+ASM = '''
+main:
+    MOV    ECX, %d
+loop:
+    ADD    EAX, ECX
+    XOR    EBX, EAX
+    DEC    ECX
+    JNZ    loop
+    RET
+''' % args.iterations
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+code, _ = assemble_at(machine, ASM, {"main": CODE_ADDR})
+jitter = jitter_at(machine, args.jitter, code, CODE_ADDR, RET_ADDR)
+
+
+def run():
+    start = time.time()
+    call_at(jitter, CODE_ADDR, RET_ADDR)
+    return time.time() - start
+
+# Jit the blocks first
+run()
+
+# Best of 3 interleaved runs
+references, durations = [], []
+for _ in xrange(3):
+    references.append(run())
+    jitter.coverage_start(reset=False)
+    durations.append(run())
+    jitter.coverage_stop()
+reference, duration = min(references), min(durations)
+
+print "%d iterations: %.3fs uninstrumented, %.3fs with counters (%+.1f%%)" % (
+    args.iterations, reference, duration,
+    (duration - reference) * 100 / reference)
+print "%d blocks, %d instructions counted" % (
+    len(jitter.get_coverage()), jitter.get_instructions_count())
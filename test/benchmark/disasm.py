@@ -0,0 +1,73 @@
+"""Benchmark parallel disassembly (disasmEngine.dis_multibloc_many) on a
+synthetic x86_32 binary, and report blocks/s scaling with the number of worker
+processes"""
+import multiprocessing
+import random
+import struct
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.bin_stream import bin_stream_str
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-f", "--functions", type=int, default=2000,
+                    help="Number of functions of the synthetic binary")
+parser.add_argument("-b", "--blocks", type=int, default=50,
+                    help="Number of conditional blocks per function")
+parser.add_argument("-p", "--processes", type=int, nargs="+", default=None,
+                    help="Numbers of worker processes to bench (default: 1, "
+                    "2, 4, ... up to the number of CPUs)")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+args = parser.parse_args()
+
+
+def gen_binary(nb_funcs, nb_blocks, rnd):
+    """Return a x86_32 binary of @nb_funcs functions, and their offsets
+    Each function is made of @nb_blocks conditional blocks (INC EAX, JZ +1,
+    INC EAX), followed by a call to a random function and a RET"""
+    func_size = nb_blocks * 4 + 6
+    data = []
+    for func_nb in xrange(nb_funcs):
+        data.append("\x40\x74\x01\x40" * nb_blocks)
+        call_next = func_nb * func_size + func_size - 1
+        call_dst = rnd.randrange(nb_funcs) * func_size
+        data.append("\xe8" + struct.pack("<i", call_dst - call_next) + "\xc3")
+    return "".join(data), range(0, nb_funcs * func_size, func_size)
+
+
+data, offsets = gen_binary(args.functions, args.blocks,
+                           random.Random(args.seed))
+print "Synthetic binary: %d functions, %d bytes" % (len(offsets), len(data))
+machine = Machine("x86_32")
+
+processes = args.processes
+if processes is None:
+    processes = [1]
+    while processes[-1] * 2 <= multiprocessing.cpu_count():
+        processes.append(processes[-1] * 2)
+
+# Sequential reference
+mdis = machine.dis_engine(bin_stream_str(data))
+start = time.time()
+nb_blocks = 0
+for offset in offsets:
+    mdis.job_done.clear()
+    nb_blocks += len(mdis.dis_multibloc(offset))
+reference = time.time() - start
+print "%-20s %8.3fs %10d blocks/s" % ("dis_multibloc", reference,
+                                      nb_blocks / reference)
+
+for nb_processes in processes:
+    mdis = machine.dis_engine(bin_stream_str(data))
+    start = time.time()
+    nb_blocks_many = 0
+    for _, blocs in mdis.dis_multibloc_many(offsets, processes=nb_processes,
+                                            chunksize=16):
+        nb_blocks_many += len(blocs)
+    duration = time.time() - start
+    assert nb_blocks_many == nb_blocks
+    print "%-20s %8.3fs %10d blocks/s (x%.2f)" % (
+        "%d process(es)" % nb_processes, duration, nb_blocks / duration,
+        reference / duration)
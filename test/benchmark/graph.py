@@ -0,0 +1,70 @@
+"""Benchmark dominator computations of DiGraph on synthetic CFGs"""
+import random
+import resource
+import time
+from argparse import ArgumentParser
+
+from miasm2.core.graph import DiGraph, CompactDiGraph
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--nodes", type=int, default=50000,
+                    help="Number of nodes of the synthetic graph")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+parser.add_argument("-c", "--compact", action="store_true",
+                    help="Use CompactDiGraph instead of DiGraph")
+args = parser.parse_args()
+
+
+def gen_cfg(graph_cls, nb_nodes, rnd):
+    """Return a CFG-like @graph_cls instance of @nb_nodes nodes, with a single
+    head (0) and a single leaf (@nb_nodes - 1): a fall-through chain, with
+    forward conditional branches and loops"""
+    graph = graph_cls()
+    for node in xrange(nb_nodes - 1):
+        graph.add_edge(node, node + 1)
+        dice = rnd.random()
+        if dice < 0.3:
+            # Forward branch
+            graph.add_uniq_edge(node, min(nb_nodes - 1,
+                                          node + rnd.randint(2, 50)))
+        elif dice < 0.4:
+            # Loop
+            graph.add_uniq_edge(node, max(0, node - rnd.randint(0, 50)))
+    return graph
+
+
+def bench(name, func, *fargs):
+    "Print the execution time of @func(*@fargs)"
+    start = time.time()
+    result = func(*fargs)
+    if hasattr(result, "next"):
+        result = list(result)
+    print "%-30s %8.3fs" % (name, time.time() - start)
+    return result
+
+
+graph_cls = CompactDiGraph if args.compact else DiGraph
+graph = bench("Graph generation", gen_cfg, graph_cls, args.nodes,
+              random.Random(args.seed))
+print "Max RSS after generation: %d MB" % (
+    resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+print "%s: %d nodes, %d edges" % (graph_cls.__name__, len(graph.nodes()),
+                                  len(graph.edges()))
+head, leaf = 0, args.nodes - 1
+
+dominators = bench("compute_dominators", graph.compute_dominators, head)
+bench("compute_postdominators", graph.compute_postdominators, leaf)
+bench("compute_immediate_dominators", graph.compute_immediate_dominators,
+      head)
+bench("compute_dominance_frontier", graph.compute_dominance_frontier, head)
+bench("compute_back_edges", graph.compute_back_edges, head)
+bench("walk_dominators (all nodes)",
+      lambda: [list(graph.walk_dominators(node, dominators))
+               for node in graph.nodes()])
+bench("reachable_sons", graph.reachable_sons, head)
+bench("walk_depth_first_forward", graph.walk_depth_first_forward, head)
+bench("del_edge (1000 edges)",
+      lambda: [graph.del_edge(node, node + 1) for node in xrange(1000)])
+print "Max RSS: %d MB" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                          / 1024)
@@ -0,0 +1,35 @@
+"""Benchmark the guest heap: random small allocations and frees"""
+import random
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.os_dep.common import heap
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--allocations", type=int, default=100000,
+                    help="Number of allocations")
+parser.add_argument("-l", "--live", type=int, default=1000,
+                    help="Maximum number of live allocations")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+args = parser.parse_args()
+
+rnd = random.Random(args.seed)
+jitter = Machine("x86_32").jitter("python")
+guest_heap = heap()
+
+live = []
+start = time.time()
+for _ in xrange(args.allocations):
+    live.append(guest_heap.alloc(jitter, rnd.randrange(1, 0x200)))
+    if len(live) > args.live:
+        addr = live.pop(rnd.randrange(len(live)))
+        guest_heap.free(jitter, addr)
+    # Touch the allocated memory
+    jitter.vm.get_mem(live[-1], 1)
+duration = time.time() - start
+
+print "%d allocations: %.3fs, %.1f allocs/s, %d VM pages" % (
+    args.allocations, duration, args.allocations / duration,
+    len(jitter.vm.get_regions()))
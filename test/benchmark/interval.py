@@ -0,0 +1,65 @@
+"""Benchmark interval on accumulated instruction ranges"""
+import random
+import time
+from argparse import ArgumentParser
+
+from miasm2.core.interval import interval
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--number", type=int, default=1000000,
+                    help="Number of instruction ranges")
+parser.add_argument("-s", "--seed", type=int, default=0,
+                    help="Random seed")
+parser.add_argument("-r", "--random-order", action="store_true",
+                    help="Accumulate ranges in random order instead of the "
+                    "disassembly one")
+args = parser.parse_args()
+
+
+def gen_ranges(number, rnd):
+    """Return @number instruction-like ranges: consecutive instructions of 1
+    to 15 bytes, with a gap between blocks"""
+    ranges = []
+    offset = 0x400000
+    for _ in xrange(number):
+        size = rnd.randint(1, 15)
+        ranges.append((offset, offset + size - 1))
+        offset += size
+        if rnd.random() < 0.2:
+            # End of block
+            offset += rnd.randint(1, 64)
+    return ranges
+
+
+def bench(name, func, *fargs):
+    "Print the execution time of @func(*@fargs)"
+    start = time.time()
+    result = func(*fargs)
+    print "%-30s %8.3fs" % (name, time.time() - start)
+    return result
+
+
+rnd = random.Random(args.seed)
+ranges = gen_ranges(args.number, rnd)
+if args.random_order:
+    rnd.shuffle(ranges)
+
+
+def accumulate():
+    done_interval = interval()
+    for start, stop in ranges:
+        done_interval.add(start, stop)
+    return done_interval
+
+done_interval = bench("add (%d ranges)" % args.number, accumulate)
+print "%d disjoint intervals" % len(done_interval)
+
+addresses = [rnd.randint(0x400000, ranges[-1][1]) for _ in xrange(100000)]
+bench("contains (100000 addresses)",
+      lambda: [address in done_interval for address in addresses])
+bench("overlap check (100000 ranges)",
+      lambda: [(interval([(address, address + 4)]) & done_interval).empty
+               for address in addresses])
+bench("remove (100000 ranges)",
+      lambda: [done_interval.remove(address, address + 4)
+               for address in addresses])
@@ -0,0 +1,36 @@
+"""Benchmark the Python jitter on a simple counting loop"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--iterations", type=int, default=500,
+                    help="Number of loop iterations")
+args = parser.parse_args()
+
+ASM = '''
+main:
+    MOV    ECX, %d
+loop:
+    ADD    EAX, ECX
+    XOR    EBX, EAX
+    DEC    ECX
+    JNZ    loop
+    RET
+''' % args.iterations
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+code, _ = assemble_at(machine, ASM, {"main": CODE_ADDR})
+jitter = jitter_at(machine, "python", code, CODE_ADDR, RET_ADDR)
+
+start = time.time()
+call_at(jitter, CODE_ADDR, RET_ADDR)
+duration = time.time() - start
+
+print "%d iterations: %.3fs, %.1f blocks/s" % (
+    args.iterations, duration, args.iterations / duration)
@@ -0,0 +1,44 @@
+"""Benchmark binary loading: map a PE or ELF file in a VM several times,
+copying its content from Python strings or reading it from the file"""
+import resource
+import time
+from argparse import ArgumentParser
+
+from miasm2.jitter import VmMngr
+from miasm2.jitter.loader.elf import vm_load_elf
+from miasm2.jitter.loader.pe import vm_load_pe
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("filename", nargs="?",
+                    default="../../example/samples/box_upx.exe",
+                    help="PE or ELF to load (default: box_upx.exe sample)")
+parser.add_argument("-n", "--iterations", type=int, default=20,
+                    help="Number of VM to load")
+parser.add_argument("-f", "--from-file", action="store_true",
+                    help="Let the VM read (and map) the file content")
+args = parser.parse_args()
+
+fstream = open(args.filename, "rb")
+data = fstream.read()
+vm_load = vm_load_elf if data.startswith("\x7fELF") else vm_load_pe
+kwargs = {"fstream": fstream} if args.from_file else {}
+
+def max_rss():
+    "Peak resident memory, in KB"
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# Create the VMs first, to only account for loaded pages
+vms = []
+for _ in xrange(args.iterations):
+    vm = VmMngr.Vm()
+    vm.init_memory_page_pool()
+    vms.append(vm)
+rss = max_rss()
+
+start = time.time()
+for vm in vms:
+    vm_load(vm, data, **kwargs)
+duration = time.time() - start
+
+print "%d loads: %.3fs, memory: %d KB" % (args.iterations, duration,
+                                          max_rss() - rss)
@@ -0,0 +1,68 @@
+"""Benchmark sandbox restarts: run the first blocks of a PE from its entry
+point, then come back to the initial state, either by reloading the PE in a
+new jitter or by restoring a VM snapshot"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.loader.pe import vm_load_pe
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("filename", nargs="?",
+                    default="../../example/samples/box_upx.exe",
+                    help="PE to run (default: box_upx.exe sample)")
+parser.add_argument("-j", "--jitter", default="python",
+                    help="Jitter engine (default: python)")
+parser.add_argument("-b", "--blocks", type=int, default=50,
+                    help="Number of blocks run at each iteration")
+parser.add_argument("-n", "--iterations", type=int, default=20,
+                    help="Number of iterations")
+args = parser.parse_args()
+
+data = open(args.filename).read()
+machine = Machine("x86_32")
+
+
+def load():
+    "Return a jitter with the PE loaded, and its entry point"
+    jitter = machine.jitter(args.jitter)
+    jitter.init_stack()
+    pe = vm_load_pe(jitter.vm, data)
+    return jitter, pe.rva2virt(pe.Opthdr.AddressOfEntryPoint)
+
+
+def run_blocks(jitter, entry_point):
+    "Run @args.blocks blocks from @entry_point"
+    jitter.init_run(entry_point)
+    for _ in xrange(args.blocks):
+        jitter.continue_run(step=True)
+
+
+def bench_reload():
+    "Reload the PE at each iteration"
+    start = time.time()
+    for _ in xrange(args.iterations):
+        jitter, entry_point = load()
+        run_blocks(jitter, entry_point)
+    duration = time.time() - start
+    print "%-10s: %10.1f runs/s" % ("reload", args.iterations / duration)
+
+
+def bench_restore():
+    "Restore a snapshot taken at the entry point at each iteration"
+    jitter, entry_point = load()
+    jitter.snapshot()
+    restore_time = 0
+    start = time.time()
+    for _ in xrange(args.iterations):
+        run_blocks(jitter, entry_point)
+        restore_start = time.time()
+        jitter.restore_snapshot()
+        restore_time += time.time() - restore_start
+    duration = time.time() - start
+    print "%-10s: %10.1f runs/s %10.1f restores/s" % (
+        "snapshot", args.iterations / duration, args.iterations / restore_time)
+
+
+bench_reload()
+bench_restore()
@@ -0,0 +1,36 @@
+"""Benchmark block discovery (dis_bloc_all / split_bloc) on a synthetic
+x86_32 function whose blocks are all split by backward jumps"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.bin_stream import bin_stream_str
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--blocks", type=int, default=100000,
+                    help="Number of blocks of the synthetic function")
+args = parser.parse_args()
+
+
+def gen_function(nb_blocks):
+    """Return a x86_32 function of @nb_blocks blocks
+    It is made of (INC EAX, INC EAX, JZ) segments; each JZ targets the second
+    INC of the previous segment, which has already been disassembled, so every
+    segment has to be split afterwards"""
+    data = []
+    for seg_nb in xrange(nb_blocks / 2):
+        # JZ targets: seg_nb * 4 - 3 (relative to the JZ end: -7)
+        # First segment targets its own second INC (-3)
+        data.append("\x40\x40\x74" + ("\xfd" if seg_nb == 0 else "\xf9"))
+    data.append("\xc3")
+    return "".join(data)
+
+
+data = gen_function(args.blocks)
+machine = Machine("x86_32")
+mdis = machine.dis_engine(bin_stream_str(data))
+start = time.time()
+blocs = mdis.dis_multibloc(0)
+print "dis_multibloc: %d blocks in %.3fs" % (len(blocs), time.time() - start)
+# All segments but the last one are split, plus the final RET block
+assert len(blocs) == args.blocks
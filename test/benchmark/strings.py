@@ -0,0 +1,30 @@
+"""Benchmark guest string reads: ANSI and wide strings of various lengths"""
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--reads", type=int, default=10000,
+                    help="Number of reads per string")
+parser.add_argument("-l", "--length", type=int, action="append",
+                    help="String length (can be repeated)")
+args = parser.parse_args()
+lengths = args.length or [8, 64, 512]
+
+jitter = Machine("x86_32").jitter("python")
+addr = 0x100000
+jitter.vm.add_memory_page(addr, PAGE_READ | PAGE_WRITE, 0x10000)
+
+for length in lengths:
+    for name, data, get_str in [
+            ("ansi", "A" * length + "\x00", jitter.get_str_ansi),
+            ("wide", "A\x00" * length + "\x00\x00", jitter.get_str_unic)]:
+        jitter.vm.set_mem(addr, data)
+        start = time.time()
+        for _ in xrange(args.reads):
+            get_str(addr)
+        duration = time.time() - start
+        print "%s, %4d chars: %.3fs, %.1f reads/s" % (
+            name, length, duration, args.reads / duration)
@@ -0,0 +1,74 @@
+"""Benchmark the execution trace overhead on a simple counting loop, with
+the trace kept in the ring buffer and written to a file"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+from miasm2.jitter.csts import TRACE_BLOCK
+
+parser = ArgumentParser(description=__doc__)
+parser.add_argument("-n", "--iterations", type=int, default=500,
+                    help="Number of loop iterations")
+parser.add_argument("-j", "--jitter", default="python",
+                    help="Jitter engine (tcc, llvm, python)")
+args = parser.parse_args()
+
+ASM = '''
+main:
+    MOV    ECX, %d
+loop:
+    ADD    EAX, ECX
+    XOR    EBX, EAX
+    DEC    ECX
+    JNZ    loop
+    RET
+''' % args.iterations
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+code, _ = assemble_at(machine, ASM, {"main": CODE_ADDR})
+jitter = jitter_at(machine, args.jitter, code, CODE_ADDR, RET_ADDR)
+
+
+def run():
+    start = time.time()
+    call_at(jitter, CODE_ADDR, RET_ADDR)
+    return time.time() - start
+
+# Jit the blocks first
+run()
+
+fdesc, fname = tempfile.mkstemp()
+os.close(fdesc)
+
+# Best of 3 interleaved runs
+references, buffered, written = [], [], []
+try:
+    for _ in xrange(3):
+        references.append(run())
+        jitter.trace_start(TRACE_BLOCK)
+        buffered.append(run())
+        records = jitter.trace_stop()
+        jitter.trace_start(TRACE_BLOCK, fname=fname)
+        start = time.time()
+        run()
+        # Include the final flush of the trace file
+        jitter.trace_stop()
+        written.append(time.time() - start)
+    size = os.path.getsize(fname)
+finally:
+    os.remove(fname)
+reference = min(references)
+
+print "%d iterations, %d blocks traced: %.3fs untraced" % (
+    args.iterations, records, reference)
+for name, duration in [("ring buffer", min(buffered)),
+                       ("trace file", min(written))]:
+    print "%s: %.3fs (%+.1f%%)" % (name, duration,
+                                   (duration - reference) * 100 / reference)
+print "%d bytes written to the trace file" % size
@@ -0,0 +1,116 @@
+import struct
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.bin_stream import bin_stream_str
+
+# Build functions calling each other:
+# func_i:
+#   INC EAX
+#   JZ  skip
+#   INC EAX
+# skip:
+#   CALL func_(i+1)
+#   RET
+FUNC_SIZE = 10
+nb_funcs = 20
+data = ""
+for func_nb in xrange(nb_funcs):
+    call_dst = ((func_nb + 1) % nb_funcs) * FUNC_SIZE
+    call_next = func_nb * FUNC_SIZE + 9
+    data += "\x40\x74\x01\x40\xe8" + struct.pack("<i", call_dst - call_next)
+    data += "\xc3"
+assert len(data) == nb_funcs * FUNC_SIZE
+
+machine = Machine("x86_32")
+offsets = range(0, len(data), FUNC_SIZE)
+
+
+def blocs2str(blocs):
+    "Return a canonical representation of @blocs"
+    out = []
+    for bloc in sorted(blocs, key=lambda bloc: bloc.label.offset):
+        out.append(str(bloc.label))
+        out += [str(line) for line in bloc.lines]
+        out += sorted(str(cst) for cst in bloc.bto)
+    return "\n".join(out)
+
+# Reference: each function is disassembled from scratch
+reference = {}
+for offset in offsets:
+    mdis = machine.dis_engine(bin_stream_str(data))
+    reference[offset] = blocs2str(mdis.dis_multibloc(offset))
+
+# Parallel disassembly; duplicated entry points are ignored
+mdis = machine.dis_engine(bin_stream_str(data))
+results = list(mdis.dis_multibloc_many(offsets + offsets[:3], processes=3))
+assert [offset for offset, _ in results] == offsets
+for offset, blocs in results:
+    assert blocs2str(blocs) == reference[offset]
+    assert len(blocs) == 4
+    # Labels are merged into the engine symbol_pool
+    for bloc in blocs:
+        assert mdis.symbol_pool.getby_offset(bloc.label.offset) is bloc.label
+        for cst in bloc.bto:
+            assert mdis.symbol_pool.getby_offset(cst.label.offset) is cst.label
+        # Expressions are usable with the merged labels
+        for instr in bloc.lines:
+            for arg in instr.args:
+                assert hash(arg) == hash(arg.copy())
+    # Disassembled offsets are marked as done
+    assert offset in mdis.job_done
+
+# Deterministic merge: same labels, created in the same order
+mdis2 = machine.dis_engine(bin_stream_str(data))
+list(mdis2.dis_multibloc_many(offsets, processes=2, chunksize=4))
+assert ([(label.name, label.offset) for label in mdis.symbol_pool.items] ==
+        [(label.name, label.offset) for label in mdis2.symbol_pool.items])
+
+# Bloc splitting
+# Segments (INC EAX, INC EAX, JZ): each JZ targets the second INC of the
+# previous segment, already disassembled
+data = "\x40\x40\x74\xfd" + "\x40\x40\x74\xf9" * 3 + "\xc3"
+mdis = machine.dis_engine(bin_stream_str(data))
+blocs = mdis.dis_multibloc(0)
+# 4 segments, the last one being not split, and RET
+assert len(blocs) == 8
+starts = dict((bloc.label.offset, bloc) for bloc in blocs)
+assert sorted(starts) == [0, 1, 4, 5, 8, 9, 12, 16]
+for seg_nb in xrange(3):
+    head, tail = starts[seg_nb * 4], starts[seg_nb * 4 + 1]
+    assert len(head.lines) == 1
+    assert [cst.label.offset for cst in head.bto] == [seg_nb * 4 + 1]
+    assert len(tail.lines) == 2
+    assert (sorted(cst.label.offset for cst in tail.bto) ==
+            sorted([seg_nb * 4 - 3 if seg_nb else 1, seg_nb * 4 + 4]))
+assert len(starts[12].lines) == 3
+
+# Assembly fixed point
+from miasm2.arch.x86.arch import mn_x86
+from miasm2.core.parse_asm import parse_txt
+from miasm2.core.asmbloc import asm_resolve_final, assemble_block
+
+blocs, symbol_pool = parse_txt(mn_x86, 32, '''
+main:
+    MOV   EAX, 1
+    JMP   end
+loop:
+    INC   EAX
+    CMP   EAX, 0x10
+    JNZ   loop
+end:
+    RET
+''')
+symbol_pool.set_offset(symbol_pool.getby_name("main"), 0)
+stats = {}
+patches = asm_resolve_final(mn_x86, blocs, symbol_pool, stats=stats)
+assert stats["iterations"] >= 1
+assert 0 < stats["encoded"] <= stats["instructions"]
+assert "".join(patches[offset] for offset in sorted(patches)) == \
+    "b801000000eb064083f81075fac3".decode("hex")
+
+# Nothing moved: instructions are not encoded again
+stats = {}
+for bloc in blocs:
+    assemble_block(mn_x86, bloc, symbol_pool, stats=stats)
+assert stats["encoded"] == 0
+assert stats["instructions"] == sum(len(bloc.lines) for bloc in blocs)
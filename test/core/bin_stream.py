@@ -0,0 +1,62 @@
+import random
+import tempfile
+
+from miasm2.core.bin_stream import bin_stream, bin_stream_str, \
+    bin_stream_file
+
+
+def ref_getbits(data, start, n, word_size=None):
+    "Reference implementation: extract bits one by one"
+    value = 0
+    for bit in xrange(start, start + n):
+        offset = bit / 8
+        if word_size is not None:
+            offset = offset - offset % word_size + word_size - 1 - \
+                offset % word_size
+        value = (value << 1) | ((ord(data[offset]) >> (7 - bit % 8)) & 1)
+    return value
+
+
+class bin_stream_slow(bin_stream_str):
+    "Force the generic implementation"
+    getbits = bin_stream.getbits
+
+
+rnd = random.Random(0)
+data = "".join(chr(rnd.randrange(256)) for _ in xrange(64))
+
+fdesc = tempfile.TemporaryFile()
+fdesc.write(data)
+fdesc.flush()
+
+streams = [bin_stream_str(data), bin_stream_slow(data),
+           bin_stream_file(fdesc),
+           bin_stream_str("XYZ" + data, shift=3),
+           bin_stream_slow("XYZ" + data, shift=3)]
+
+for word_size in [None, 2, 4, 8]:
+    for start in xrange(0, len(data) * 8, 7):
+        for n in [0, 1, 3, 8, 12, 16, 32, 63, 64, 65, 100]:
+            if start + n > len(data) * 8:
+                # Out of bound reads
+                for bs in streams:
+                    try:
+                        bs.getbits(start, n, word_size)
+                    except IOError:
+                        pass
+                    else:
+                        raise AssertionError("IOError expected")
+                continue
+            reference = ref_getbits(data, start, n, word_size)
+            for bs in streams:
+                assert bs.getbits(start, n, word_size) == reference
+
+# mmap backed stream
+bs = bin_stream_file(fdesc)
+assert bs.getbytes(3, 5) == data[3:8]
+assert bs.readbs(4) == data[:4]
+assert bs.getlen() == len(data) - 4
+assert str(bs) == data[4:]
+
+# Empty files cannot be mapped
+assert bin_stream_file(tempfile.TemporaryFile()).getlen() == 0
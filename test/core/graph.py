@@ -151,6 +151,15 @@ assert(idoms == {3: 6,
                  8: 4,
                  9: 4})
 
+dominators = g2.compute_dominators(5)
+assert(dominators.idom(5) is None)
+assert(dominators.idom(3) == 6)
+assert(dominators.dominates(5, 9))
+assert(dominators.dominates(3, 3))
+assert(not dominators.dominates(7, 9))
+assert(not dominators.dominates(1, 3))
+assert(1 not in dominators)
+
 frontier = g1.compute_dominance_frontier(1)
 assert(frontier == {2: set([2]),
                     3: set([5]),
@@ -192,3 +201,35 @@ assert(sccs == {frozenset({6}),
                 frozenset({7, 8}),
                 frozenset({3}),
                 frozenset({1, 2, 4, 5, 9})})
+
+# CompactDiGraph must behave like DiGraph
+g4 = CompactDiGraph()
+for src, dst in g3.edges():
+    g4.add_edge(src, dst)
+g4.add_uniq_edge(1, 2)
+assert(g4.edges_count() == len(g3.edges()))
+assert(set(g4.nodes()) == set(g3.nodes()))
+for node in g3.nodes():
+    assert(g4.successors(node) == g3.successors(node))
+    assert(g4.predecessors(node) == g3.predecessors(node))
+assert(g4.compute_dominators(1) == g3.compute_dominators(1))
+assert(set(g4.compute_back_edges(1)) == set(g3.compute_back_edges(1)))
+sccs = set([frozenset(scc) for scc in g4.compute_strongly_connected_components()])
+assert(sccs == {frozenset({6}),
+                frozenset({7, 8}),
+                frozenset({3}),
+                frozenset({1, 2, 4, 5, 9})})
+
+g4.del_edge(7, 8)
+assert(g4.successors(7) == [6])
+assert(g4.predecessors(8) == [3])
+node_id = g4.node_id(9)
+g4.del_node(9)
+assert(9 not in g4.nodes())
+assert(g4.successors(4) == [])
+assert(g4.edges_count() == len(g4.edges()) == 9)
+# Ids are reused
+g4.add_edge(10, 4)
+assert(g4.node_id(10) == node_id)
+assert(g4.id_node(node_id) == 10)
+assert(g4.predecessors(4) == [2, 10])
@@ -155,3 +155,23 @@ for i in xrange(1000):
     c = interval(r3)
     assert((a & b) - c == a & (b - c) == (a - c) & (b - c))
     assert(a - (b & c) == (a - b) + (a - c))
+
+# In-place updates
+i_inplace = interval()
+for start, stop in [(10, 12), (20, 25), (13, 15), (0, 3), (30, 40)]:
+    i_inplace.add(start, stop)
+assert(i_inplace == interval([(0, 3), (10, 15), (20, 25), (30, 40)]))
+i_inplace.remove(22, 32)
+assert(i_inplace == interval([(0, 3), (10, 15), (20, 21), (33, 40)]))
+i_inplace.remove(0, 40)
+assert(i_inplace.empty)
+
+# Intervals spread over several internal chunks
+i_big = interval([(2 * i, 2 * i) for i in xrange(3000)])
+assert(len(i_big) == 3000)
+assert(4000 in i_big and 4001 not in i_big)
+i_big.add(100, 5000)
+assert(len(i_big) == 50 + 1 + 499)
+assert(i_big.hull() == (0, 5998))
+i_big -= interval([(0, 5998)])
+assert(i_big.empty)
@@ -104,6 +104,79 @@ class TestParseAsm(unittest.TestCase):
         # split test
         assert(lbl2block[lbls[1]].get_next() is None)
 
+    def test_ParseTxtStream(self):
+        from StringIO import StringIO
+        from miasm2.arch.x86.arch import mn_x86
+        from miasm2.core.parse_asm import parse_txt, parse_txt_stream
+        from miasm2.core.asmbloc import asm_symbol_pool
+
+        ASM0 = '''
+        lbl0:
+            INC   EAX
+            JNZ   lbl0
+            INC   EAX
+            JZ    lbl2
+        .dontsplit
+        lbl1:
+            NOP
+            JMP   lbl0
+        .split
+        lbl2:
+            MOV   EAX, ECX
+        .align 0x10
+            RET
+        '''
+
+        def dump(blocks):
+            return [(str(block.label), block.alignment,
+                     [str(line) for line in block.lines],
+                     sorted(str(constraint) for constraint in block.bto))
+                    for block in blocks]
+
+        blocks, _ = parse_txt(mn_x86, 32, ASM0)
+        # File object
+        blocks_stream = list(parse_txt_stream(mn_x86, 32, StringIO(ASM0),
+                                              asm_symbol_pool()))
+        self.assertEqual(dump(blocks), dump(blocks_stream))
+
+        # Blocks are yielded before the end of the listing
+        lines_read = []
+
+        def read_lines():
+            for line in ASM0.split('\n'):
+                lines_read.append(line)
+                yield line
+
+        stream = parse_txt_stream(mn_x86, 32, read_lines(), asm_symbol_pool())
+        first_block = next(stream)
+        self.assertEqual(first_block.label.name, "lbl0")
+        self.assertTrue(len(lines_read) < len(ASM0.split('\n')))
+        self.assertEqual(dump([first_block] + list(stream)), dump(blocks))
+
+    def test_FromstringCache(self):
+        from miasm2.arch.x86.arch import mn_x86
+
+        # Same line: independent instructions
+        instr1 = mn_x86.fromstring("MOV EAX, 0x10", 32)
+        instr2 = mn_x86.fromstring("MOV EAX, 0x10", 32)
+        self.assertIsNot(instr1, instr2)
+        self.assertIsNot(instr1.args, instr2.args)
+        self.assertIsNot(instr1.additional_info, instr2.additional_info)
+        instr1.args[1] = instr1.args[0]
+        self.assertEqual(str(instr2), "MOV        EAX, 0x10")
+
+        # Lines differing by their integer literals
+        for line in ["MOV        EAX, 0x10",
+                     "MOV        EAX, 0x11223344",
+                     "MOV        EAX, DWORD PTR [EBX+0x10]",
+                     "MOV        EAX, DWORD PTR [EBX+0x20]",
+                     "MOV        EAX, DWORD PTR [EBX+ECX*0x4+0xFFFFFFF0]",
+                     "MOV        EAX, DWORD PTR [EBX+ECX*0x8+0x10]",
+                     "ADD        AL, 0x10",
+                     "FADD       ST(1), ST",
+                     ]:
+            self.assertEqual(str(mn_x86.fromstring(line, 32)), line)
+
 if __name__ == '__main__':
     testsuite = unittest.TestLoader().loadTestsFromTestCase(TestParseAsm)
     report = unittest.TextTestRunner(verbosity=2).run(testsuite)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import time
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+from miasm2.jitter.csts import EXCEPT_BUDGET, \
+    BUDGET_INSTRUCTIONS, BUDGET_TIME
+from miasm2.jitter.jitload import ExceptionHandle
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+
+ASM = '''
+main:
+    MOV    ECX, 10
+loop:
+    ADD    EAX, ECX
+    DEC    ECX
+    JNZ    loop
+    RET
+forever:
+    INC    EAX
+    JMP    forever
+'''
+
+
+# Unreachable from main, the other snippet is placed explicitly
+CODE, LABELS = assemble_at(machine, ASM, {"main": CODE_ADDR,
+                                          "forever": CODE_ADDR + 0x40})
+# MOV ECX, 10; 10 * (ADD, DEC, JNZ); RET
+LOOP_INSTRUCTIONS = 1 + 10 * 3 + 1
+
+
+class TestBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.jitter = jitter_at(machine, "python", CODE, CODE_ADDR, RET_ADDR)
+
+    def run_code(self, addr, **budget):
+        return call_at(self.jitter, addr, RET_ADDR, **budget)
+
+    def test_no_budget(self):
+        self.assertEqual(self.run_code(CODE_ADDR), False)
+        self.assertEqual(self.jitter.cpu.EAX, 55)
+        # Instructions are only counted under a budget
+        self.assertEqual(self.jitter.get_executed_instructions(), 0)
+
+    def test_exact_count(self):
+        # A large enough budget: everything is run and counted
+        self.assertEqual(self.run_code(CODE_ADDR, max_instructions=1000),
+                         False)
+        self.assertEqual(self.jitter.get_executed_instructions(),
+                         LOOP_INSTRUCTIONS)
+        self.assertEqual(self.jitter.get_budget_exhausted(), 0)
+
+        # Exactly the needed budget
+        self.assertEqual(self.run_code(CODE_ADDR,
+                                       max_instructions=LOOP_INSTRUCTIONS),
+                         False)
+        self.assertEqual(self.jitter.get_executed_instructions(),
+                         LOOP_INSTRUCTIONS)
+
+    def test_instructions(self):
+        # MOV ECX, 10; (ADD, DEC, JNZ) * 2; ADD: stop before the DEC
+        res = self.run_code(CODE_ADDR, max_instructions=8)
+        self.assertEqual(res, ExceptionHandle.budgetExhausted())
+        self.assertEqual(self.jitter.get_executed_instructions(), 8)
+        self.assertEqual(self.jitter.get_budget_exhausted(),
+                         BUDGET_INSTRUCTIONS)
+        self.assertEqual(self.jitter.pc, LABELS["loop"] + 2)
+        self.assertEqual(self.jitter.cpu.EAX, 10 + 9 + 8)
+        self.assertEqual(self.jitter.cpu.ECX, 8)
+        self.assertEqual(self.jitter.vm.get_exception() & EXCEPT_BUDGET, 0)
+
+        # Exhausted budget: nothing more is executed
+        res = self.jitter.continue_run()
+        self.assertEqual(res, ExceptionHandle.budgetExhausted())
+        self.assertEqual(self.jitter.get_executed_instructions(), 8)
+        self.assertEqual(self.jitter.cpu.ECX, 8)
+
+        # A new budget resumes the execution
+        self.jitter.set_budget(max_instructions=1000)
+        self.assertEqual(self.jitter.continue_run(), False)
+        self.assertEqual(self.jitter.cpu.EAX, 55)
+        self.assertEqual(self.jitter.get_executed_instructions(),
+                         LOOP_INSTRUCTIONS - 8)
+
+    def test_infinite_loop(self):
+        res = self.run_code(LABELS["forever"], max_instructions=1001)
+        self.assertEqual(res, ExceptionHandle.budgetExhausted())
+        self.assertEqual(self.jitter.cpu.EAX, 501)
+        self.assertEqual(self.jitter.pc, LABELS["forever"] + 1)
+
+    def test_vm_counters(self):
+        # Jitters interface
+        vm = self.jitter.vm
+        vm.set_budget(2, None)
+        self.assertEqual(vm.budget_block(), BUDGET_INSTRUCTIONS)
+        vm.budget_instr()
+        vm.budget_instr()
+        self.assertEqual(vm.get_budget(), (2, 0))
+        # An instruction left on a fault is executed again, and counted once
+        vm.budget_refund()
+        vm.budget_instr()
+        self.assertEqual(vm.get_budget(), (2, 0))
+        self.assertEqual(vm.get_exception(), 0)
+        vm.budget_instr()
+        self.assertEqual(vm.get_budget(), (2, BUDGET_INSTRUCTIONS))
+        self.assertEqual(vm.get_exception(), EXCEPT_BUDGET)
+        # Instructions are not counted while an exception is pending
+        vm.set_budget(10, None)
+        vm.budget_instr()
+        self.assertEqual(vm.get_budget(), (0, 0))
+        vm.set_exception(0)
+
+        vm.set_budget(None, None)
+        self.assertEqual(vm.budget_block(), 0)
+        vm.budget_instr()
+        self.assertEqual(vm.get_budget(), (0, 0))
+        self.assertRaises(ValueError, vm.set_budget, None, -1)
+
+    def test_timeout(self):
+        start = time.time()
+        res = self.run_code(LABELS["forever"], timeout=0.2)
+        duration = time.time() - start
+        self.assertEqual(res, ExceptionHandle.budgetExhausted())
+        self.assertEqual(self.jitter.get_budget_exhausted(), BUDGET_TIME)
+        self.assertTrue(duration >= 0.2)
+        self.assertTrue(duration < 10)
+        # Instructions are counted under a time budget too
+        self.assertEqual(self.jitter.get_executed_instructions(),
+                         self.jitter.cpu.EAX * 2)
+
+        # init_run without budget disables it
+        self.assertEqual(self.run_code(CODE_ADDR), False)
+        self.assertEqual(self.jitter.get_budget_exhausted(), 0)
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestBudget)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
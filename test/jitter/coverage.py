@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import os
+import struct
+import tempfile
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+from miasm2.jitter.coverage import BB_ENTRY
+
+CODE_ADDR = 0x400000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+
+ASM = '''
+main:
+    MOV    ECX, 3
+loop:
+    ADD    EAX, ECX
+    DEC    ECX
+    JNZ    loop
+    RET
+'''
+
+
+CODE, LABELS = assemble_at(machine, ASM, {"main": CODE_ADDR})
+LOOP_ADDR = LABELS["loop"]
+# ADD EAX, ECX; DEC ECX; JNZ loop
+LOOP_SIZE = 2 + 1 + 2
+
+
+class TestCoverage(unittest.TestCase):
+
+    def setUp(self):
+        self.jitter = jitter_at(machine, "python", CODE, CODE_ADDR, RET_ADDR)
+
+    def run_code(self):
+        call_at(self.jitter, CODE_ADDR, RET_ADDR)
+
+    def test_counters(self):
+        self.run_code()
+        self.assertEqual(self.jitter.get_coverage(), {})
+
+        self.jitter.coverage_start()
+        self.run_code()
+        # The first block runs the first loop iteration
+        self.assertEqual(self.jitter.get_coverage(),
+                         {CODE_ADDR: 1,
+                          LOOP_ADDR: 2,
+                          LOOP_ADDR + LOOP_SIZE: 1})
+        self.assertEqual(self.jitter.get_instructions_count(), 4 + 2 * 3 + 1)
+        self.assertEqual(self.jitter.vm.get_coverage(),
+                         [(CODE_ADDR, 1, 4, LOOP_SIZE + 5),
+                          (LOOP_ADDR, 2, 3, LOOP_SIZE),
+                          (LOOP_ADDR + LOOP_SIZE, 1, 1, 1)])
+
+        # Counters are kept while stopped, and accumulated on restart
+        self.jitter.coverage_stop()
+        self.run_code()
+        self.jitter.coverage_start(reset=False)
+        self.run_code()
+        self.assertEqual(self.jitter.get_coverage()[LOOP_ADDR], 4)
+
+        self.jitter.coverage_start()
+        self.assertEqual(self.jitter.get_coverage(), {})
+
+    def test_many_blocks(self):
+        # Grow the counters table
+        for i in xrange(0x1000):
+            self.jitter.vm.coverage_block(0x1000 + i * 4, 1, 4)
+        self.assertEqual(self.jitter.get_coverage(), {})
+        self.jitter.coverage_start()
+        for _ in xrange(3):
+            for i in xrange(0x1000):
+                self.jitter.vm.coverage_block(0x1000 + i * 4, 1, 4)
+        coverage = self.jitter.vm.get_coverage()
+        self.assertEqual(coverage,
+                         [(0x1000 + i * 4, 3, 1, 4) for i in xrange(0x1000)])
+
+    def test_drcov(self):
+        self.jitter.coverage_start()
+        self.run_code()
+        fdesc, fname = tempfile.mkstemp()
+        os.close(fdesc)
+        try:
+            count = self.jitter.coverage_drcov(
+                fname, modules=[("other", 0, 0x1000),
+                                ("code", CODE_ADDR, CODE_ADDR + 0x100)])
+            data = open(fname, "rb").read()
+        finally:
+            os.remove(fname)
+        self.assertEqual(count, 3)
+
+        header, table = data.split("BB Table: 3 bbs\n")
+        lines = header.splitlines()
+        self.assertEqual(lines[0], "DRCOV VERSION: 2")
+        self.assertEqual(lines[2], "Module Table: version 2, count 2")
+        self.assertTrue(lines[4].endswith(", other"))
+        fields = [field.strip() for field in lines[5].split(",")]
+        self.assertEqual(fields[0], "1")
+        self.assertEqual(int(fields[1], 16), CODE_ADDR)
+        self.assertEqual(int(fields[2], 16), CODE_ADDR + 0x100)
+        self.assertEqual(fields[-1], "code")
+
+        self.assertEqual(len(table), 3 * BB_ENTRY.size)
+        entries = [BB_ENTRY.unpack_from(table, offset)
+                   for offset in xrange(0, len(table), BB_ENTRY.size)]
+        loop_offset = LOOP_ADDR - CODE_ADDR
+        self.assertEqual(entries, [(0, LOOP_SIZE + 5, 1),
+                                   (loop_offset, LOOP_SIZE, 1),
+                                   (loop_offset + LOOP_SIZE, 1, 1)])
+
+        # Default modules: the memory regions
+        fdesc, fname = tempfile.mkstemp()
+        os.close(fdesc)
+        try:
+            self.assertEqual(self.jitter.coverage_drcov(fname), 3)
+            data = open(fname, "rb").read()
+        finally:
+            os.remove(fname)
+        self.assertTrue("region_%x\n" % CODE_ADDR in data)
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestCoverage)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import pck64, upck64
+from miasm2.jitter.arch import JitCore_x86
+
+
+class TestJitCpu(unittest.TestCase):
+
+    def setUp(self):
+        self.jitter = Machine("x86_64").jitter("python")
+        self.cpu = self.jitter.cpu
+
+    def test_get_set_regs(self):
+        cpu = self.cpu
+        cpu.set_regs({"RAX": 0x1122334455667788, "RCX": 2, "zf": 1})
+        self.assertEqual(cpu.RAX, 0x1122334455667788)
+        self.assertEqual(cpu.get_regs(["RCX", "EAX", "zf"]),
+                         (2, 0x55667788, 1))
+        self.assertEqual(cpu.get_regs(()), ())
+        self.assertRaises(AttributeError, cpu.get_regs, ["XXX"])
+        self.assertRaises(AttributeError, cpu.set_regs, {"XXX": 0})
+        self.assertRaises(TypeError, cpu.set_regs, [("RAX", 0)])
+
+    def test_regs_view(self):
+        cpu = self.cpu
+        view = cpu.get_regs_view()
+        self.assertEqual(len(view), len(cpu.get_state()))
+        offsets = JitCore_x86.get_gpreg_offset_all()
+        rbx = offsets["RBX"]
+
+        cpu.RBX = 0x1234
+        self.assertEqual(upck64(view[rbx:rbx + 8].tobytes()), 0x1234)
+        view[rbx:rbx + 8] = pck64(0xdeadbeef)
+        self.assertEqual(cpu.RBX, 0xdeadbeef)
+
+    def test_func_args(self):
+        jitter = self.jitter
+        jitter.init_stack()
+        jitter.cpu.set_regs({"RCX": 1, "RDX": 2, "R8": 3, "R9": 4})
+        jitter.push_uint64_t(5)
+        jitter.push_uint64_t(0x1337)
+        ret_ad, args = jitter.func_args_stdcall(["a", "b", "c"])
+        self.assertEqual(ret_ad, 0x1337)
+        self.assertEqual(list(args), [1, 2, 3])
+        jitter.push_uint64_t(0x1337)
+        ret_ad, args = jitter.func_args_cdecl(5)
+        self.assertEqual(args, [1, 2, 3, 4, 5])
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestJitCpu)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.core.utils import assemble_at, jitter_at, call_at
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE, TRACE_BLOCK, \
+    TRACE_INSTR, TRACE_MEM, TRACE_MEM_READ, TRACE_MEM_WRITE, TRACE_REGS
+from miasm2.jitter.trace import read_trace, RegisterState
+
+CODE_ADDR = 0x400000
+DATA_ADDR = 0x500000
+RET_ADDR = 0x1337beef
+
+machine = Machine("x86_32")
+
+ASM = '''
+main:
+    MOV    ECX, 3
+loop:
+    ADD    DWORD PTR [0x500000], ECX
+    DEC    ECX
+    JNZ    loop
+    RET
+'''
+
+
+CODE, LABELS = assemble_at(machine, ASM, {"main": CODE_ADDR})
+LOOP_ADDR = LABELS["loop"]
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.jitter = jitter_at(machine, "python", CODE, CODE_ADDR, RET_ADDR)
+        self.jitter.vm.add_memory_page(DATA_ADDR, PAGE_READ | PAGE_WRITE,
+                                       0x1000)
+
+    def run_code(self):
+        call_at(self.jitter, CODE_ADDR, RET_ADDR)
+
+    def test_blocks(self):
+        self.jitter.trace_start(TRACE_BLOCK)
+        self.run_code()
+        self.assertEqual(self.jitter.trace_stop(), 4)
+        records = self.jitter.get_trace()
+        # The first block runs the first loop iteration
+        self.assertEqual([(record.type, record.addr, record.info)
+                          for record in records],
+                         [(TRACE_BLOCK, CODE_ADDR, 4)] +
+                         [(TRACE_BLOCK, LOOP_ADDR, 3)] * 2 +
+                         [(TRACE_BLOCK, LOOP_ADDR + 9, 1)])
+
+        # Ring buffer
+        self.jitter.trace_start(TRACE_BLOCK, capacity=2)
+        self.run_code()
+        self.assertEqual(self.jitter.trace_stop(), 4)
+        self.assertEqual([record.addr for record in self.jitter.get_trace()],
+                         [LOOP_ADDR, LOOP_ADDR + 9])
+
+        # Stopped trace
+        self.run_code()
+        self.assertEqual(len(self.jitter.get_trace()), 2)
+
+    def test_vm_events(self):
+        # Jitters interface: only the traced event types are recorded
+        vm = self.jitter.vm
+        vm.trace_block(CODE_ADDR, 4)
+        self.jitter.trace_start(TRACE_INSTR)
+        vm.trace_block(CODE_ADDR, 4)
+        vm.trace_instr(CODE_ADDR)
+        self.assertEqual(self.jitter.trace_stop(), 1)
+        self.assertEqual([(record.type, record.addr)
+                          for record in self.jitter.get_trace()],
+                         [(TRACE_INSTR, CODE_ADDR)])
+
+    def test_instructions_memory(self):
+        self.jitter.trace_start(TRACE_INSTR | TRACE_MEM)
+        self.run_code()
+        self.jitter.trace_stop()
+        records = self.jitter.get_trace()
+        self.assertEqual(len([record for record in records
+                              if record.type == TRACE_INSTR]), 11)
+        accesses = [(record.type, record.addr, record.size, record.value)
+                    for record in records
+                    if record.type & TRACE_MEM]
+        data = [(TRACE_MEM_READ, DATA_ADDR, 4, 0),
+                (TRACE_MEM_WRITE, DATA_ADDR, 4, 3),
+                (TRACE_MEM_READ, DATA_ADDR, 4, 3),
+                (TRACE_MEM_WRITE, DATA_ADDR, 4, 5),
+                (TRACE_MEM_READ, DATA_ADDR, 4, 5),
+                (TRACE_MEM_WRITE, DATA_ADDR, 4, 6)]
+        # The data accesses are surrounded by the stack ones (RET)
+        self.assertEqual([access for access in accesses
+                          if access[1] == DATA_ADDR], data)
+
+    def test_registers_file(self):
+        fdesc, fname = tempfile.mkstemp()
+        os.close(fdesc)
+        try:
+            self.jitter.cpu.ECX = 0x1234
+            self.jitter.trace_start(TRACE_BLOCK | TRACE_REGS, capacity=4,
+                                    fname=fname)
+            self.run_code()
+            self.jitter.trace_stop()
+            self.assertEqual(self.jitter.get_trace(), [])
+            records = list(read_trace(fname, chunk_records=3))
+        finally:
+            os.remove(fname)
+
+        state = RegisterState(self.jitter.regmap)
+        ecx = []
+        for record in records:
+            if record.type == TRACE_REGS:
+                if "RCX" in state.update(record):
+                    ecx.append(state["RCX"])
+            else:
+                self.assertEqual(record.type, TRACE_BLOCK)
+        self.assertEqual(ecx, [0x1234, 2, 1, 0])
+        # Registers are recorded on block entry
+        self.assertEqual(state["RIP"], LOOP_ADDR + 9)
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestTrace)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from miasm2.jitter import VmMngr
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+
+class TestVmMngr(unittest.TestCase):
+
+    def setUp(self):
+        self.vm = VmMngr.Vm()
+        self.vm.init_memory_page_pool()
+        self.vm.init_code_bloc_pool()
+        self.vm.init_memory_breakpoint()
+
+        # 4 pages of distinct bytes
+        self.data = "".join(chr(i & 0xFF) * 0x100 for i in xrange(0x40))
+        fdesc, self.fname = tempfile.mkstemp()
+        os.write(fdesc, self.data)
+        os.close(fdesc)
+        self.fstream = open(self.fname, "rb")
+
+    def tearDown(self):
+        self.fstream.close()
+        os.remove(self.fname)
+
+    def test_zero_page(self):
+        vm = self.vm
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x3000)
+        self.assertEqual(vm.get_mem(0x1000, 0x3000), "\x00" * 0x3000)
+        vm.set_mem(0x2ffe, "AAAA")
+        self.assertEqual(vm.get_mem(0x2ff0, 0x20),
+                         "\x00" * 0xe + "AAAA" + "\x00" * 0xe)
+        self.assertEqual(vm.get_region(0x1000)[1], 0x3000)
+        self.assertRaises(TypeError, vm.add_memory_page, 0x1000,
+                          PAGE_READ, 0x10)
+
+    def test_set_mem_from_file(self):
+        vm = self.vm
+        vm.add_memory_page(0x10000, PAGE_READ | PAGE_WRITE, 0x8000)
+        # Page and file offsets: congruent (mapped) or not (read)
+        for addr, offset, size in [(0x10000, 0, 0x4000),
+                                   (0x14100, 0x100, 0x2f00),
+                                   (0x17000, 0x180, 0x80),
+                                   (0x17300, 0x123, 0xd00)]:
+            vm.set_mem_from_file(addr, self.fstream, offset, size)
+            self.assertEqual(vm.get_mem(addr, size),
+                             self.data[offset:offset + size])
+        self.assertEqual(vm.get_mem(0x14000, 0x100), "\x00" * 0x100)
+
+        # Mapped memory is private
+        vm.set_mem(0x10010, "AAAA")
+        self.assertEqual(vm.get_mem(0x10000, 0x20),
+                         self.data[:0x10] + "AAAA" + self.data[0x14:0x20])
+        self.assertEqual(open(self.fname, "rb").read(), self.data)
+
+        # Page big enough to be a host mapping
+        vm.add_memory_page(0x100000, PAGE_READ | PAGE_WRITE, 0x20000)
+        vm.set_mem_from_file(0x101000, self.fstream, 0, 0x4000)
+        vm.set_mem(0x102010, "AAAA")
+        self.assertEqual(vm.get_mem(0x101000, 0x4000),
+                         self.data[:0x1010] + "AAAA" + self.data[0x1014:])
+        self.assertEqual(open(self.fname, "rb").read(), self.data)
+
+        # File descriptor
+        vm.set_mem_from_file(0x10000, self.fstream.fileno(), 0x1000, 0x2000)
+        self.assertEqual(vm.get_mem(0x10000, 0x2000),
+                         self.data[0x1000:0x3000])
+
+        # Errors
+        self.assertRaises(IOError, vm.set_mem_from_file, 0x10000,
+                          self.fstream, 0x3000, 0x2000)
+        self.assertRaises(RuntimeError, vm.set_mem_from_file, 0x20000,
+                          self.fstream, 0, 0x1000)
+
+    def test_small_pages(self):
+        vm = self.vm
+        # Small pages share host pages
+        for i in xrange(0x1000):
+            vm.add_memory_page(0x100000 + i * 0x20, PAGE_READ | PAGE_WRITE,
+                               0x10)
+        vm.set_mem(0x100020, "A" * 0x10)
+        self.assertEqual(vm.get_mem(0x100020, 0x10), "A" * 0x10)
+        self.assertEqual(vm.get_mem(0x100040, 0x10), "\x00" * 0x10)
+        vm.set_mem_from_file(0x100060, self.fstream, 0x1000, 0x10)
+        self.assertEqual(vm.get_mem(0x100060, 0x10), self.data[0x1000:0x1010])
+        vm.reset_memory_page_pool()
+        self.assertEqual(vm.get_regions(), [])
+
+    def test_set_mem_from_file_snapshot(self):
+        vm = self.vm
+        vm.add_memory_page(0x10000, PAGE_READ | PAGE_WRITE, 0x4000)
+        vm.set_mem(0x10000, "A" * 0x4000)
+        vm.snapshot()
+        vm.set_mem_from_file(0x10000, self.fstream, 0, 0x4000)
+        self.assertEqual(vm.get_mem(0x10000, 0x4000), self.data)
+        vm.restore_snapshot()
+        self.assertEqual(vm.get_mem(0x10000, 0x4000), "A" * 0x4000)
+
+    def test_regions(self):
+        vm = self.vm
+        self.assertEqual(vm.get_regions(), [])
+        vm.add_memory_page(0x3000, PAGE_READ, 0x1000)
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x2000)
+        vm.add_memory_page(0x8000, PAGE_READ, "A" * 0x100)
+        self.assertEqual(vm.get_regions(),
+                         [(0x1000, 0x2000, PAGE_READ | PAGE_WRITE),
+                          (0x3000, 0x1000, PAGE_READ),
+                          (0x8000, 0x100, PAGE_READ)])
+
+        self.assertEqual(vm.get_region(0x2fff),
+                         (0x1000, 0x2000, PAGE_READ | PAGE_WRITE))
+        self.assertEqual(vm.get_region(0x3000), (0x3000, 0x1000, PAGE_READ))
+        self.assertIsNone(vm.get_region(0x4000))
+        self.assertIsNone(vm.get_region(0))
+
+        self.assertTrue(vm.is_mapped(0x1000))
+        self.assertTrue(vm.is_mapped(0x1000, 0x3000))
+        self.assertFalse(vm.is_mapped(0x1000, 0x3001))
+        self.assertFalse(vm.is_mapped(0x80ff, 2))
+        self.assertFalse(vm.is_mapped(0x8100))
+        # Queries are not access violations
+        self.assertEqual(vm.get_exception(), 0)
+
+    def test_get_mem_view(self):
+        vm = self.vm
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.add_memory_page(0x2000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.set_mem(0x1ffe, "ABCD")
+
+        # Range in one page: view on the guest memory
+        view = vm.get_mem_view(0x1ff0, 0x10)
+        self.assertTrue(view.readonly)
+        self.assertEqual(view.tobytes(), "\x00" * 0xe + "AB")
+        vm.set_mem(0x1ff0, "XY")
+        self.assertEqual(view[:2].tobytes(), "XY")
+        # The memory may have been unmapped: the view is no longer usable
+        vm.snapshot()
+        vm.restore_snapshot()
+        self.assertRaises(ValueError, view.tobytes)
+        view = vm.get_mem_view(0x1ff0, 0x10)
+        vm.reset_memory_page_pool()
+        self.assertRaises(ValueError, view.tobytes)
+        self.assertRaises(ValueError, view.__getitem__, slice(0, 2))
+        del view
+
+        # Range across pages: view on a copy
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.add_memory_page(0x2000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.set_mem(0x1ffe, "ABCD")
+        view = vm.get_mem_view(0x1ffe, 4)
+        self.assertEqual(view.tobytes(), "ABCD")
+        vm.reset_memory_page_pool()
+        self.assertEqual(view.tobytes(), "ABCD")
+
+        self.assertRaises(RuntimeError, vm.get_mem_view, 0x2ffe, 4)
+        vm.set_exception(0)
+
+    def test_get_str(self):
+        vm = self.vm
+        vm.set_little_endian()
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.add_memory_page(0x2000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.set_mem(0x1ffc, "abcdefgh\x00")
+        self.assertEqual(vm.get_c_str(0x1ffc), "abcdefgh")
+        self.assertEqual(vm.get_c_str(0x1ffc, 3), "abc")
+        self.assertEqual(vm.get_c_str(0x1ffc, 100), "abcdefgh")
+        self.assertEqual(vm.get_c_str(0x2004), "")
+
+        # UTF-16, with a character across two pages
+        data = u"h\xe9\u20ac\U0001d11e".encode("utf-16le")
+        vm.set_mem(0x1ffb, data + "\x00\x00")
+        self.assertEqual(vm.get_wide_str(0x1ffb), u"h\xe9\u20ac\U0001d11e")
+        self.assertEqual(vm.get_wide_str(0x1ffb, 2), u"h\xe9")
+        # Terminator is character aligned
+        vm.set_mem(0x1000, "\x00A\x00\x00")
+        self.assertEqual(vm.get_wide_str(0x1000), u"\u4100")
+        vm.set_big_endian()
+        self.assertEqual(vm.get_wide_str(0x1000), u"A")
+
+        # Unterminated string
+        vm.set_mem(0x2000, "A" * 0x1000)
+        self.assertRaises(RuntimeError, vm.get_c_str, 0x2000)
+        vm.set_exception(0)
+        self.assertEqual(vm.get_c_str(0x2000, 0x1000), "A" * 0x1000)
+
+    def test_read_struct(self):
+        vm = self.vm
+        vm.set_little_endian()
+        vm.add_memory_page(0x1000, PAGE_READ | PAGE_WRITE, 0x1000)
+        vm.set_mem(0x1000, "\x01\x00\x02\x00\x78\x56\x34\x12\xff\xff\xff\xff")
+        self.assertEqual(vm.read_struct(0x1000, "<HHI"), (1, 2, 0x12345678))
+        self.assertEqual(vm.read_struct(0x1000, ">H"), (0x100,))
+        self.assertEqual(vm.read_u32_array(0x1000, 3),
+                         [0x20001, 0x12345678, 0xffffffff])
+        self.assertEqual(vm.read_u32_array(0x1000, 0), [])
+        vm.set_big_endian()
+        self.assertEqual(vm.read_u32_array(0x1004, 1), [0x78563412])
+        self.assertRaises(RuntimeError, vm.read_u32_array, 0x1ffc, 2)
+        vm.set_exception(0)
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestVmMngr)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
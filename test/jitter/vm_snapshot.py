@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.core import parse_asm, asmbloc
+from miasm2.jitter.csts import PAGE_READ, PAGE_WRITE
+
+CODE_ADDR = 0x400000
+DATA_ADDR = 0x500000
+NEW_ADDR = 0x600000
+
+machine = Machine("x86_32")
+
+ASM = '''
+main:
+    MOV    DWORD PTR [0x500000], EAX
+    ADD    EAX, 0x10
+    INC    EBX
+end:
+    RET
+'''
+
+
+def assemble():
+    blocks, symbol_pool = parse_asm.parse_txt(machine.mn, 32, ASM)
+    symbol_pool.set_offset(symbol_pool.getby_name("main"), CODE_ADDR)
+    patches = asmbloc.asm_resolve_final(machine.mn, blocks, symbol_pool)
+    code = ["\x00"] * 0x100
+    for offset, raw in patches.items():
+        code[offset - CODE_ADDR:offset - CODE_ADDR + len(raw)] = list(raw)
+    return "".join(code), symbol_pool.getby_name("end").offset
+
+
+class TestVmSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        code, self.end = assemble()
+        self.jitter = machine.jitter("python")
+        self.jitter.init_stack()
+        self.jitter.vm.add_memory_page(CODE_ADDR, PAGE_READ | PAGE_WRITE,
+                                       code)
+        self.jitter.vm.add_memory_page(DATA_ADDR, PAGE_READ | PAGE_WRITE,
+                                       "\x00" * 0x2000)
+        self.jitter.add_breakpoint(self.end, lambda jitter: False)
+
+    def run_code(self):
+        self.jitter.init_run(CODE_ADDR)
+        self.jitter.continue_run()
+
+    def test_restore(self):
+        jitter = self.jitter
+        jitter.cpu.EAX = 0x1337
+        jitter.vm.set_mem(DATA_ADDR + 0x1000, "AAAA")
+        jitter.snapshot()
+
+        for _ in xrange(3):
+            self.run_code()
+            self.assertEqual(jitter.cpu.EAX, 0x1347)
+            self.assertEqual(jitter.cpu.EBX, 1)
+            self.assertEqual(jitter.vm.get_mem(DATA_ADDR, 4),
+                             "\x37\x13\x00\x00")
+            jitter.vm.set_mem(DATA_ADDR + 0x1000, "BBBB")
+            jitter.vm.add_memory_page(NEW_ADDR, PAGE_READ, "C" * 0x10)
+
+            jitter.restore_snapshot()
+            self.assertEqual(jitter.cpu.EAX, 0x1337)
+            self.assertEqual(jitter.cpu.EBX, 0)
+            self.assertEqual(jitter.vm.get_mem(DATA_ADDR, 4), "\x00" * 4)
+            self.assertEqual(jitter.vm.get_mem(DATA_ADDR + 0x1000, 4),
+                             "AAAA")
+            self.assertRaises(RuntimeError, jitter.vm.get_mem, NEW_ADDR, 1)
+            # Clear the access violation raised by get_mem
+            jitter.vm.set_exception(0)
+
+    def test_restore_code(self):
+        jitter = self.jitter
+        jitter.snapshot()
+        self.run_code()
+        self.assertEqual(jitter.cpu.EBX, 1)
+
+        # Patch INC EBX into INC ECX
+        inc_addr = self.end - 1
+        self.assertEqual(jitter.vm.get_mem(inc_addr, 1), "\x43")
+        jitter.vm.set_mem(inc_addr, "\x41")
+        jitter.restore_snapshot()
+        jitter.cpu.EBX = 0
+        self.run_code()
+        self.assertEqual(jitter.cpu.ECX, 0)
+        self.assertEqual(jitter.cpu.EBX, 1)
+
+    def test_no_snapshot(self):
+        self.assertRaises(RuntimeError, self.jitter.restore_snapshot)
+        self.assertRaises(RuntimeError, self.jitter.vm.restore_snapshot)
+        self.jitter.snapshot()
+        self.jitter.drop_snapshot()
+        self.assertRaises(RuntimeError, self.jitter.vm.restore_snapshot)
+
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestVmSnapshot)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
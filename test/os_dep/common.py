@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#-*- coding:utf-8 -*-
+
+import unittest
+
+from miasm2.analysis.machine import Machine
+from miasm2.os_dep.common import heap
+
+machine = Machine("x86_32")
+
+
+class TestHeap(unittest.TestCase):
+
+    def setUp(self):
+        self.jit = machine.jitter("python")
+        self.heap = heap()
+
+    def pages(self):
+        return len(self.jit.vm.get_regions())
+
+    def test_alloc_free(self):
+        jit, hp = self.jit, self.heap
+        addrs = [hp.alloc(jit, size) for size in xrange(0, 0x100, 3)]
+        self.assertEqual(len(set(addrs)), len(addrs))
+        for addr in addrs:
+            self.assertEqual(addr % hp.chunk_align, 0)
+            self.assertEqual(jit.vm.get_mem(addr, 0x10), "\x00" * 0x10)
+        self.assertEqual(self.pages(), 1)
+
+        # Freed chunks are reused, zeroed
+        jit.vm.set_mem(addrs[-1], "A" * 0x10)
+        self.assertTrue(hp.free(jit, addrs[-1]))
+        self.assertFalse(hp.free(jit, addrs[-1]))
+        self.assertFalse(hp.free(jit, 0x1234))
+        self.assertEqual(hp.alloc(jit, 0xfa), addrs[-1])
+        self.assertEqual(jit.vm.get_mem(addrs[-1], 0x10), "\x00" * 0x10)
+
+        # Many allocations: constant page count
+        for _ in xrange(0x1000):
+            hp.free(jit, hp.alloc(jit, 0x20))
+        self.assertEqual(self.pages(), 1)
+
+    def test_big_alloc(self):
+        jit, hp = self.jit, self.heap
+        small = hp.alloc(jit, 0x10)
+        big = hp.alloc(jit, hp.arena_size)
+        self.assertEqual(self.pages(), 2)
+        jit.vm.set_mem(big + hp.arena_size - 4, "AAAA")
+        # The current arena is still used
+        self.assertEqual(hp.alloc(jit, 0x10), small + 0x10)
+        hp.free(jit, big)
+        self.assertEqual(hp.alloc(jit, hp.arena_size - 0x10), big)
+        self.assertEqual(self.pages(), 2)
+
+    def test_realloc(self):
+        jit, hp = self.jit, self.heap
+        addr = hp.alloc(jit, 0x18)
+        jit.vm.set_mem(addr, "A" * 0x18)
+        # Same size class
+        self.assertEqual(hp.realloc(jit, addr, 0x20), addr)
+        self.assertEqual(jit.vm.get_mem(addr, 0x20), "A" * 0x18 + "\x00" * 8)
+        # Bigger chunk
+        new_addr = hp.realloc(jit, addr, 0x800)
+        self.assertNotEqual(new_addr, addr)
+        self.assertEqual(jit.vm.get_mem(new_addr, 0x20),
+                         "A" * 0x18 + "\x00" * 8)
+        self.assertEqual(hp.get_size(new_addr), 0x800)
+        self.assertIsNone(hp.get_size(addr))
+        # realloc(NULL, size) / realloc(ptr, 0)
+        addr = hp.realloc(jit, 0, 0x10)
+        self.assertEqual(hp.get_size(addr), 0x10)
+        self.assertEqual(hp.realloc(jit, addr, 0), 0)
+        self.assertEqual(hp.leaks(), [(new_addr, 0x800)])
+
+    def test_new_vm(self):
+        hp = self.heap
+        addr = hp.alloc(self.jit, 0x10)
+        other = machine.jitter("python")
+        self.assertFalse(hp.free(other, addr))
+        addr = hp.alloc(other, 0x10)
+        self.assertEqual(other.vm.get_mem(addr, 0x10), "\x00" * 0x10)
+        self.assertEqual(hp.leaks(), [(addr, 0x10)])
+
+    def test_snapshot(self):
+        jit, hp = self.jit, self.heap
+        jit.snapshot()
+        addr = hp.alloc(jit, 0x10)
+        big = hp.alloc(jit, hp.arena_size)
+        hp.free(jit, big)
+        jit.restore_snapshot()
+        self.assertEqual(self.pages(), 0)
+        self.assertEqual(hp.leaks(), [])
+        # Arenas mapped after the snapshot are gone, and mapped again
+        self.assertEqual(hp.alloc(jit, 0x10), addr)
+        self.assertEqual(jit.vm.get_mem(addr, 0x10), "\x00" * 0x10)
+        self.assertEqual(hp.alloc(jit, hp.arena_size - 0x10), big)
+        jit.vm.set_mem(big + hp.arena_size - 0x14, "AAAA")
+        self.assertEqual(self.pages(), 2)
+
+        # Chunk freed after the snapshot: still allocated once restored
+        jit.vm.set_mem(addr, "A" * 0x10)
+        jit.snapshot()
+        hp.free(jit, addr)
+        other = hp.alloc(jit, 0x10)
+        self.assertEqual(other, addr)
+        jit.restore_snapshot()
+        other = hp.alloc(jit, 0x10)
+        self.assertNotEqual(other, addr)
+        self.assertEqual(jit.vm.get_mem(addr, 0x10), "A" * 0x10)
+        self.assertEqual(hp.leaks(), [(addr, 0x10), (other, 0x10),
+                                      (big, hp.arena_size - 0x10)])
+
+        # The snapshot can be restored again
+        jit.restore_snapshot()
+        self.assertEqual(hp.alloc(jit, 0x10), other)
+        self.assertTrue(hp.free(jit, addr))
+        self.assertEqual(self.pages(), 2)
+
+if __name__ == '__main__':
+    testsuite = unittest.TestLoader().loadTestsFromTestCase(TestHeap)
+    report = unittest.TextTestRunner(verbosity=2).run(testsuite)
+    exit(len(report.errors + report.failures))
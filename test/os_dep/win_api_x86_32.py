@@ -72,6 +72,24 @@ class TestWinAPI(unittest.TestCase):
         hMem = jit.cpu.EAX
         self.assertFalse(hMem)
 
+        # void *calloc(size_t num, size_t size);
+        jit.push_uint32_t(4)      # size
+        jit.push_uint32_t(3)      # num
+        jit.push_uint32_t(0)      # @return
+        winapi.msvcrt_calloc(jit)
+        jit.pop_uint32_t()
+        jit.pop_uint32_t()
+        lpMem = jit.cpu.EAX
+        self.assertEqual(jit.vm.get_mem(lpMem, 12), "\x00" * 12)
+        # num * size does not fit in a size_t
+        jit.push_uint32_t(0x10000)  # size
+        jit.push_uint32_t(0x10001)  # num
+        jit.push_uint32_t(0)      # @return
+        winapi.msvcrt_calloc(jit)
+        jit.pop_uint32_t()
+        jit.pop_uint32_t()
+        self.assertFalse(jit.cpu.EAX)
+
     def test_ProcessAndThreadFunctions(self):
 
         # HANDLE WINAPI GetCurrentProcess(void);
@@ -137,6 +155,44 @@ class TestWinAPI(unittest.TestCase):
             if  i: self.assertTrue(vBool)
             else:  self.assertFalse(vBool)
 
+    def test_FunctionArguments(self):
+
+        args_types = []
+        for _ in xrange(2):
+            jit.push_uint32_t(2)      # b
+            jit.push_uint32_t(1)      # a
+            jit.push_uint32_t(0x1337) # @return
+            ret_ad, args = jit.func_args_stdcall(["a", "b"])
+            self.assertEqual(ret_ad, 0x1337)
+            self.assertEqual((args.a, args.b), (1, 2))
+            args_types.append(type(args))
+        jit.push_uint32_t(3)          # a
+        jit.push_uint32_t(0x1337)     # @return
+        ret_ad, args = jit.func_args_stdcall(["a"])
+        self.assertEqual(args.a, 3)
+        args_types.append(type(args))
+        self.assertIs(args_types[0], args_types[1])
+        self.assertIsNot(args_types[0], args_types[2])
+
+    def test_LibHandler(self):
+        from miasm2.jitter.loader.pe import libimp_pe
+
+        libs = libimp_pe()
+        kernel32 = libs.lib_get_add_base("kernel32.dll")
+        addr = libs.lib_get_add_func(kernel32, "GetCurrentProcess")
+        jit.add_lib_handler(libs, winapi.__dict__)
+
+        # HANDLE WINAPI GetCurrentProcess(void);
+        jit.push_uint32_t(0x1337) # @return
+        jit.pc = addr
+        self.assertTrue(jit.handle_lib(jit))
+        self.assertEqual(jit.pc, 0x1337)
+        self.assertTrue(jit.cpu.EAX)
+
+        # Unknown function
+        jit.pc = libs.lib_get_add_func(kernel32, "UnknownFunction")
+        self.assertRaises(ValueError, jit.handle_lib, jit)
+
 
 if __name__ == '__main__':
     testsuite = unittest.TestLoader().loadTestsFromTestCase(TestWinAPI)
@@ -105,6 +105,8 @@ testset += SemanticTestExec("x86_32", "PE", 0x401000, ["bsr_bsf"],
 
 ## Core
 for script in ["interval.py",
+               "asmbloc.py",
+               "bin_stream.py",
                "graph.py",
                "parse_asm.py",
                "utils.py",
@@ -132,9 +134,19 @@ testset += RegressionTest(["analysis.py"], base_dir="ir",
 testset += RegressionTest(["z3_ir.py"], base_dir="ir/translators",
                           tags=[TAGS["z3"]])
 ## OS_DEP
-for script in ["win_api_x86_32.py",
+for script in ["common.py",
+               "win_api_x86_32.py",
                ]:
     testset += RegressionTest([script], base_dir="os_dep")
+## Jitter
+for script in ["jitcpu.py",
+               "vm_mngr.py",
+               "vm_snapshot.py",
+               "trace.py",
+               "coverage.py",
+               "budget.py",
+               ]:
+    testset += RegressionTest([script], base_dir="jitter")
 
 ## Analysis
 testset += RegressionTest(["depgraph.py"], base_dir="analysis",
@@ -153,6 +165,8 @@ testset += RegressionTest(["depgraph.py"], base_dir="analysis",
                                                         (12, 1), (13, 1),
                                                         (14, 1), (15, 1)))
                            for fname in fnames])
+testset += RegressionTest(["batch.py"], base_dir="analysis")
+testset += RegressionTest(["gdbserver.py"], base_dir="analysis")
 
 # Examples
 class Example(Test):